@@ -0,0 +1,354 @@
+import asyncio
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views import View
+from rest_framework import exceptions, permissions, status
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import cache as catalog_cache
+from . import events
+from . import hashing
+from . import routers
+from . import search
+from .authentication import ROLE_CLAIM, RoleJWTAuthentication, RoleTokenUser, add_role_claims
+from .filters import InvalidFilter, filter_orders
+from .models import Book, Order, User, UserRole
+from .pagination import BookPagination, BookSearchPagination, OrderPagination
+from .permissions import RoleBasedPermission
+from .serializers import BookSerializer, OrderSerializer, UserCreateSerializer, UserSerializer
+
+
+class AsyncAPIView(View):
+    """
+    Minimal JSON view whose handlers run natively on the event loop under
+    ASGI. Like DRF's APIView it is exempt from CSRF, since clients
+    authenticate with bearer tokens rather than cookies.
+    """
+    http_method_names = ['get', 'post', 'options']
+    authenticator = RoleJWTAuthentication()
+    permission_classes = []
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def initial(self, request):
+        """
+        Authenticate the bearer token and run the permission checks. Returns an
+        error response, or None when the request may proceed. Role-carrying
+        tokens are checked without touching the database.
+        """
+        request.query_params = request.GET
+        if not self.permission_classes:
+            return None
+
+        try:
+            request.user = await self.authenticate(request)
+        except exceptions.APIException as exc:
+            data = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+            return JsonResponse(data, status=status.HTTP_401_UNAUTHORIZED)
+
+        for permission in self.permission_classes:
+            if not permission.has_permission(request, self):
+                if not request.user.is_authenticated:
+                    return self.error("Authentication credentials were not provided.", status.HTTP_401_UNAUTHORIZED)
+                return self.error("You do not have permission to perform this action.", status.HTTP_403_FORBIDDEN)
+        return None
+
+    async def authenticate(self, request):
+        header = self.authenticator.get_header(request)
+        raw_token = self.authenticator.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            # Bearer tokens only: the session user from the middleware would
+            # need a synchronous database lookup.
+            return AnonymousUser()
+        token = self.authenticator.get_validated_token(raw_token)
+        if ROLE_CLAIM in token and jwt_settings.USER_ID_CLAIM in token:
+            user = RoleTokenUser(token)
+            await routers.aset_user(user.id)
+            return user
+        return await sync_to_async(self.authenticator.get_user)(token)
+
+    def parse_json(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def error(self, detail, status_code, **headers):
+        return JsonResponse({"detail": detail}, status=status_code, headers=headers or None)
+
+    def overloaded(self):
+        return self.error("Server busy, please retry", status.HTTP_503_SERVICE_UNAVAILABLE, **{'Retry-After': '1'})
+
+
+class AsyncLoginView(AsyncAPIView):
+    async def post(self, request):
+        data = self.parse_json(request)
+        if data is None:
+            return self.error("Invalid JSON body", status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = await hashing.aauthenticate(request, data.get('username'), data.get('password') or '')
+        except hashing.PoolSaturated:
+            return self.overloaded()
+        if user is None:
+            return self.error("Incorrect username or password", status.HTTP_401_UNAUTHORIZED)
+
+        refresh = add_role_claims(RefreshToken.for_user(user), user)
+        return JsonResponse({
+            "refresh": str(refresh),
+            "access": str(refresh.access_token),
+            "token_type": "bearer"
+        })
+
+
+class AsyncRegisterView(AsyncAPIView):
+    async def post(self, request):
+        data = self.parse_json(request)
+        if data is None:
+            return self.error("Invalid JSON body", status.HTTP_400_BAD_REQUEST)
+
+        serializer = UserCreateSerializer(data=data)
+        # Validation checks username uniqueness against the database.
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        validated = serializer.validated_data
+        try:
+            future = hashing.submit_make_password(validated['password'])
+        except hashing.PoolSaturated:
+            return self.overloaded()
+        user = User(username=validated['username'], role=validated['role'], password=await asyncio.wrap_future(future))
+        await user.asave()
+        return JsonResponse(UserSerializer(user).data, status=status.HTTP_201_CREATED)
+
+
+class AsyncBookListView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated()]
+
+    async def get(self, request):
+        denied = await self.initial(request)
+        if denied is not None:
+            return denied
+
+        version = await catalog_cache.aget_catalog_version()
+        etag = catalog_cache.make_etag(version, request)
+        if catalog_cache.etag_matches(etag, request):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = await catalog_cache.aget_page(version, request)
+        if data is None:
+            paginator = BookPagination()
+            # Pages are cached under the catalog version, so fill them from the
+            # primary: a lagging replica would pin a stale page to a new version.
+            try:
+                books = await paginator.apaginate_queryset(Book.objects.using(router.db_for_write(Book)), request, view=self)
+            except exceptions.NotFound as exc:
+                return self.error(exc.detail, status.HTTP_404_NOT_FOUND)
+            data = paginator.get_paginated_data(BookSerializer(books, many=True).data)
+            await catalog_cache.aset_page(version, request, data)
+
+        response = JsonResponse(data, headers={'ETag': etag})
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class AsyncBookSearchView(AsyncAPIView):
+    permission_classes = [permissions.IsAuthenticated()]
+
+    async def get(self, request):
+        denied = await self.initial(request)
+        if denied is not None:
+            return denied
+
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return self.error("Query parameter 'q' is required", status.HTTP_400_BAD_REQUEST)
+        if not search.is_available():
+            return self.error("Search is not available", status.HTTP_501_NOT_IMPLEMENTED)
+
+        paginator = BookSearchPagination()
+        try:
+            # FTS5 is queried through a raw cursor, which has no async API.
+            books = await sync_to_async(paginator.paginate_search)(query, request)
+        except exceptions.NotFound as exc:
+            return self.error(exc.detail, status.HTTP_404_NOT_FOUND)
+        return JsonResponse(paginator.get_paginated_data(BookSerializer(books, many=True).data))
+
+
+class AsyncOrderPageView(AsyncAPIView):
+    filter_fields = ('status', 'user', 'book')
+
+    def get_queryset(self, request):
+        return Order.objects.all()
+
+    async def get(self, request):
+        denied = await self.initial(request)
+        if denied is not None:
+            return denied
+
+        try:
+            orders = filter_orders(self.get_queryset(request), request.query_params, fields=self.filter_fields)
+        except InvalidFilter as exc:
+            return self.error(str(exc), status.HTTP_400_BAD_REQUEST)
+
+        paginator = OrderPagination()
+        try:
+            page = await paginator.apaginate_queryset(orders, request, view=self)
+        except exceptions.NotFound as exc:
+            return self.error(exc.detail, status.HTTP_404_NOT_FOUND)
+        return JsonResponse(paginator.get_paginated_data(OrderSerializer(page, many=True).data))
+
+
+class AsyncOrderListView(AsyncOrderPageView):
+    permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]
+
+
+class AsyncMyOrdersView(AsyncOrderPageView):
+    permission_classes = [permissions.IsAuthenticated()]
+    filter_fields = ('status', 'book')
+
+    def get_queryset(self, request):
+        return Order.objects.filter(user_id=request.user.id)
+
+
+class AsyncBookStockView(AsyncAPIView):
+    """
+    Shared setup for the availability feeds. Subscribers wait on the
+    process's event loop, so both feeds need the ASGI server.
+    """
+    permission_classes = [permissions.IsAuthenticated()]
+
+    async def subscribe(self, request):
+        """Returns ``(books, error response)``; ``books`` is a set of ids, or None for every book."""
+        denied = await self.initial(request)
+        if denied is not None:
+            return None, denied
+        if not isinstance(request, ASGIRequest):
+            return None, self.error("Book events need the ASGI server", status.HTTP_501_NOT_IMPLEMENTED)
+
+        value = request.query_params.get('books')
+        if not value:
+            return None, None
+        ids = value.split(',')
+        if not all(book_id.isdigit() for book_id in ids):
+            return None, self.error("Invalid book IDs", status.HTTP_400_BAD_REQUEST)
+        return frozenset(int(book_id) for book_id in ids), None
+
+
+def server_sent_event(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id else []
+    lines += [f'event: {event}', f'data: {json.dumps(data)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+class AsyncBookStreamView(AsyncBookStockView):
+    """
+    Server-sent events: ``stock`` with ``{"book", "quantity"}`` on every
+    change (plus ``"removed": true`` when a book is deleted), and ``resync``
+    when the client has to refetch the catalog. A reconnecting client sends
+    ``Last-Event-ID`` and gets what it missed.
+    """
+
+    async def get(self, request):
+        books, denied = await self.subscribe(request)
+        if denied is not None:
+            return denied
+        response = StreamingHttpResponse(
+            self.stream(books, request.headers.get('Last-Event-ID')), content_type='text/event-stream'
+        )
+        patch_cache_control(response, no_cache=True)
+        # Keep nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, books, last_event_id):
+        hub = events.hub
+        subscription = hub.subscribe(books)
+        try:
+            # Streams end after BOOK_EVENTS_MAX_AGE; browsers reconnect on their own.
+            yield 'retry: 1000\n\n'
+            backlog = hub.replay(last_event_id, books) if last_event_id else []
+            if backlog is None:
+                yield server_sent_event('resync', {}, hub.last_event_id)
+                backlog = []
+            last = 0
+            for sequence, event in backlog:
+                yield server_sent_event('stock', event, f'{hub.epoch}-{sequence}')
+                last = sequence
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + getattr(settings, 'BOOK_EVENTS_MAX_AGE', 300)
+            heartbeat = getattr(settings, 'BOOK_EVENTS_HEARTBEAT', 15)
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                if item is events.RESYNC:
+                    yield server_sent_event('resync', {}, hub.last_event_id)
+                    continue
+                sequence, event = item
+                if sequence > last:
+                    yield server_sent_event('stock', event, f'{hub.epoch}-{sequence}')
+                    last = sequence
+        finally:
+            hub.unsubscribe(subscription)
+
+
+class AsyncBookChangesView(AsyncBookStockView):
+    """
+    Long-poll counterpart of the stream for clients without SSE: answers as
+    soon as there are changes after ``since``, or empty after ``timeout``
+    seconds. Pass the returned ``last_event_id`` as the next ``since``.
+    """
+    max_timeout = 60
+
+    async def get(self, request):
+        books, denied = await self.subscribe(request)
+        if denied is not None:
+            return denied
+        try:
+            timeout = float(request.query_params.get('timeout', 25))
+        except ValueError:
+            return self.error("Invalid timeout", status.HTTP_400_BAD_REQUEST)
+        # float() accepts 'nan' and 'inf'; min() would pass nan straight through.
+        if not math.isfinite(timeout):
+            return self.error("Invalid timeout", status.HTTP_400_BAD_REQUEST)
+        timeout = min(timeout, self.max_timeout)
+
+        hub = events.hub
+        since = request.query_params.get('since')
+        subscription = hub.subscribe(books)
+        try:
+            items = hub.replay(since, books) if since else []
+            if items == []:
+                try:
+                    items = [await asyncio.wait_for(subscription.queue.get(), max(timeout, 0))]
+                except asyncio.TimeoutError:
+                    pass
+            while items is not None and not subscription.queue.empty():
+                items.append(subscription.queue.get_nowait())
+        finally:
+            hub.unsubscribe(subscription)
+
+        if items is None or events.RESYNC in items:
+            return JsonResponse({'resync': True, 'last_event_id': hub.last_event_id, 'events': []})
+        changes = {}
+        for _, event in items:
+            changes[event['book']] = event
+        return JsonResponse({'resync': False, 'last_event_id': hub.last_event_id, 'events': list(changes.values())})
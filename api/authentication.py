@@ -0,0 +1,56 @@
+from django.utils.functional import cached_property
+from rest_framework import exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from . import routers
+from .models import User
+
+ROLE_CLAIM = 'role'
+
+
+def add_role_claims(token, user):
+    """Embed what permission checks need so requests can skip the user lookup."""
+    token[ROLE_CLAIM] = user.role
+    token['username'] = user.username
+    return token
+
+
+class RoleTokenUser(TokenUser):
+    """Stateless user built from the token's id and role claims."""
+
+    @cached_property
+    def role(self):
+        return self.token[ROLE_CLAIM]
+
+
+class RoleJWTAuthentication(JWTAuthentication):
+    """
+    Authenticate from the token alone when it carries a role claim. Tokens
+    issued before role claims existed fall back to the database lookup.
+    """
+
+    def get_user(self, validated_token):
+        if ROLE_CLAIM in validated_token and api_settings.USER_ID_CLAIM in validated_token:
+            user = RoleTokenUser(validated_token)
+        else:
+            user = super().get_user(validated_token)
+        routers.set_user(user.id)
+        return user
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Reload the user on refresh and stamp the current role on the new access
+    token, so a demotion or deactivation takes effect when the access token
+    expires rather than when the refresh token does.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(id=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed("User is inactive or deleted", code='user_inactive')
+        return super().validate({**attrs, 'refresh': str(add_role_claims(refresh, user))})
@@ -0,0 +1,37 @@
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+
+# Applied to every new connection. WAL lets readers run alongside the single
+# writer, NORMAL sync is durable across application crashes in WAL mode, and
+# busy_timeout makes writers queue for the lock instead of failing at once.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(SQLiteDatabaseWrapper):
+    """
+    SQLite with per-connection pragmas (``OPTIONS['pragmas']`` overrides
+    :data:`DEFAULT_PRAGMAS`) and opt-in ``BEGIN IMMEDIATE`` transactions,
+    see :func:`api.db.write_transaction`.
+    """
+    begin_immediate = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
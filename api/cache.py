@@ -0,0 +1,89 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+
+
+def get_catalog_version():
+    cache = get_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a version evicted from the cache can never
+        # come back with a value that old pages were stored under.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+async def aget_catalog_version():
+    cache = get_cache()
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache = get_cache()
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def catalog_changed():
+    """Invalidate every cached catalog page once the current transaction commits."""
+    transaction.on_commit(bump_catalog_version)
+
+
+def response_format(request):
+    # Plain Django (async) views always answer JSON.
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer.format if renderer is not None else 'json'
+
+
+def make_etag(version, request):
+    return f'"{version}-{response_format(request)}"'
+
+
+def etag_matches(etag, request):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def page_key(version, request):
+    digest = hashlib.sha1(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return f'catalog:{version}:{response_format(request)}:{digest}'
+
+
+def get_page(version, request):
+    return get_cache().get(page_key(version, request))
+
+
+def set_page(version, request, data):
+    get_cache().set(page_key(version, request), data, get_timeout())
+
+
+async def aget_page(version, request):
+    return await get_cache().aget(page_key(version, request))
+
+
+async def aset_page(version, request, data):
+    await get_cache().aset(page_key(version, request), data, get_timeout())
@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    ``transaction.atomic()`` for short read-then-write paths. On SQLite the
+    outermost block starts with BEGIN IMMEDIATE, taking the write lock before
+    the first read: a deferred transaction that has to upgrade its read lock
+    gets ``database is locked`` straight away instead of waiting out
+    busy_timeout. Nested blocks and other databases behave like ``atomic()``.
+    """
+    connection = transaction.get_connection(using)
+    outermost = not connection.in_atomic_block
+    if outermost:
+        connection.begin_immediate = True
+    try:
+        with transaction.atomic(using=using):
+            connection.begin_immediate = False
+            yield
+    finally:
+        if outermost:
+            connection.begin_immediate = False
@@ -0,0 +1,245 @@
+"""
+Book availability events for the streaming endpoints.
+
+Write paths call :func:`stock_changed` inside their transaction. Once it
+commits, the new quantities are read in one query and handed to the
+configured broker. Every ASGI process has a single :data:`hub` that receives
+them from the broker and fans them out to its subscribers' queues. Idle
+subscribers cost one asyncio queue each, and delivery goes only to
+subscribers watching the changed book.
+"""
+import asyncio
+import json
+import logging
+import secrets
+import threading
+from collections import defaultdict, deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import router, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER = {'BACKEND': 'api.events.InMemoryBroker'}
+# Queued for a subscriber that fell too far behind: it must refetch.
+RESYNC = object()
+
+
+class Subscription:
+    def __init__(self, books, queue_size):
+        self.books = books
+        self.queue = asyncio.Queue(queue_size)
+
+
+class Hub:
+    """
+    Per-process fan-out of ``{"book": id, "quantity": n}`` events, with
+    ``"removed": true`` added once a book is deleted. Each event
+    gets an id of the form ``<epoch>-<sequence>``. The latest events are kept
+    so a client that reconnects with the id it saw last can catch up; ids from
+    another process or from before the backlog mean the client must resync.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self.sequence = 0
+        self.recent = deque(maxlen=getattr(settings, 'BOOK_EVENTS_BACKLOG', 1000))
+        self.latest = {}
+        self.everything = set()
+        self.by_book = defaultdict(set)
+        self.loop = None
+        self.listener = None
+
+    @property
+    def last_event_id(self):
+        return f'{self.epoch}-{self.sequence}'
+
+    def subscribe(self, books=None):
+        """Watch ``books`` (every book when None). Call from the event loop."""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.listener = loop.create_task(get_broker().listen(self))
+
+        subscription = Subscription(books, getattr(settings, 'BOOK_EVENTS_QUEUE_SIZE', 100))
+        if books is None:
+            self.everything.add(subscription)
+        for book_id in books or ():
+            self.by_book[book_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.everything.discard(subscription)
+        for book_id in subscription.books or ():
+            watchers = self.by_book.get(book_id)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self.by_book[book_id]
+
+    def dispatch(self, events):
+        """Number and deliver ``events``; runs on the event loop."""
+        for event in events:
+            book_id = event['book']
+            # Several paths can report one commit; pass on real changes only.
+            if self.latest.get(book_id) == event:
+                continue
+            self.latest[book_id] = event
+            self.sequence += 1
+            item = (self.sequence, event)
+            self.recent.append(item)
+            for subscription in self.everything | self.by_book.get(book_id, set()):
+                self.deliver(subscription, item)
+
+    def deliver(self, subscription, item):
+        try:
+            subscription.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.queue.put_nowait(RESYNC)
+
+    def dispatch_threadsafe(self, events):
+        """Hand ``events`` to the loop from any thread; dropped while nobody has subscribed."""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.dispatch(events)
+        else:
+            loop.call_soon_threadsafe(self.dispatch, events)
+
+    def replay(self, last_event_id, books=None):
+        """
+        Events after ``last_event_id`` for ``books``, oldest first, or None
+        when they can no longer be told apart from a gap.
+        """
+        epoch, _, sequence = (last_event_id or '').partition('-')
+        if epoch != self.epoch or not sequence.isdigit() or int(sequence) > self.sequence:
+            return None
+        after = int(sequence)
+        if after < self.sequence and (not self.recent or self.recent[0][0] > after + 1):
+            return None
+        return [
+            (seq, event) for seq, event in self.recent
+            if seq > after and (books is None or event['book'] in books)
+        ]
+
+
+class InMemoryBroker:
+    """Delivers to subscribers of the publishing process only: tests and single-process servers."""
+
+    def __init__(self, **options):
+        pass
+
+    def has_listeners(self):
+        return bool(hub.everything or hub.by_book)
+
+    def publish(self, events):
+        hub.dispatch_threadsafe(events)
+
+    async def listen(self, hub):
+        pass
+
+
+class RedisBroker:
+    """
+    Fans events out over a Redis channel, so every ASGI process sees changes
+    made by any web process or Celery worker.
+    """
+
+    def __init__(self, LOCATION, CHANNEL='library:book-events', **options):
+        self.location = LOCATION
+        self.channel = CHANNEL
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import redis
+
+                    self._client = redis.Redis.from_url(self.location)
+        return self._client
+
+    def has_listeners(self):
+        # Subscribers may be in any process.
+        return True
+
+    def publish(self, events):
+        self.get_client().publish(self.channel, json.dumps(events))
+
+    async def listen(self, hub):
+        import redis.asyncio
+
+        client = redis.asyncio.from_url(self.location)
+        while True:
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Changes may have been missed while disconnected.
+                    hub.latest.clear()
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            hub.dispatch(json.loads(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lost the book events channel; resubscribing.")
+                await asyncio.sleep(1)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    options = dict(getattr(settings, 'BOOK_EVENTS', DEFAULT_BROKER))
+    return import_string(options.pop('BACKEND'))(**options)
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    if setting == 'BOOK_EVENTS':
+        get_broker.cache_clear()
+
+
+hub = Hub()
+
+
+def publish_stock(book_ids):
+    """
+    Publish the current quantity of ``book_ids``; books that no longer exist
+    are published as removed. Never raises: the write has already committed.
+    """
+    try:
+        broker = get_broker()
+        if not broker.has_listeners():
+            return
+        book_ids = list(dict.fromkeys(book_ids))
+        quantities = dict(
+            Book.objects.using(router.db_for_write(Book)).filter(id__in=book_ids).values_list('id', 'quantity')
+        )
+        events = [
+            {'book': book_id, 'quantity': quantities[book_id]} if book_id in quantities
+            else {'book': book_id, 'quantity': 0, 'removed': True}
+            for book_id in book_ids
+        ]
+        if events:
+            broker.publish(events)
+    except Exception:
+        logger.exception("Could not publish stock changes for %d books.", len(book_ids))
+
+
+def stock_changed(book_ids):
+    """Publish the quantities of ``book_ids`` once the current transaction commits."""
+    book_ids = list(book_ids)
+    transaction.on_commit(lambda: publish_stock(book_ids))
@@ -0,0 +1,45 @@
+from .models import OrderStatus
+
+
+class InvalidFilter(ValueError):
+    """Carries the ``detail`` message for a 400 response."""
+
+
+def filter_orders(orders, params, fields=('status', 'user', 'book')):
+    """
+    Apply the ``?status=``, ``?user=`` and ``?book=`` query filters shared by
+    the order views. ``status`` takes a comma-separated list.
+    """
+    if 'status' in fields:
+        order_status = params.get('status')
+        if order_status:
+            statuses = order_status.split(',')
+            if any(value not in OrderStatus.values for value in statuses):
+                raise InvalidFilter("Invalid status")
+            if len(statuses) == 1:
+                orders = orders.filter(status=statuses[0])
+            else:
+                orders = orders.filter(status__in=statuses)
+
+    for field in ('user', 'book'):
+        if field not in fields:
+            continue
+        value = params.get(field)
+        if value:
+            # isdigit() would pass '²', which int() then rejects.
+            if not value.isdecimal():
+                raise InvalidFilter(f"Invalid {field} ID")
+            orders = orders.filter(**{f'{field}_id': int(value)})
+    return orders
+
+
+def parse_field_list(params, name, allowed):
+    """Parse a comma-separated ``?fields=``/``?expand=`` list; None when the parameter is absent."""
+    value = params.get(name)
+    if value is None:
+        return None
+    names = [item for item in value.split(',') if item]
+    for item in names:
+        if item not in allowed:
+            raise InvalidFilter(f"Unknown {name} '{item}'")
+    return names
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import BCryptSHA256PasswordHasher as BaseBCryptSHA256PasswordHasher
+
+
+class BCryptSHA256PasswordHasher(BaseBCryptSHA256PasswordHasher):
+    """
+    bcrypt with the work factor taken from ``PASSWORD_BCRYPT_ROUNDS``. Django
+    rehashes a stored password on the next successful login whenever its
+    rounds differ from this value.
+    """
+
+    @property
+    def rounds(self):
+        return getattr(settings, 'PASSWORD_BCRYPT_ROUNDS', 12)
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import hashers
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_login_failed
+from django.core.exceptions import PermissionDenied
+
+from .models import User
+
+
+class PoolSaturated(Exception):
+    """Raised instead of queueing when every worker and queue slot is taken."""
+
+
+class HashingPool:
+    """
+    Thread pool for password hashing with a bounded queue. bcrypt and PBKDF2
+    release the GIL, so threads give real parallelism here, and refusing work
+    past the bound keeps a login burst from tying up every request worker.
+    """
+
+    def __init__(self, workers, queue_size):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise PoolSaturated()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_QUEUE_SIZE)
+    return _pool
+
+
+def _verify(user, password):
+    """
+    Check ``password`` against ``user``; returns ``(valid, upgraded)``. When the
+    stored hash uses an outdated hasher or cost, ``user.password`` is replaced
+    with a fresh hash and ``upgraded`` is True; the caller saves it.
+    """
+    if user is None:
+        # Hash anyway so unknown usernames take as long as wrong passwords.
+        hashers.make_password(password)
+        return False, False
+
+    upgraded = []
+
+    def setter(raw_password):
+        user.password = hashers.make_password(raw_password)
+        upgraded.append(True)
+
+    valid = hashers.check_password(password, user.password, setter)
+    return valid, bool(upgraded)
+
+
+def submit_verify(user, password):
+    return get_pool().submit(_verify, user, password)
+
+
+def submit_make_password(password):
+    return get_pool().submit(hashers.make_password, password)
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ``ModelBackend`` that checks the password on the hashing pool, so logins
+    still go through ``django.contrib.auth.authenticate``: the configured
+    backends, the ``is_active`` check and ``user_login_failed`` all apply.
+    Raises :class:`PoolSaturated` when the pool is full.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = User._default_manager.filter(**{User.USERNAME_FIELD: username}).first()
+        valid, upgraded = submit_verify(user, password).result()
+        if not valid:
+            return None
+        if upgraded:
+            user.save(update_fields=['password'])
+        return user if self.user_can_authenticate(user) else None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        """Like :meth:`authenticate`, awaiting the hash instead of blocking."""
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = await User._default_manager.filter(**{User.USERNAME_FIELD: username}).afirst()
+        valid, upgraded = await asyncio.wrap_future(submit_verify(user, password))
+        if not valid:
+            return None
+        if upgraded:
+            await user.asave(update_fields=['password'])
+        return user if self.user_can_authenticate(user) else None
+
+
+def authenticate(request, username, password):
+    """
+    ``django.contrib.auth.authenticate`` with the hash run on the pool by
+    :class:`PooledModelBackend`. The calling thread still waits for the hash:
+    under WSGI the pool bounds concurrent hashing and sheds bursts with
+    :class:`PoolSaturated`, but adds no throughput, since each login holds
+    its worker until the hash is done. Raises :class:`PoolSaturated`.
+    """
+    return auth.authenticate(request, username=username, password=password)
+
+
+async def aauthenticate(request, username, password):
+    """
+    Async :func:`authenticate`, after Django 5.0's ``auth.aauthenticate``:
+    backends with an ``aauthenticate`` method, like
+    :class:`PooledModelBackend`, free the worker while the hash runs; other
+    backends run through ``sync_to_async``. Raises :class:`PoolSaturated`.
+    """
+    credentials = {'username': username, 'password': password}
+    for backend, backend_path in auth._get_backends(return_tuples=True):
+        try:
+            if hasattr(backend, 'aauthenticate'):
+                user = await backend.aauthenticate(request, **credentials)
+            else:
+                user = await sync_to_async(backend.authenticate)(request, **credentials)
+        except PermissionDenied:
+            break
+        if user is None:
+            continue
+        user.backend = backend_path
+        return user
+
+    await sync_to_async(user_login_failed.send)(
+        sender=auth.__name__, credentials=auth._clean_credentials(credentials), request=request
+    )
+    return None
+
+
+def make_password(password):
+    """Hash on the pool, waiting for the result; raises :class:`PoolSaturated`."""
+    return submit_make_password(password).result()
@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+from . import waitlist
+from .cache import catalog_changed
+from .db import write_transaction
+from .models import Book
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_FORMATS = ('csv', 'jsonl')
+UPDATE_FIELDS = ['quantity', 'daily_price']
+# Raw inserts bypass model defaults, so every column is written explicitly.
+INSERT_FIELDS = [field.attname for field in Book._meta.concrete_fields if not field.primary_key]
+DEFAULTS = {
+    field.attname: field.to_python(field.get_default())
+    for field in Book._meta.concrete_fields if not field.primary_key
+}
+
+TITLE_MAX_LENGTH = Book._meta.get_field('title').max_length
+AUTHOR_MAX_LENGTH = Book._meta.get_field('author').max_length
+QUANTITY_FIELD = Book._meta.get_field('quantity')
+PRICE_FIELD = Book._meta.get_field('daily_price')
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': len(self.errors),
+            'errors': self.errors,
+        }
+
+
+def detect_format(name):
+    if name and name.lower().endswith('.csv'):
+        return 'csv'
+    return 'jsonl'
+
+
+def read_rows(stream, input_format):
+    """Yield ``(line_number, row)`` from a binary stream without loading it whole."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if input_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row
+
+
+def clean_row(row):
+    """Validate one row; returns ``(values, errors)``."""
+    if not isinstance(row, dict):
+        return None, {'row': ['Expected an object']}
+
+    errors = {}
+    title = str(row.get('title') or '').strip()
+    author = str(row.get('author') or '').strip()
+    if not title:
+        errors['title'] = ['This field is required.']
+    elif len(title) > TITLE_MAX_LENGTH:
+        errors['title'] = [f'Ensure this field has no more than {TITLE_MAX_LENGTH} characters.']
+    if not author:
+        errors['author'] = ['This field is required.']
+    elif len(author) > AUTHOR_MAX_LENGTH:
+        errors['author'] = [f'Ensure this field has no more than {AUTHOR_MAX_LENGTH} characters.']
+
+    values = {'title': title, 'author': author}
+
+    # Optional columns left empty keep the model default on insert and the
+    # stored value on update.
+    # The raw INSERT skips model validation, so the column limits
+    # (integer range, max_digits, decimal_places) are checked here.
+    quantity = row.get('quantity')
+    if quantity not in (None, ''):
+        try:
+            values['quantity'] = int(quantity)
+            if values['quantity'] < 0:
+                raise ValueError
+            QUANTITY_FIELD.run_validators(values['quantity'])
+        except (TypeError, ValueError):
+            errors['quantity'] = ['A valid non-negative integer is required.']
+        except ValidationError as exc:
+            errors['quantity'] = exc.messages
+
+    daily_price = row.get('daily_price')
+    if daily_price not in (None, ''):
+        try:
+            price = Decimal(str(daily_price))
+            if not price.is_finite() or price < 0:
+                raise InvalidOperation
+            PRICE_FIELD.run_validators(price)
+            values['daily_price'] = price.quantize(Decimal('0.01'))
+        except (InvalidOperation, ValueError):
+            errors['daily_price'] = ['A valid non-negative number is required.']
+        except ValidationError as exc:
+            errors['daily_price'] = exc.messages
+
+    if errors:
+        return None, errors
+    return values, None
+
+
+def upsert_sql():
+    """
+    INSERT keyed on the (title, author) unique constraint. On a conflict,
+    columns the row left empty keep their stored value.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field) for field in INSERT_FIELDS)
+    placeholders = ', '.join(['%s'] * len(INSERT_FIELDS))
+    assignments = ', '.join(f'{quote(field)} = COALESCE(%s, {quote(field)})' for field in UPDATE_FIELDS)
+    return (
+        f'INSERT INTO {quote(Book._meta.db_table)} ({columns}) VALUES ({placeholders}) '
+        f'ON CONFLICT ({quote("title")}, {quote("author")}) DO UPDATE SET {assignments}'
+    )
+
+
+def existing_books(keys):
+    """``{(title, author): (id, quantity)}`` for the pairs among ``keys`` already in the catalog."""
+    books = Book.objects.filter(title__in={title for title, _ in keys}).values_list('title', 'author', 'id', 'quantity')
+    return {(title, author): (book_id, quantity) for title, author, book_id, quantity in books if (title, author) in keys}
+
+
+def upsert_batch(rows, report):
+    """Insert or update one batch of cleaned rows keyed by (title, author)."""
+    by_key = {}
+    for values in rows:
+        by_key[(values['title'], values['author'])] = values
+
+    # BEGIN IMMEDIATE: the batch reads before it writes, and concurrent
+    # imports would otherwise fail to upgrade their read lock.
+    with write_transaction():
+        # Sorts the report into created and updated and finds restocked
+        # books; the upsert itself relies on the unique constraint, so
+        # concurrent imports cannot duplicate a book.
+        existing = existing_books(by_key)
+        params = [
+            [values.get(field, DEFAULTS.get(field)) for field in INSERT_FIELDS]
+            + [values.get(field) for field in UPDATE_FIELDS]
+            for values in by_key.values()
+        ]
+        # One prepared statement run per row skips the per-instance ORM work
+        # of bulk_create() and the CASE WHEN chain bulk_update() builds.
+        with connection.cursor() as cursor:
+            cursor.executemany(upsert_sql(), params)
+
+        # New books have no waiters, so only raised quantities can be handed out.
+        before = dict(existing.values())
+        after = Book.objects.filter(id__in=before).values_list('id', 'quantity')
+        added = {book_id: quantity - before[book_id] for book_id, quantity in after if quantity > before[book_id]}
+        waitlist.allocate(added)
+
+    report.created += len(by_key) - len(existing)
+    report.updated += len(existing)
+
+
+def import_books(stream, input_format, batch_size=IMPORT_BATCH_SIZE):
+    """Stream rows from ``stream`` into the catalog in batches and return an :class:`ImportReport`."""
+    report = ImportReport()
+    rows = read_rows(stream, input_format)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        valid = []
+        for line_number, row in chunk:
+            values, errors = clean_row(row)
+            if errors:
+                report.errors.append({'line': line_number, 'errors': errors})
+            else:
+                valid.append(values)
+        if valid:
+            upsert_batch(valid, report)
+
+    if report.created or report.updated:
+        catalog_changed()
+    return report
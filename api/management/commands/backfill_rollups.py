@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api.rollups import backfill
+
+
+def parse_day(value):
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD.")
+    return day
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily circulation rollups from the raw order table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='First day to rebuild (YYYY-MM-DD, default: all history)')
+        parser.add_argument('--to', dest='end', help='Last day to rebuild (YYYY-MM-DD, default: all history)')
+
+    def handle(self, *args, **options):
+        rows = backfill(parse_day(options['start']), parse_day(options['end']))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} rollup rows."))
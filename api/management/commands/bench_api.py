@@ -0,0 +1,465 @@
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api import hashing, metrics, rollups, stats
+from api.authentication import add_role_claims
+from api.models import Book, Order, OrderStatus, User, UserRole
+
+WORDS = (
+    'river', 'shadow', 'garden', 'empire', 'winter', 'silver', 'ocean', 'forest', 'machine', 'letter',
+    'night', 'city', 'stone', 'island', 'mirror', 'harvest', 'storm', 'glass', 'signal', 'journey',
+)
+SURNAMES = ('Karimova', 'Smith', 'Ito', 'Novak', 'Okafor', 'Garcia', 'Larsen', 'Rahimov', 'Chen', 'Dubois')
+
+# Weighted operation mixes; an operation may issue several requests.
+SCENARIOS = {
+    'browse': {
+        'books': 40, 'books_sorted': 10, 'search': 20, 'books_async': 10, 'search_async': 5,
+        'my_orders': 10, 'my_orders_async': 10, 'waitlist': 5, 'refresh': 5,
+    },
+    'circulation': {'loan_step': 1},
+    'staff': {
+        'book_create': 10, 'book_update': 15, 'book_delete': 5, 'import': 5, 'order_list': 20,
+        'order_list_async': 10, 'export': 5, 'report_circulation': 10, 'report_top_books': 10, 'batch': 10,
+    },
+    'accounts': {'login': 45, 'login_async': 15, 'register': 30, 'register_async': 10},
+    'docs': {'schema': 1},
+    'mixed': {
+        'books': 30, 'search': 10, 'my_orders_async': 10, 'loan_step': 30, 'order_list': 10, 'book_update': 5, 'batch': 5,
+    },
+}
+
+BENCH_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'},
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Session:
+    """One simulated client: a library user, plus a staff login for the operator side of its flows."""
+
+    def __init__(self, bench, user, staff, seed):
+        self.bench = bench
+        self.rng = random.Random(seed)
+        self.user = user
+        self.client = self.authorized(user)
+        self.staff = self.authorized(staff)
+        self.refresh = str(RefreshToken.for_user(user))
+        self.recording = False
+        self.loan = None
+        self.loan_step = 0
+        self.created_books = []
+
+    def authorized(self, user):
+        client = APIClient(raise_request_exception=False)
+        token = add_role_claims(RefreshToken.for_user(user), user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def request(self, client, method, route, path, data=None, format='json'):
+        started = time.perf_counter()
+        response = getattr(client, method.lower())(path, data, format=format)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+        if self.recording:
+            self.bench.record(f'{method} {route}', elapsed, response.status_code)
+        return response
+
+    def get(self, route, query='', client=None, **kwargs):
+        return self.request(client or self.client, 'GET', route, reverse(route, kwargs=kwargs or None) + query)
+
+    def post(self, route, data=None, client=None, format='json', **kwargs):
+        return self.request(client or self.staff, 'POST', route, reverse(route, kwargs=kwargs or None), data, format)
+
+    def book_id(self):
+        return self.rng.choice(self.bench.book_ids)
+
+    def reserve(self):
+        response = self.post('order_create', {'book_id': self.book_id()}, client=self.client)
+        return response.json()['id'] if response.status_code == 201 else None
+
+    # Browse: catalog reads by any signed-in user.
+
+    def op_books(self):
+        self.get('book_list_create', f'?page_size={self.rng.choice((20, 50))}')
+
+    def op_books_sorted(self):
+        self.get('book_list_create', f'?ordering={self.rng.choice(("-avg_rating", "-total_loans"))}')
+
+    def op_search(self):
+        self.get('book_search', f'?q={self.rng.choice(WORDS)}')
+
+    def op_books_async(self):
+        self.get('book_list_async')
+
+    def op_search_async(self):
+        self.get('book_search_async', f'?q={self.rng.choice(WORDS)}')
+
+    def op_my_orders(self):
+        self.get('my_orders', self.rng.choice(('', '?expand=book', '?fields=id,book,status&status=booked,taken')))
+
+    def op_my_orders_async(self):
+        self.get('my_orders_async')
+
+    def op_waitlist(self):
+        self.get('waitlist')
+
+    def op_refresh(self):
+        self.post('token_refresh', {'refresh': self.refresh}, client=self.client)
+
+    # Circulation: each call advances this client's own reserve, accept, return, rate cycle.
+
+    def op_loan_step(self):
+        if self.loan_step == 0:
+            self.loan = self.reserve()
+            self.loan_step = 1 if self.loan else 0
+        elif self.loan_step == 1:
+            self.post('order_accept', order_id=self.loan)
+            self.loan_step = 2
+        elif self.loan_step == 2:
+            self.post('order_return', order_id=self.loan)
+            self.loan_step = 3
+        else:
+            self.post('order_rate', {'rating': self.rng.randint(0, 5)}, client=self.client, order_id=self.loan)
+            self.loan_step = 0
+
+    # Staff: catalog maintenance, order desk and reports.
+
+    def op_book_create(self):
+        response = self.post('book_list_create', {
+            'title': f'{self.rng.choice(WORDS)} {self.rng.choice(WORDS)} {self.rng.randrange(10 ** 6)}',
+            'author': self.rng.choice(SURNAMES),
+            'quantity': self.rng.randint(1, 10),
+        })
+        if response.status_code == 201:
+            self.created_books.append(response.json()['id'])
+
+    def op_book_update(self):
+        book_id = self.book_id()
+        self.request(self.staff, 'PUT', 'book_update_delete', reverse('book_update_delete', args=[book_id]), {
+            'title': f'{self.rng.choice(WORDS)} {self.rng.choice(WORDS)} {book_id}',
+            'author': self.rng.choice(SURNAMES),
+            'quantity': self.rng.randint(5, 20),
+        })
+
+    def op_book_delete(self):
+        if not self.created_books:
+            self.op_book_create()
+        if self.created_books:
+            book_id = self.created_books.pop()
+            self.request(self.staff, 'DELETE', 'book_update_delete', reverse('book_update_delete', args=[book_id]))
+
+    def op_import(self):
+        rows = ''.join(
+            f'{self.rng.choice(WORDS)} {self.rng.choice(WORDS)} {self.rng.randrange(1000)},{self.rng.choice(SURNAMES)},'
+            f'{self.rng.randint(1, 10)}\n'
+            for _ in range(20)
+        )
+        upload = SimpleUploadedFile('books.csv', f'title,author,quantity\n{rows}'.encode(), content_type='text/csv')
+        self.post('book_import', {'file': upload}, format='multipart')
+
+    def op_order_list(self):
+        self.get('order_list', self.rng.choice(('', '?status=booked', '?status=taken')), client=self.staff)
+
+    def op_order_list_async(self):
+        self.get('order_list_async', client=self.staff)
+
+    def op_export(self):
+        today = timezone.localdate().isoformat()
+        self.get('order_export', f'?output={self.rng.choice(("ndjson", "csv"))}&from={today}', client=self.staff)
+
+    def op_report_circulation(self):
+        self.get('report_circulation', client=self.staff)
+
+    def op_report_top_books(self):
+        self.get('report_top_books', f'?metric={self.rng.choice(("orders", "pickups", "loan_seconds"))}', client=self.staff)
+
+    def op_batch(self):
+        order_ids = [order_id for order_id in (self.reserve() for _ in range(5)) if order_id]
+        if order_ids:
+            self.post('order_batch_accept', {'order_ids': order_ids})
+            self.post('order_batch_return', {'order_ids': order_ids})
+
+    # Accounts: password hashing dominates.
+
+    def op_login(self):
+        self.post('token_obtain_pair', {'username': self.user.username, 'password': self.bench.password}, client=self.client)
+
+    def op_login_async(self):
+        self.post('token_obtain_pair_async', {'username': self.user.username, 'password': self.bench.password}, client=self.client)
+
+    def op_register(self, route='register'):
+        username = f'bench-new-{next(self.bench.registrations)}'
+        self.post(route, {'username': username, 'password': self.bench.password, 'role': UserRole.USER}, client=self.client)
+
+    def op_register_async(self):
+        self.op_register('register_async')
+
+    # Docs.
+
+    def op_schema(self):
+        self.get('schema-swagger-ui', '?format=openapi')
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every API route in-process against a fresh SQLite database with weighted request mixes "
+        "and report throughput, latency percentiles and queries per request. Results are saved as JSON; "
+        "pass --baseline to fail when a route regresses against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='Scenario to run (repeatable, default all)')
+        parser.add_argument('--concurrency', default='1,8', help='Comma-separated client counts to run each scenario at')
+        parser.add_argument('--operations', type=int, default=400, help='Operations per scenario run')
+        parser.add_argument('--warmup', type=int, default=5, help='Unrecorded operations per client before each run')
+        parser.add_argument('--books', type=int, default=2000, help='Books to seed')
+        parser.add_argument('--orders', type=int, default=5000, help='Historical orders to seed')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for data and request mixes')
+        parser.add_argument('--rounds', type=int, help='Override PASSWORD_BCRYPT_ROUNDS for this run')
+        parser.add_argument('--output', help='Where to write the JSON results (default bench_api-<timestamp>.json)')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative slowdown before a run fails')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0, help='Ignore p95 slowdowns smaller than this')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The benchmark runs against a throwaway SQLite database.")
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of integers.")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        # Failed requests are counted in the results; keep their tracebacks out of the report.
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        rounds = options['rounds'] or settings.PASSWORD_BCRYPT_ROUNDS
+        scenarios = options['scenario'] or list(SCENARIOS)
+        with self.bench_database(), override_settings(CACHES=BENCH_CACHES, PASSWORD_BCRYPT_ROUNDS=rounds):
+            self.seed(options['books'], options['orders'], max(levels), options['seed'])
+            runs = {}
+            for scenario in scenarios:
+                for level in levels:
+                    key = f'{scenario}@{level}'
+                    runs[key] = self.run(scenario, level, options['operations'], options['warmup'], options['seed'])
+                    self.report(key, runs[key])
+
+        results = {
+            'meta': {
+                'revision': git_revision(),
+                'created': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'engine': connection.settings_dict['ENGINE'],
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'cpus': os.cpu_count(),
+                'seed': options['seed'],
+                'books': options['books'],
+                'orders': options['orders'],
+                'operations': options['operations'],
+                'bcrypt_rounds': rounds,
+            },
+            'runs': runs,
+        }
+        output = options['output'] or f'bench_api-{timezone.now():%Y%m%d-%H%M%S}.json'
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        self.stdout.write(f"Results written to {output}")
+
+        if baseline is not None:
+            regressions = self.compare(baseline, results, options['threshold'], options['min_delta_ms'])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(line)
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}.")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}."))
+
+    @contextmanager
+    def bench_database(self):
+        """Migrate a temporary SQLite file so runs start from the same state and never touch real data."""
+        directory = tempfile.mkdtemp(prefix='bench_api-')
+        connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}), 'NAME': os.path.join(directory, 'bench.sqlite3')}
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Replicas read the benchmark database too, as in the test suite.
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def seed(self, books, orders, clients, seed):
+        rng = random.Random(seed)
+        self.password = 'bench-password'
+        self.registrations = itertools.count()
+        password = hashing.make_password(self.password)
+        self.staff = User.objects.create(username='bench-operator', role=UserRole.OPERATOR, password=password)
+        self.users = User.objects.bulk_create(
+            User(username=f'bench-user-{i}', role=UserRole.USER, password=password) for i in range(clients)
+        )
+        self.book_ids = [
+            book.id for book in Book.objects.bulk_create(
+                Book(
+                    title=f'{rng.choice(WORDS)} {rng.choice(WORDS)} {i}',
+                    author=rng.choice(SURNAMES),
+                    quantity=rng.randint(5, 20),
+                    daily_price=rng.choice((0, 1, 2)),
+                )
+                for i in range(books)
+            )
+        ]
+
+        now = timezone.now()
+        history = []
+        for _ in range(orders):
+            ordered = now - timedelta(days=rng.uniform(1, 60))
+            taken = ordered + timedelta(hours=rng.uniform(1, 20))
+            returned = taken + timedelta(days=rng.uniform(1, 20))
+            history.append(Order(
+                user=rng.choice(self.users), book_id=rng.choice(self.book_ids), order_date=ordered,
+                status=OrderStatus.RETURNED, taken_at=taken, returned_at=returned, rating=rng.choice((None, 3, 4, 5)),
+            ))
+        Order.objects.bulk_create(history, batch_size=1000)
+        stats.reconcile()
+        rollups.backfill()
+
+    def record(self, route, elapsed, status_code):
+        with self.lock:
+            self.samples.setdefault(route, []).append(elapsed)
+            codes = self.statuses.setdefault(route, {})
+            codes[status_code] = codes.get(status_code, 0) + 1
+
+    def run(self, scenario, clients, operations, warmup, seed):
+        mix = SCENARIOS[scenario]
+        names, weights = list(mix), list(mix.values())
+        sessions = [Session(self, self.users[i], self.staff, seed * 1000 + i) for i in range(clients)]
+        self.lock = threading.Lock()
+        self.samples, self.statuses = {}, {}
+        remaining = iter(range(operations))
+        barrier = threading.Barrier(clients + 1)
+
+        def worker(session):
+            try:
+                for _ in range(warmup):
+                    getattr(session, f'op_{session.rng.choices(names, weights)[0]}')()
+                barrier.wait()
+                barrier.wait()
+                session.recording = True
+                while True:
+                    with self.lock:
+                        if next(remaining, None) is None:
+                            return
+                    getattr(session, f'op_{session.rng.choices(names, weights)[0]}')()
+            except Exception:
+                barrier.abort()
+                raise
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(session,)) for session in sessions]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        metrics.registry.reset()
+        started = time.perf_counter()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        queries = metrics.registry.snapshot()['queries']
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            method, name = route.split(' ', 1)
+            _, query_sum, query_count = queries.get((name, method), (None, 0, 0))
+            routes[route] = {
+                'count': len(samples),
+                'errors': sum(count for code, count in self.statuses[route].items() if code >= 500 and code != 503),
+                # 503 is the password hashing pool shedding load, not a failure.
+                'rejected': self.statuses[route].get(503, 0),
+                'statuses': {str(code): count for code, count in sorted(self.statuses[route].items())},
+                'mean_ms': statistics.fmean(samples) * 1000,
+                'p50_ms': percentile(samples, 50) * 1000,
+                'p95_ms': percentile(samples, 95) * 1000,
+                'p99_ms': percentile(samples, 99) * 1000,
+                'queries': query_sum / query_count if query_count else None,
+            }
+        total = sum(route['count'] for route in routes.values())
+        return {'clients': clients, 'elapsed': elapsed, 'requests': total, 'throughput': total / elapsed, 'routes': routes}
+
+    def report(self, key, run):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{key}: {run['requests']} requests in {run['elapsed']:.2f}s, {run['throughput']:.1f} req/s"
+        ))
+        for route, result in run['routes'].items():
+            queries = '-' if result['queries'] is None else f"{result['queries']:.1f}"
+            self.stdout.write(
+                f"  {route:<40} n={result['count']:<5} p50 {result['p50_ms']:7.2f}  p95 {result['p95_ms']:7.2f}  "
+                f"p99 {result['p99_ms']:7.2f} ms  queries {queries:>5}  errors {result['errors']}  503 {result['rejected']}"
+            )
+
+    def compare(self, baseline, results, threshold, min_delta_ms):
+        """List throughput drops, p95 slowdowns and query-count growth beyond the threshold."""
+        regressions = []
+        for key, run in results['runs'].items():
+            before = baseline.get('runs', {}).get(key)
+            if before is None:
+                continue
+            if run['throughput'] < before['throughput'] * (1 - threshold):
+                regressions.append(f"{key}: throughput {before['throughput']:.1f} -> {run['throughput']:.1f} req/s")
+            for route, result in run['routes'].items():
+                old = before['routes'].get(route)
+                if old is None:
+                    continue
+                if result['p95_ms'] > old['p95_ms'] * (1 + threshold) and result['p95_ms'] - old['p95_ms'] > min_delta_ms:
+                    regressions.append(f"{key} {route}: p95 {old['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+                if result['queries'] is not None and old['queries'] is not None and result['queries'] > old['queries'] + 0.5:
+                    regressions.append(f"{key} {route}: queries {old['queries']:.1f} -> {result['queries']:.1f} per request")
+                if result['errors'] > old['errors']:
+                    regressions.append(f"{key} {route}: errors {old['errors']} -> {result['errors']}")
+        return regressions
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.authentication import add_role_claims
+from api.models import Book, Order, User, UserRole
+
+ENDPOINTS = {
+    'books': ('book_list_create', 'book_list_async', ''),
+    'search': ('book_search', 'book_search_async', '?q=bench'),
+    'orders': ('order_list', 'order_list_async', ''),
+    'mine': ('order_list', 'my_orders_async', ''),
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent throughput and tail latency of the WSGI and ASGI read paths in-process."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='books')
+        parser.add_argument('--connections', type=int, default=50, help='Concurrent connections')
+        parser.add_argument('--requests', type=int, default=2000, help='Total requests per mode')
+        parser.add_argument('--rows', type=int, default=200, help='Books and orders to seed')
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        tag = uuid.uuid4().hex[:8]
+        admin = User.objects.create(username=f'bench-{tag}', role=UserRole.ADMIN)
+        books = Book.objects.bulk_create(
+            Book(title=f'bench {tag} {i}', author='bench', quantity=1) for i in range(options['rows'])
+        )
+        Order.objects.bulk_create(Order(user=admin, book=book) for book in books)
+        token = str(add_role_claims(RefreshToken.for_user(admin), admin).access_token)
+        headers = {'Authorization': f'Bearer {token}'}
+
+        sync_name, async_name, query = ENDPOINTS[options['endpoint']]
+        sync_url = reverse(sync_name) + query
+        async_url = reverse(async_name) + query
+        connections, total = options['connections'], options['requests']
+
+        try:
+            self.report('WSGI, sync view', *self.run_wsgi(sync_url, headers, connections, total))
+            self.report('ASGI, sync view', *self.run_asgi(sync_url, headers, connections, total))
+            self.report('ASGI, async view', *self.run_asgi(async_url, headers, connections, total))
+        finally:
+            admin.delete()
+            Book.objects.filter(id__in=[book.id for book in books]).delete()
+
+    def run_wsgi(self, url, headers, connections, total):
+        latencies, codes = [], {}
+        lock = threading.Lock()
+        remaining = iter(range(total))
+
+        def worker():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    started = time.perf_counter()
+                    response = client.get(url, headers=headers)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(connections)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, latencies, codes
+
+    def run_asgi(self, url, headers, connections, total):
+        latencies, codes = [], {}
+
+        async def run():
+            client = AsyncClient()
+            queue = asyncio.Queue()
+            for _ in range(total):
+                queue.put_nowait(None)
+
+            async def worker():
+                while not queue.empty():
+                    queue.get_nowait()
+                    started = time.perf_counter()
+                    response = await client.get(url, headers=headers)
+                    latencies.append(time.perf_counter() - started)
+                    codes[response.status_code] = codes.get(response.status_code, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(connections)))
+            return time.perf_counter() - started
+
+        elapsed = asyncio.run(run())
+        return elapsed, latencies, codes
+
+    def report(self, label, elapsed, latencies, codes):
+        self.stdout.write(
+            f"{label:<18} {len(latencies) / elapsed:8.1f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+            f"p99 {percentile(latencies, 99) * 1000:7.2f} ms  "
+            f"status {dict(sorted(codes.items()))}"
+        )
@@ -0,0 +1,67 @@
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api import hashing
+from api.models import User, UserRole
+
+
+class Command(BaseCommand):
+    help = "Measure login throughput through the password hashing pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=32, help='Number of concurrent client threads')
+        parser.add_argument('--requests', type=int, default=10, help='Logins per client')
+        parser.add_argument('--rounds', type=int, help='Override PASSWORD_BCRYPT_ROUNDS for this run')
+        parser.add_argument('--path', choices=['sync', 'async'], default='sync', help='Login endpoint to drive')
+
+    def handle(self, *args, **options):
+        # Rejected logins are logged as 503 errors; the summary reports them.
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        rounds = options['rounds'] or settings.PASSWORD_BCRYPT_ROUNDS
+        with override_settings(PASSWORD_BCRYPT_ROUNDS=rounds):
+            self.run(options['clients'], options['requests'], options['path'], rounds)
+
+    def run(self, clients, attempts, path, rounds):
+        tag = uuid.uuid4().hex[:8]
+        password = f'bench-{tag}'
+        user = User.objects.create(username=f'bench-{tag}', role=UserRole.USER, password=hashing.make_password(password))
+        url = reverse('token_obtain_pair' if path == 'sync' else 'token_obtain_pair_async')
+        results = {}
+        lock = threading.Lock()
+        barrier = threading.Barrier(clients)
+
+        def worker():
+            client = APIClient()
+            barrier.wait()
+            try:
+                for _ in range(attempts):
+                    response = client.post(url, {'username': user.username, 'password': password}, format='json')
+                    with lock:
+                        results[response.status_code] = results.get(response.status_code, 0) + 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        user.delete()
+
+        ok = results.get(200, 0)
+        cores = min(settings.PASSWORD_HASHING_WORKERS, os.cpu_count() or 1)
+        self.stdout.write(f"{path} login, bcrypt rounds {rounds}, {settings.PASSWORD_HASHING_WORKERS} hashing workers, {cores} cores")
+        self.stdout.write(f"status codes: {dict(sorted(results.items()))} in {elapsed:.2f}s")
+        self.stdout.write(f"{ok / elapsed:.1f} logins/s, {ok / elapsed / cores:.1f} logins/s per core")
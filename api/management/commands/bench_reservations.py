@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.models import Book, Order, User, UserRole
+
+
+class Command(BaseCommand):
+    help = "Hammer one book with concurrent reservations and check that it never oversells."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200, help='Number of concurrent client threads')
+        parser.add_argument('--requests', type=int, default=5, help='Reservation attempts per client')
+        parser.add_argument('--stock', type=int, default=100, help='Initial quantity of the contended book')
+
+    def handle(self, *args, **options):
+        clients, attempts, stock = options['clients'], options['requests'], options['stock']
+        # Every rejected reservation would otherwise log a "Bad Request" warning.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(f'bench-{tag}', password=tag, role=UserRole.USER)
+        book = Book.objects.create(title=f'bench-{tag}', author='bench', quantity=stock)
+        url = reverse('order_create')
+
+        results = {201: 0, 400: 0}
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(clients)
+
+        def worker():
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                for _ in range(attempts):
+                    response = client.post(url, {'book_id': book.id}, format='json')
+                    with lock:
+                        results[response.status_code] = results.get(response.status_code, 0) + 1
+            except Exception as exc:
+                with lock:
+                    errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            book.refresh_from_db()
+            orders = Order.objects.filter(book=book).count()
+            total = clients * attempts
+            self.stdout.write(f"{total} requests from {clients} clients in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+            self.stdout.write(f"status codes: {dict(sorted(results.items()))}, errors: {len(errors)}")
+            self.stdout.write(f"orders created: {orders}, final quantity: {book.quantity}, initial stock: {stock}")
+
+            if errors:
+                raise CommandError(f"{len(errors)} client(s) failed, first error: {errors[0]!r}")
+            if book.quantity < 0 or orders + book.quantity != stock or results.get(201, 0) != orders:
+                raise CommandError("Oversell detected: orders and remaining stock do not add up")
+            self.stdout.write(self.style.SUCCESS("No oversell"))
+        finally:
+            user.delete()
+            book.delete()
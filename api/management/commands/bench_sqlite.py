@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = ('stock', 'production')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare mixed read/write throughput of Django's default SQLite setup against the production "
+        "profile (WAL, tuned pragmas, persistent connections, BEGIN IMMEDIATE order writes) with bench_api."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,4,8,16', help='Comma-separated client counts')
+        parser.add_argument('--operations', type=int, default=1000, help='Operations per run')
+        parser.add_argument('--scenario', default='mixed', help='bench_api scenario to run')
+
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in PROFILES:
+                output = os.path.join(directory, f'{profile}.json')
+                self.stdout.write(f"Running {options['scenario']} with the {profile} profile...")
+                # Each profile needs its own process: the database engine is fixed at startup.
+                completed = subprocess.run(
+                    [
+                        sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_api',
+                        '--scenario', options['scenario'], '--concurrency', options['concurrency'],
+                        '--operations', str(options['operations']), '--output', output,
+                    ],
+                    env={**os.environ, 'SQLITE_PROFILE': profile},
+                    capture_output=True,
+                    text=True,
+                )
+                if completed.returncode:
+                    raise CommandError(f"bench_api failed for the {profile} profile:\n{completed.stderr}")
+                with open(output) as f:
+                    results[profile] = json.load(f)['runs']
+
+        self.stdout.write(f"{'run':<16}{'stock req/s':>12}{'prod req/s':>12}{'gain':>8}{'stock 5xx':>11}{'prod 5xx':>10}")
+        for key, stock in sorted(results['stock'].items(), key=lambda item: item[1]['clients']):
+            production = results['production'][key]
+            self.stdout.write(
+                f"{key:<16}{stock['throughput']:>12.1f}{production['throughput']:>12.1f}"
+                f"{production['throughput'] / stock['throughput']:>7.2f}x"
+                f"{sum(route['errors'] for route in stock['routes'].values()):>11}"
+                f"{sum(route['errors'] for route in production['routes'].values()):>10}"
+            )
@@ -0,0 +1,24 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import schema
+
+
+class Command(BaseCommand):
+    help = "Build the OpenAPI artifact for the current code version, so no request has to generate it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Also write the uncompressed JSON here, e.g. for SDK generators')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        artifact = schema.build_artifact()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {schema.artifact_path(artifact.version)} ({len(artifact.gzipped)} bytes gzipped, "
+            f"ETag {artifact.etag}) in {time.perf_counter() - started:.2f}s."
+        ))
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                f.write(gzip.decompress(artifact.gzipped))
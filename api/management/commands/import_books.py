@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import IMPORT_BATCH_SIZE, IMPORT_FORMATS, detect_format, import_books
+
+
+class Command(BaseCommand):
+    help = "Import books from a CSV or JSON-lines file, upserting by title and author."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Input format (default: from file extension)')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows per bulk write')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or detect_format(path)
+        try:
+            with open(path, 'rb') as stream:
+                report = import_books(stream, input_format, options['batch_size'])
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report.created}, updated {report.updated}, failed {len(report.errors)}."
+        ))
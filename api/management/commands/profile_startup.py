@@ -0,0 +1,124 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MODES = {'lean': '0', 'preload': '1'}
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+# Runs in a fresh interpreter: boot the WSGI application and serve one request.
+CHILD = '''
+import json, os, sys, time
+from wsgiref.util import setup_testing_defaults
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+ready = time.time()
+environ = {'PATH_INFO': sys.argv[1], 'REQUEST_METHOD': 'GET'}
+setup_testing_defaults(environ)
+statuses = []
+response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+body = b''.join(response)
+response.close()
+done = time.time()
+launched = float(os.environ['PROFILE_STARTUP_LAUNCHED'])
+print(json.dumps({
+    'boot_ms': (ready - launched) * 1000,
+    'request_ms': (done - ready) * 1000,
+    'first_response_ms': (done - launched) * 1000,
+    'status': statuses[0],
+    'modules': len(sys.modules),
+}))
+'''
+
+
+def parse_importtime(stderr):
+    """``{module: (self_us, cumulative_us)}`` from ``-X importtime`` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile cold start: launch fresh processes that boot the WSGI application and serve one "
+        "request, and report time to first response with an -X importtime breakdown by package, "
+        "for the lean startup mode and with STARTUP_PRELOAD."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/v1/books/', help='Path of the first request')
+        parser.add_argument('--mode', choices=[*MODES, 'both'], default='both')
+        parser.add_argument('--repeat', type=int, default=5, help='Cold starts per mode; medians are reported')
+        parser.add_argument('--top', type=int, default=15, help='Packages to list in the import breakdown')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def cold_start(self, mode, path):
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'library.settings'),
+            'STARTUP_PRELOAD': MODES[mode],
+            'PROFILE_STARTUP_LAUNCHED': repr(time.time()),
+        }
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD, path],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode:
+            raise CommandError(f"Cold start failed in {mode} mode:\n{completed.stderr[-4000:]}")
+        return json.loads(completed.stdout.splitlines()[-1]), parse_importtime(completed.stderr)
+
+    def profile(self, mode, path, repeat):
+        runs = []
+        packages = defaultdict(list)
+        for _ in range(repeat):
+            run, modules = self.cold_start(mode, path)
+            runs.append(run)
+            totals = defaultdict(int)
+            for name, (self_us, _) in modules.items():
+                totals[name.split('.')[0]] += self_us
+            for package, us in totals.items():
+                packages[package].append(us / 1000)
+        return {
+            'status': runs[-1]['status'],
+            'modules': runs[-1]['modules'],
+            **{key: statistics.median(run[key] for run in runs) for key in ('boot_ms', 'request_ms', 'first_response_ms')},
+            'packages': {package: statistics.median(values + [0] * (repeat - len(values))) for package, values in packages.items()},
+        }
+
+    def handle(self, *args, **options):
+        modes = list(MODES) if options['mode'] == 'both' else [options['mode']]
+        results = {}
+        for mode in modes:
+            self.stdout.write(f"Cold-starting {options['repeat']} processes in {mode} mode...")
+            results[mode] = self.profile(mode, options['path'], options['repeat'])
+
+        self.stdout.write(f"\nGET {options['path']}")
+        self.stdout.write(f"{'mode':<10}{'boot ms':>10}{'request ms':>12}{'first resp ms':>15}{'modules':>9}  status")
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:<10}{result['boot_ms']:>10.1f}{result['request_ms']:>12.1f}"
+                f"{result['first_response_ms']:>15.1f}{result['modules']:>9}  {result['status']}"
+            )
+
+        packages = sorted(
+            {package for result in results.values() for package in result['packages']},
+            key=lambda package: -max(result['packages'].get(package, 0) for result in results.values()),
+        )
+        self.stdout.write(f"\nImport time by package (ms, self time summed over modules)")
+        self.stdout.write(f"{'package':<28}" + ''.join(f"{mode:>10}" for mode in results))
+        for package in packages[:options['top']]:
+            self.stdout.write(f"{package:<28}" + ''.join(f"{result['packages'].get(package, 0):>10.1f}" for result in results.values()))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'path': options['path'], 'repeat': options['repeat'], 'modes': results}, f, indent=2)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Restore the search sync triggers and rebuild the full-text index over book titles and authors."
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("Full-text search requires the SQLite backend.")
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Book search index rebuilt."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import catalog_changed
+from api.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = "Rebuild per-book rating and loan aggregates from the order table."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = reconcile()
+            catalog_changed()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled aggregates for {updated} books."))
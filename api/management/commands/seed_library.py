@@ -0,0 +1,55 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.seeding import SEED_BATCH_SIZE, flush, seed_library
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic library: users, books and an order history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Reader accounts')
+        parser.add_argument('--operators', type=int, default=10, help='Operator accounts')
+        parser.add_argument('--books', type=int, default=100000, help='Books')
+        parser.add_argument('--orders', type=int, default=1000000, help='Orders')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the same arguments always produce the same data')
+        parser.add_argument('--end', help='Newest order timestamp (ISO 8601, default now); history runs back from here')
+        parser.add_argument('--days', type=int, default=365, help='Days of order history')
+        parser.add_argument('--password', default='library', help='Password for every generated account')
+        parser.add_argument('--batch-size', type=int, default=SEED_BATCH_SIZE, help='Rows per bulk insert')
+        parser.add_argument('--flush', action='store_true', help='Delete existing orders, books and non-superuser accounts first')
+
+    def handle(self, *args, **options):
+        end = timezone.now()
+        if options['end']:
+            end = parse_datetime(options['end'])
+            if end is None:
+                raise CommandError(f"Invalid timestamp {options['end']!r}.")
+            if timezone.is_naive(end):
+                end = timezone.make_aware(end)
+        if options['flush']:
+            flush()
+
+        started = time.perf_counter()
+
+        def progress(written):
+            rate = written / (time.perf_counter() - started)
+            self.stdout.write(f"Inserted {written}/{options['orders']} orders ({rate:,.0f}/s)", ending='\r')
+
+        try:
+            report = seed_library(
+                options['users'], options['operators'], options['books'], options['orders'], options['seed'],
+                end, timedelta(days=options['days']), options['password'], options['batch_size'], progress,
+            )
+        except IntegrityError as exc:
+            raise CommandError(f"{exc}. Use --flush or a different --seed to seed again.")
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report.users} users, {report.books} books and {report.orders} orders "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
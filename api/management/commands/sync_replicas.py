@@ -0,0 +1,35 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def copy_database(source, target):
+    """Copy one SQLite file onto another with the online backup API; readers of ``target`` see a consistent snapshot."""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database onto every replica in DATABASE_REPLICAS, once or on an interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep copying every N seconds to simulate replication lag')
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        if primary['ENGINE'] not in ('django.db.backends.sqlite3', 'api.backends.sqlite3'):
+            raise CommandError("sync_replicas only copies SQLite files; use the database's own replication elsewhere.")
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured; set REPLICA_DATABASES.")
+
+        while True:
+            started = time.perf_counter()
+            for alias in settings.DATABASE_REPLICAS:
+                copy_database(str(primary['NAME']), str(connections[alias].settings_dict['NAME']))
+            self.stdout.write(f"Synced {len(settings.DATABASE_REPLICAS)} replica(s) in {time.perf_counter() - started:.2f}s.")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
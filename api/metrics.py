@@ -0,0 +1,286 @@
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+TRACKED_TASKS = ('api.tasks.cancel_expired_orders', 'api.tasks.compute_order_penalties')
+TASK_STATES = ('SUCCESS', 'FAILURE', 'RETRY')
+TASK_FIELDS = tuple(f'runs:{state}' for state in TASK_STATES) + ('micros', 'last_micros', 'processed')
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    In-process request metrics. Each worker process keeps its own registry,
+    as Prometheus expects when it scrapes every worker or the multiprocess
+    deployment sums them. Recording is a few dict operations under one lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.latency = {}
+        self.queries = {}
+        self.sizes = {}
+        self.db_seconds = {}
+
+    def record(self, route, method, status, seconds, queries, db_seconds, size):
+        key = (route, method)
+        with self.lock:
+            status_key = (route, method, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.queries[key] = Histogram(QUERY_BUCKETS)
+                self.sizes[key] = Histogram(SIZE_BUCKETS)
+                self.db_seconds[key] = 0.0
+            self.latency[key].observe(seconds)
+            self.queries[key].observe(queries)
+            self.db_seconds[key] += db_seconds
+            if size is not None:
+                self.sizes[key].observe(size)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'latency': {key: (list(h.counts), h.sum, h.count) for key, h in self.latency.items()},
+                'queries': {key: (list(h.counts), h.sum, h.count) for key, h in self.queries.items()},
+                'sizes': {key: (list(h.counts), h.sum, h.count) for key, h in self.sizes.items()},
+                'db_seconds': dict(self.db_seconds),
+            }
+
+
+registry = Registry()
+
+
+class QueryCounter:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+    def install(self):
+        """Wrap every connection of the calling thread; returns what to pass to :meth:`remove`."""
+        wrapped = []
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+            wrapped.append(connection)
+        return wrapped
+
+    def remove(self, wrapped):
+        for connection in wrapped:
+            connection.execute_wrappers.remove(self)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+def response_size(response):
+    if getattr(response, 'streaming', False):
+        return None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status, response size and SQL query count/time for every
+    request, labelled by URL name. Connections are per thread, so under ASGI
+    the counter is installed from a thread-sensitive ``sync_to_async`` call:
+    that runs in the request's sync thread, where the async ORM and the
+    sync_to_async calls in the views run their queries too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = QueryCounter()
+        started = time.perf_counter()
+        wrapped = counter.install()
+        try:
+            response = self.get_response(request)
+        finally:
+            counter.remove(wrapped)
+        elapsed = time.perf_counter() - started
+        registry.record(route_name(request), request.method, response.status_code, elapsed,
+                        counter.count, counter.seconds, response_size(response))
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        wrapped = await sync_to_async(counter.install)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(counter.remove)(wrapped)
+        elapsed = time.perf_counter() - started
+        registry.record(route_name(request), request.method, response.status_code, elapsed,
+                        counter.count, counter.seconds, response_size(response))
+        return response
+
+
+def get_task_cache():
+    return caches[getattr(settings, 'METRICS_TASK_CACHE_ALIAS', 'default')]
+
+
+def task_key(task, field):
+    return f'metrics:task:{task}:{field}'
+
+
+def incr(cache, key, amount):
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, None):
+            cache.incr(key, amount)
+
+
+def record_task(task, state, seconds, processed=None):
+    """
+    Record one Celery task run in the shared cache, so the web process that
+    serves /metrics sees runs from every worker. Durations are stored in
+    microseconds because cache increments are integer-only.
+    """
+    cache = get_task_cache()
+    micros = int(seconds * 1_000_000)
+    incr(cache, task_key(task, f'runs:{state}'), 1)
+    incr(cache, task_key(task, 'micros'), micros)
+    cache.set(task_key(task, 'last_micros'), micros, None)
+    if isinstance(processed, int) and not isinstance(processed, bool):
+        incr(cache, task_key(task, 'processed'), processed)
+
+
+def task_snapshot():
+    cache = get_task_cache()
+    keys = [task_key(task, field) for task in TRACKED_TASKS for field in TASK_FIELDS]
+    values = cache.get_many(keys)
+    return {
+        task: {field: values.get(task_key(task, field), 0) for field in TASK_FIELDS}
+        for task in TRACKED_TASKS
+    }
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**values):
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in values.items()) + '}'
+
+
+def render_histogram(lines, name, buckets, data):
+    for (route, method), (counts, total, count) in sorted(data.items()):
+        cumulative = 0
+        for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{labels(route=route, method=method, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{labels(route=route, method=method)} {total}')
+        lines.append(f'{name}_count{labels(route=route, method=method)} {count}')
+
+
+def render():
+    """Prometheus text exposition format (version 0.0.4)."""
+    snapshot = registry.snapshot()
+    lines = [
+        '# HELP library_http_requests_total HTTP requests by route, method and status.',
+        '# TYPE library_http_requests_total counter',
+    ]
+    for (route, method, status), count in sorted(snapshot['requests'].items()):
+        lines.append(f'library_http_requests_total{labels(route=route, method=method, status=status)} {count}')
+
+    lines += [
+        '# HELP library_http_request_duration_seconds Request latency.',
+        '# TYPE library_http_request_duration_seconds histogram',
+    ]
+    render_histogram(lines, 'library_http_request_duration_seconds', LATENCY_BUCKETS, snapshot['latency'])
+    lines += [
+        '# HELP library_http_db_queries SQL queries issued per request.',
+        '# TYPE library_http_db_queries histogram',
+    ]
+    render_histogram(lines, 'library_http_db_queries', QUERY_BUCKETS, snapshot['queries'])
+    lines += [
+        '# HELP library_http_db_seconds_total Time spent executing SQL.',
+        '# TYPE library_http_db_seconds_total counter',
+    ]
+    for (route, method), seconds in sorted(snapshot['db_seconds'].items()):
+        lines.append(f'library_http_db_seconds_total{labels(route=route, method=method)} {seconds}')
+    lines += [
+        '# HELP library_http_response_bytes Response body size.',
+        '# TYPE library_http_response_bytes histogram',
+    ]
+    render_histogram(lines, 'library_http_response_bytes', SIZE_BUCKETS, snapshot['sizes'])
+
+    tasks = task_snapshot()
+    lines += [
+        '# HELP library_task_runs_total Celery task runs by final state.',
+        '# TYPE library_task_runs_total counter',
+    ]
+    for name, entry in tasks.items():
+        for state in TASK_STATES:
+            lines.append(f'library_task_runs_total{labels(task=name, state=state)} {entry[f"runs:{state}"]}')
+    lines += [
+        '# HELP library_task_seconds_total Time spent running Celery tasks.',
+        '# TYPE library_task_seconds_total counter',
+    ]
+    for name, entry in tasks.items():
+        lines.append(f'library_task_seconds_total{labels(task=name)} {entry["micros"] / 1_000_000}')
+    lines += [
+        '# HELP library_task_last_run_seconds Duration of the latest run.',
+        '# TYPE library_task_last_run_seconds gauge',
+    ]
+    for name, entry in tasks.items():
+        lines.append(f'library_task_last_run_seconds{labels(task=name)} {entry["last_micros"] / 1_000_000}')
+    lines += [
+        '# HELP library_task_rows_processed_total Rows reported as processed by Celery tasks.',
+        '# TYPE library_task_rows_processed_total counter',
+    ]
+    for name, entry in tasks.items():
+        lines.append(f'library_task_rows_processed_total{labels(task=name)} {entry["processed"]}')
+    return '\n'.join(lines) + '\n'
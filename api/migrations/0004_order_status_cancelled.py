@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_alter_user_options_alter_user_managers_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('booked', 'Booked'), ('taken', 'Taken'), ('returned', 'Returned'), ('cancelled', 'Cancelled')], default='booked', max_length=20),
+        ),
+    ]
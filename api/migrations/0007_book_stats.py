@@ -0,0 +1,94 @@
+# Generated by Django 4.2.16 on 2026-10-17 12:31
+
+from django.db import migrations, models
+
+FTS_TABLE = 'api_book_fts'
+
+# Adding columns rebuilds api_book on SQLite, which drops the search index
+# triggers from 0006; recreate them and rebuild the index.
+RESTORE_INDEX_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON api_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON api_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, author ON api_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')",
+]
+
+BACKFILL_SQL = """
+    UPDATE api_book SET
+        rating_count = (SELECT COUNT(*) FROM api_order WHERE book_id = api_book.id AND rating IS NOT NULL),
+        rating_sum = COALESCE((SELECT SUM(rating) FROM api_order WHERE book_id = api_book.id), 0),
+        avg_rating = COALESCE((SELECT AVG(rating * 1.0) FROM api_order WHERE book_id = api_book.id), 0.0),
+        total_loans = (
+            SELECT COUNT(*) FROM api_order WHERE book_id = api_book.id AND status IN ('taken', 'returned')
+        ),
+        active_loans = (SELECT COUNT(*) FROM api_order WHERE book_id = api_book.id AND status = 'taken')
+"""
+
+
+def restore_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in RESTORE_INDEX_SQL:
+        schema_editor.execute(statement)
+
+
+def backfill_stats(apps, schema_editor):
+    schema_editor.execute(BACKFILL_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_book_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='active_loans',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='avg_rating',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_loans',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-avg_rating', 'id'], name='book_avg_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-total_loans', 'id'], name='book_total_loans_idx'),
+        ),
+        migrations.RunPython(restore_index, migrations.RunPython.noop),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-17 12:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_task_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('pickups', models.IntegerField(default=0)),
+                ('returns', models.IntegerField(default=0)),
+                ('cancellations', models.IntegerField(default=0)),
+                ('loan_seconds', models.BigIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailybookstats',
+            constraint=models.UniqueConstraint(fields=('day', 'book'), name='dailybookstats_day_book_uniq'),
+        ),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 4.2.16 on 2026-10-17 13:28
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Sum
+
+COUNTERS = ['orders', 'pickups', 'returns', 'cancellations', 'loan_seconds']
+
+FTS_TABLE = 'api_book_fts'
+
+# Adding the constraint rebuilds api_book on SQLite, which drops the search
+# index triggers; recreate them as of 0006 and rebuild the index.
+RESTORE_INDEX_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON api_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON api_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, author ON api_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')",
+]
+
+# Recompute the aggregates of the books that absorbed duplicates, as 0007
+# backfilled them.
+RECOUNT_SQL = """
+    UPDATE api_book SET
+        rating_count = (SELECT COUNT(*) FROM api_order WHERE book_id = api_book.id AND rating IS NOT NULL),
+        rating_sum = COALESCE((SELECT SUM(rating) FROM api_order WHERE book_id = api_book.id), 0),
+        avg_rating = COALESCE((SELECT AVG(rating * 1.0) FROM api_order WHERE book_id = api_book.id), 0.0),
+        total_loans = (
+            SELECT COUNT(*) FROM api_order WHERE book_id = api_book.id AND status IN ('taken', 'returned')
+        ),
+        active_loans = (SELECT COUNT(*) FROM api_order WHERE book_id = api_book.id AND status = 'taken')
+    WHERE id IN (%s)
+"""
+
+
+def merge_duplicate_books(apps, schema_editor):
+    """
+    Fold every book that repeats a (title, author) pair into the oldest one:
+    copies, orders, waitlist places and rollups move over, then the book
+    aggregates are recomputed. The duplicates are deleted, so this migration
+    cannot be unapplied.
+    """
+    Book = apps.get_model('api', 'Book')
+    Order = apps.get_model('api', 'Order')
+    WaitlistEntry = apps.get_model('api', 'WaitlistEntry')
+    DailyBookStats = apps.get_model('api', 'DailyBookStats')
+
+    groups = list(
+        Book.objects.values('title', 'author')
+        .annotate(copies=Count('id'), keep=Min('id'))
+        .filter(copies__gt=1)
+    )
+    if not groups:
+        return
+    for group in groups:
+        keep = group['keep']
+        duplicates = list(
+            Book.objects.filter(title=group['title'], author=group['author']).exclude(id=keep).values_list('id', flat=True)
+        )
+        quantity = Book.objects.filter(id__in=duplicates).aggregate(total=Sum('quantity'))['total']
+        Book.objects.filter(id=keep).update(quantity=F('quantity') + quantity)
+        Order.objects.filter(book_id__in=duplicates).update(book_id=keep)
+
+        # A user waiting on several copies keeps their earliest place.
+        for entry in WaitlistEntry.objects.filter(book_id__in=duplicates).order_by('id'):
+            if WaitlistEntry.objects.filter(user_id=entry.user_id, book_id=keep).exists():
+                entry.delete()
+            else:
+                WaitlistEntry.objects.filter(id=entry.id).update(book_id=keep)
+
+        for row in DailyBookStats.objects.filter(book_id__in=duplicates):
+            DailyBookStats.objects.get_or_create(day=row.day, book_id=keep)
+            DailyBookStats.objects.filter(day=row.day, book_id=keep).update(
+                **{counter: F(counter) + getattr(row, counter) for counter in COUNTERS}
+            )
+            row.delete()
+
+        Book.objects.filter(id__in=duplicates).delete()
+
+    kept = [group['keep'] for group in groups]
+    schema_editor.execute(RECOUNT_SQL % ', '.join(['%s'] * len(kept)), kept)
+
+
+def restore_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in RESTORE_INDEX_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_waitlist'),
+    ]
+
+    # No reverse for the merge: unapplying raises IrreversibleError rather
+    # than dropping the constraint over data that cannot be split back.
+    operations = [
+        migrations.RunPython(merge_duplicate_books),
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_title_author_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(fields=('title', 'author'), name='book_title_author_uniq'),
+        ),
+        migrations.RunPython(restore_index, migrations.RunPython.noop),
+    ]
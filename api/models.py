@@ -10,6 +10,7 @@ class OrderStatus(models.TextChoices):
     BOOKED = 'booked'
     TAKEN = 'taken'
     RETURNED = 'returned'
+    CANCELLED = 'cancelled'
 
 class User(AbstractUser):
     role = models.CharField(max_length=20, choices=UserRole.choices, default=UserRole.USER)
@@ -37,6 +38,24 @@ class Book(models.Model):
     author = models.CharField(max_length=100)
     quantity = models.IntegerField(default=1)  
     daily_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)  
+    # Maintained incrementally by the order views; rebuilt by reconcile_book_stats.
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    avg_rating = models.FloatField(default=0.0)
+    total_loans = models.IntegerField(default=0)
+    active_loans = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author'], name='book_author_idx'),
+            models.Index(fields=['-avg_rating', 'id'], name='book_avg_rating_idx'),
+            models.Index(fields=['-total_loans', 'id'], name='book_total_loans_idx'),
+        ]
+        constraints = [
+            # The importer's natural key; also serves title/author lookups.
+            models.UniqueConstraint(fields=['title', 'author'], name='book_title_author_uniq'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -50,5 +69,63 @@ class Order(models.Model):
     penalty = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     rating = models.IntegerField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Order list/export by status and the expiry sweep over booked orders.
+            models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+            # Unfiltered order list, newest first.
+            models.Index(fields=['order_date', 'id'], name='order_date_id_idx'),
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            # A user's own orders, newest first.
+            models.Index(fields=['user', 'order_date', 'id'], name='order_user_date_idx'),
+            models.Index(fields=['book', 'status'], name='order_book_status_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user}"
+
+class DailyBookStats(models.Model):
+    """Per-day, per-book circulation counters kept up to date by the order lifecycle."""
+    day = models.DateField()
+    book = models.ForeignKey('Book', on_delete=models.CASCADE)
+    orders = models.IntegerField(default=0)
+    pickups = models.IntegerField(default=0)
+    returns = models.IntegerField(default=0)
+    cancellations = models.IntegerField(default=0)
+    loan_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'book'], name='dailybookstats_day_book_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} on {self.day}"
+
+class TaskCheckpoint(models.Model):
+    """Progress marker that lets long-running batch tasks resume where they stopped."""
+    name = models.CharField(max_length=100, unique=True)
+    as_of = models.DateTimeField(null=True, blank=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+class WaitlistEntry(models.Model):
+    """A user queued for a book that is out of stock; served first come, first served."""
+    user = models.ForeignKey('User', on_delete=models.CASCADE)
+    book = models.ForeignKey('Book', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Head of each book's queue, and positions within it.
+            models.Index(fields=['book', 'id'], name='waitlist_book_id_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='waitlist_user_book_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} waiting for {self.book_id}"
@@ -0,0 +1,187 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .search import search_books
+
+
+def parse_int(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError
+    return value
+
+
+def parse_float(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError
+    return float(value)
+
+
+def parse_timestamp(value):
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError
+    return parsed
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-based pagination over a fixed ordering.
+
+    The cursor is an opaque token holding the ordering values of the last row
+    on the page, so every page is a single indexed range scan no matter how
+    deep into the table the client is.
+    """
+    ordering = ('id',)
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    cursor_parsers = {}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_rows(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.paginate_rows([row async for row in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        """Order, seek and slice ``queryset`` to one page plus a look-ahead row."""
+        self.request = request
+        self.ordering = self.get_ordering(request)
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position))
+        return queryset[:self.page_size + 1]
+
+    def paginate_rows(self, rows):
+        """Trim a fetch of ``page_size + 1`` rows and remember where the next page starts."""
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, request):
+        return self.ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def seek_filter(self, position):
+        """
+        Build the row-value comparison ``(a, b) > (x, y)`` as
+        ``a > x OR (a = x AND b > y)`` so the database can use the index.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+        raw = json.dumps(values, separators=(',', ':')).encode('ascii')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [self.parse_value(field.lstrip('-'), value) for field, value in zip(self.ordering, values)]
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def parse_value(self, field, value):
+        return self.cursor_parsers[field](value)
+
+
+class BookPagination(KeysetPagination):
+    ordering = ('id',)
+    ordering_query_param = 'ordering'
+    # Each ordering is backed by an index scanned forwards or backwards.
+    orderings = {
+        'id': ('id',),
+        'avg_rating': ('avg_rating', '-id'),
+        '-avg_rating': ('-avg_rating', 'id'),
+        'total_loans': ('total_loans', '-id'),
+        '-total_loans': ('-total_loans', 'id'),
+    }
+    cursor_parsers = {'id': parse_int, 'avg_rating': parse_float, 'total_loans': parse_int}
+
+    def get_ordering(self, request):
+        return self.orderings.get(request.query_params.get(self.ordering_query_param), self.ordering)
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ('-order_date', '-id')
+    cursor_parsers = {'id': parse_int, 'order_date': parse_timestamp}
+
+
+class BookSearchPagination(KeysetPagination):
+    """Seeks on ``(bm25 score, id)`` so deep result pages stay cheap."""
+    ordering = ('score', 'id')
+    page_size = 20
+    max_page_size = 100
+    cursor_parsers = {'id': parse_int, 'score': parse_float}
+
+    def paginate_search(self, text, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        books = []
+        for book, score in search_books(text, self.page_size + 1, after=position):
+            book.score = score
+            books.append(book)
+        return self.paginate_rows(books)
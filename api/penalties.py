@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Order, OrderStatus, TaskCheckpoint
+
+PENALTY_BATCH_SIZE = 50000
+CHECKPOINT_NAME = 'penalties'
+
+CENTS = Decimal('0.01')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+DAY_US = timedelta(days=1) // ONE_MICROSECOND
+
+
+def get_loan_period():
+    return getattr(settings, 'ORDER_LOAN_PERIOD', timedelta(days=14))
+
+
+def compute_penalty(taken_at, daily_price, as_of, loan_period=None):
+    """
+    Reference scalar implementation: every full day past the end of the loan
+    period costs the book's daily price.
+    """
+    loan_period = get_loan_period() if loan_period is None else loan_period
+    overdue_days = max((as_of - taken_at - loan_period).days, 0)
+    return (Decimal(daily_price) * overdue_days).quantize(CENTS)
+
+
+def to_microseconds(value):
+    return (value - EPOCH) // ONE_MICROSECOND
+
+
+def to_cents(value):
+    return int(Decimal(value).quantize(CENTS) * 100)
+
+
+def compute_penalty_cents(taken_us, price_cents, as_of, loan_period=None):
+    """
+    Vectorized :func:`compute_penalty` over int64 columns, in whole cents so
+    the result is exact. Floor division matches ``timedelta.days``.
+    """
+    import numpy as np
+
+    loan_period = get_loan_period() if loan_period is None else loan_period
+    due_by = to_microseconds(as_of) - loan_period // ONE_MICROSECOND
+    overdue_days = np.maximum((due_by - taken_us) // DAY_US, 0)
+    return overdue_days * price_cents
+
+
+def fetch_open_loans(after_id, limit):
+    """One id-ordered chunk of taken orders as numpy columns."""
+    import numpy as np
+
+    rows = list(
+        Order.objects.filter(status=OrderStatus.TAKEN, taken_at__isnull=False, id__gt=after_id)
+        .order_by('id')
+        .values_list('id', 'taken_at', 'book__daily_price', 'penalty')[:limit]
+    )
+    if not rows:
+        return None
+    ids, taken_at, prices, penalties = zip(*rows)
+    return (
+        np.fromiter(ids, dtype=np.int64, count=len(rows)),
+        np.fromiter(map(to_microseconds, taken_at), dtype=np.int64, count=len(rows)),
+        np.fromiter(map(to_cents, prices), dtype=np.int64, count=len(rows)),
+        np.fromiter(map(to_cents, penalties), dtype=np.int64, count=len(rows)),
+    )
+
+
+def write_penalties(ids, cents, status):
+    """
+    Write ``cents`` back to the given orders with one prepared UPDATE,
+    skipping any order that is no longer in ``status``: a loan returned after
+    the nightly run read it keeps the final penalty its return set.
+    """
+    if not len(ids):
+        return
+    quote = connection.ops.quote_name
+    sql = (
+        f'UPDATE {quote(Order._meta.db_table)} SET {quote("penalty")} = %s '
+        f'WHERE {quote("id")} = %s AND {quote("status")} = %s'
+    )
+    params = [(Decimal(int(value)).scaleb(-2), int(order_id), status) for order_id, value in zip(ids, cents)]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def recompute_open_penalties(as_of=None, batch_size=PENALTY_BATCH_SIZE, resume=True):
+    """
+    Recompute the running penalty of every open loan in id-ordered chunks,
+    writing only rows whose value changed. Progress is checkpointed after
+    each chunk; an interrupted run resumes from there with its original
+    ``as_of`` so every order in a run is charged against the same instant.
+    Returns ``(scanned, updated)``.
+    """
+    checkpoint, _ = TaskCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+    if not (resume and checkpoint.as_of and checkpoint.position):
+        checkpoint.as_of = as_of or datetime.now(dt_timezone.utc)
+        checkpoint.position = 0
+        checkpoint.save()
+
+    scanned = updated = 0
+    while True:
+        chunk = fetch_open_loans(checkpoint.position, batch_size)
+        if chunk is None:
+            break
+        ids, taken_us, price_cents, current_cents = chunk
+        cents = compute_penalty_cents(taken_us, price_cents, checkpoint.as_of)
+        changed = cents != current_cents
+
+        with transaction.atomic():
+            write_penalties(ids[changed], cents[changed], OrderStatus.TAKEN)
+            checkpoint.position = int(ids[-1])
+            checkpoint.save(update_fields=['position', 'updated_at'])
+        scanned += len(ids)
+        updated += int(changed.sum())
+
+    checkpoint.position = 0
+    checkpoint.save(update_fields=['position', 'updated_at'])
+    return scanned, updated
+
+
+def apply_return_penalties(order_ids, returned_at):
+    """Fix the final penalty of just-returned orders. Returns ``{order_id: Decimal}``."""
+    import numpy as np
+
+    rows = list(
+        Order.objects.filter(id__in=order_ids, taken_at__isnull=False)
+        .values_list('id', 'taken_at', 'book__daily_price')
+    )
+    if not rows:
+        return {}
+    ids, taken_at, prices = zip(*rows)
+    cents = compute_penalty_cents(
+        np.fromiter(map(to_microseconds, taken_at), dtype=np.int64, count=len(rows)),
+        np.fromiter(map(to_cents, prices), dtype=np.int64, count=len(rows)),
+        returned_at,
+    )
+    write_penalties(ids, cents, OrderStatus.RETURNED)
+    return {order_id: Decimal(int(value)).scaleb(-2) for order_id, value in zip(ids, cents)}
@@ -5,6 +5,11 @@ class RoleBasedPermission(permissions.BasePermission):
     def __init__(self, allowed_roles=None):
         self.allowed_roles = allowed_roles if allowed_roles is not None else []
 
+    def __call__(self):
+        # Views list configured instances in ``permission_classes``; DRF
+        # instantiates each entry per request, so hand back the instance.
+        return self
+
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
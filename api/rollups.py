@@ -0,0 +1,164 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Book, DailyBookStats, Order, OrderStatus
+
+COUNTERS = ('orders', 'pickups', 'returns', 'cancellations', 'loan_seconds')
+
+
+def upsert_sql():
+    quote = connection.ops.quote_name
+    table = quote(DailyBookStats._meta.db_table)
+    columns = ['day', 'book_id', *COUNTERS]
+    assignments = ', '.join(f'{quote(name)} = {table}.{quote(name)} + EXCLUDED.{quote(name)}' for name in COUNTERS)
+    return (
+        f'INSERT INTO {table} ({", ".join(quote(name) for name in columns)}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({quote("day")}, {quote("book_id")}) DO UPDATE SET {assignments}'
+    )
+
+
+def record(deltas):
+    """
+    Add ``{(day, book_id): {counter: amount}}`` to the rollups with one
+    prepared INSERT ... ON CONFLICT DO UPDATE, so concurrent writers add up
+    instead of overwriting each other.
+    """
+    params = [
+        [day, book_id, *(counts.get(name, 0) for name in COUNTERS)]
+        for (day, book_id), counts in deltas.items()
+        if any(counts.values())
+    ]
+    if not params:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(upsert_sql(), params)
+
+
+def record_counts(counter, book_counts, when=None):
+    """Add ``{book_id: n}`` to one counter for the day of ``when`` (default today)."""
+    day = timezone.localdate(when) if when is not None else timezone.localdate()
+    record({(day, book_id): {counter: count} for book_id, count in book_counts.items()})
+
+
+def record_returns(rows, returned_at):
+    """Count returns and their loan time from ``[(book_id, taken_at), ...]``."""
+    day = timezone.localdate(returned_at)
+    deltas = defaultdict(lambda: defaultdict(int))
+    for book_id, taken_at in rows:
+        deltas[(day, book_id)]['returns'] += 1
+        if taken_at is not None:
+            deltas[(day, book_id)]['loan_seconds'] += int((returned_at - taken_at).total_seconds())
+    record(deltas)
+
+
+def record_cancellations(rows, ttl):
+    """
+    Count cancelled reservations from ``[(book_id, order_date), ...]``. Each is
+    dated when its reservation ran out, ``order_date + ttl``, not when the
+    expiry task got to it, so :func:`backfill` can reproduce the same days.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for book_id, order_date in rows:
+        deltas[(timezone.localdate(order_date + ttl), book_id)]['cancellations'] += 1
+    record(deltas)
+
+
+def backfill(start=None, end=None, chunk_size=5000):
+    """
+    Rebuild the rollups for ``[start, end]`` (local dates, inclusive; whole
+    history when omitted) from the raw orders, ``chunk_size`` orders at a
+    time so memory stays flat however long the history. Cancellations are
+    dated as :func:`record_cancellations` dates them. Returns the number of
+    rollup rows in the range afterwards.
+    """
+    from .tasks import get_reservation_ttl
+
+    ttl = get_reservation_ttl()
+    tz = timezone.get_current_timezone()
+    deltas = defaultdict(lambda: defaultdict(int))
+
+    def in_range(day):
+        return (start is None or day >= start) and (end is None or day <= end)
+
+    def add(when, book_id, counter, amount=1):
+        day = when.astimezone(tz).date()
+        if in_range(day):
+            deltas[(day, book_id)][counter] += amount
+
+    orders = Order.objects.order_by('id')
+    if end is not None:
+        # Every event of an order happens on or after its order date.
+        orders = orders.filter(order_date__lt=local_midnight(end + timedelta(days=1)))
+    existing = DailyBookStats.objects.all()
+    if start is not None:
+        existing = existing.filter(day__gte=start)
+    if end is not None:
+        existing = existing.filter(day__lte=end)
+
+    with transaction.atomic():
+        existing.delete()
+        last_id = 0
+        while True:
+            rows = list(
+                orders.filter(id__gt=last_id)
+                .values_list('id', 'book_id', 'order_date', 'status', 'taken_at', 'returned_at')[:chunk_size]
+            )
+            if not rows:
+                break
+            for _, book_id, order_date, status, taken_at, returned_at in rows:
+                add(order_date, book_id, 'orders')
+                if taken_at is not None:
+                    add(taken_at, book_id, 'pickups')
+                if returned_at is not None:
+                    add(returned_at, book_id, 'returns')
+                    if taken_at is not None:
+                        add(returned_at, book_id, 'loan_seconds', int((returned_at - taken_at).total_seconds()))
+                if status == OrderStatus.CANCELLED:
+                    add(order_date + ttl, book_id, 'cancellations')
+            # The upsert adds to rows earlier chunks wrote.
+            record(deltas)
+            deltas.clear()
+            last_id = rows[-1][0]
+    return existing.count()
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def summed(queryset, group_by):
+    """Group ``queryset`` and sum every counter; annotations can't reuse field names."""
+    return queryset.values(group_by).annotate(**{f'total_{name}': Sum(name) for name in COUNTERS})
+
+
+def unprefix(row):
+    return {key[len('total_'):] if key.startswith('total_') else key: value for key, value in row.items()}
+
+
+def daily_totals(start, end):
+    """Library-wide counters for each day in ``[start, end]`` that had activity."""
+    rows = summed(DailyBookStats.objects.filter(day__gte=start, day__lte=end), 'day').order_by('day')
+    return [unprefix(row) for row in rows]
+
+
+def top_books(start, end, metric, limit):
+    """
+    Books ranked by ``metric`` over ``[start, end]``. Utilization is the share
+    of the period the title's copies spent on completed loans, with copies
+    counted as what is on the shelf plus what is out today.
+    """
+    period_seconds = ((end - start).days + 1) * 86400
+    rows = summed(DailyBookStats.objects.filter(day__gte=start, day__lte=end), 'book_id')
+    rows = [unprefix(row) for row in rows.order_by(f'-total_{metric}', 'book_id')[:limit]]
+    books = Book.objects.in_bulk([row['book_id'] for row in rows])
+    for row in rows:
+        book = books.get(row['book_id'])
+        copies = (book.quantity + book.active_loans) if book else 0
+        row['title'] = book.title if book else None
+        row['utilization'] = round(row['loan_seconds'] / (period_seconds * copies), 4) if copies else None
+    return rows
@@ -0,0 +1,163 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_KEY = 'db:pin:{}'
+
+
+class RoutingState:
+    """Per-request routing decision; reads use ``replica`` unless ``pinned``."""
+    __slots__ = ('replica', 'pinned', 'user_id')
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.pinned = replica is None
+        self.user_id = None
+
+
+_state = ContextVar('db_routing', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_pin_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+
+def begin_request(read_only):
+    """
+    Start routing a request. Only read-only requests may use a replica, and
+    each request sticks to one randomly chosen replica so its reads agree.
+    """
+    replicas = get_replicas()
+    replica = random.choice(replicas) if read_only and replicas else None
+    return _state.set(RoutingState(replica))
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+def set_user(user_id):
+    """Called on authentication: users who wrote recently read from the primary."""
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    if not state.pinned and get_pin_cache().get(PIN_KEY.format(user_id)):
+        state.pinned = True
+
+
+async def aset_user(user_id):
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    if not state.pinned and await get_pin_cache().aget(PIN_KEY.format(user_id)):
+        state.pinned = True
+
+
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def current_pin_key():
+    state = _state.get()
+    if state is None or state.user_id is None:
+        return None
+    return PIN_KEY.format(state.user_id)
+
+
+def pin_current_user():
+    """Keep the current user on the primary for REPLICA_PIN_SECONDS so they read their own writes."""
+    key = current_pin_key()
+    if key is not None:
+        get_pin_cache().set(key, True, get_pin_seconds())
+
+
+async def apin_current_user():
+    key = current_pin_key()
+    if key is not None:
+        await get_pin_cache().aset(key, True, get_pin_seconds())
+
+
+def reading_from_replica():
+    state = _state.get()
+    return state is not None and not state.pinned
+
+
+class ReplicaRouter:
+    """
+    Send reads made during read-only requests to a replica and everything
+    else (writes, unsafe requests, Celery tasks, management commands) to the
+    primary. Replicas are not migrated: they are copies of the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        state = _state.get()
+        if state is None or state.pinned:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route GET/HEAD/OPTIONS reads to a replica. A successful unsafe request
+    pins its user to the primary for a short window afterwards.
+    """
+    sync_capable = True
+    async_capable = True
+    read_only_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = begin_request(request.method in self.read_only_methods)
+        try:
+            response = self.get_response(request)
+            if self.wrote(request, response):
+                pin_current_user()
+            return response
+        finally:
+            end_request(token)
+
+    async def __acall__(self, request):
+        token = begin_request(request.method in self.read_only_methods)
+        try:
+            response = await self.get_response(request)
+            if self.wrote(request, response):
+                await apin_current_user()
+            return response
+        finally:
+            end_request(token)
+
+    def wrote(self, request, response):
+        return request.method not in self.read_only_methods and response.status_code < 400
@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+
+from django.conf import settings
+from drf_yasg import openapi
+from rest_framework import permissions
+
+# Hashed into the code version: a change to any of these regenerates the schema.
+SOURCE_DIRS = ('api', 'library')
+
+API_INFO = openapi.Info(
+    title="Library API",
+    default_version='v1',
+    description="API for Library Management",
+    terms_of_service="https://www.example.com/terms/",
+    contact=openapi.Contact(email="contact@example.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+
+class SchemaArtifact:
+    """The rendered OpenAPI document for one code version, kept gzipped."""
+
+    def __init__(self, version, gzipped):
+        self.version = version
+        self.gzipped = gzipped
+        self.etag = f'"{version}"'
+        self._body = None
+
+    @property
+    def body(self):
+        # Only clients that do not accept gzip need the plain bytes.
+        if self._body is None:
+            self._body = gzip.decompress(self.gzipped)
+        return self._body
+
+
+_lock = threading.Lock()
+_artifact = None
+
+
+@lru_cache(maxsize=None)
+def get_code_version():
+    """``OPENAPI_CODE_VERSION`` if set (e.g. the release SHA), else a hash of the project's source."""
+    explicit = getattr(settings, 'OPENAPI_CODE_VERSION', None)
+    if explicit:
+        return explicit
+    digest = hashlib.sha1(metadata.version('drf-yasg').encode())
+    base = Path(settings.BASE_DIR)
+    for directory in SOURCE_DIRS:
+        for path in sorted((base / directory).rglob('*.py')):
+            digest.update(path.relative_to(base).as_posix().encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def get_schema_dir():
+    return Path(getattr(settings, 'OPENAPI_SCHEMA_DIR', Path(settings.BASE_DIR) / 'var' / 'openapi'))
+
+
+def artifact_path(version):
+    return get_schema_dir() / f'openapi-{version}.json.gz'
+
+
+def render_schema():
+    """Walk every view once and return the OpenAPI document as JSON bytes."""
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    schema = OpenAPISchemaGenerator(API_INFO).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def write_artifact(version, gzipped):
+    """Write atomically, then drop artifacts left by older code versions."""
+    directory = get_schema_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    target = artifact_path(version)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(gzipped)
+    os.replace(tmp, target)
+    for stale in directory.glob('openapi-*.json.gz'):
+        if stale != target:
+            stale.unlink(missing_ok=True)
+    return target
+
+
+def build_artifact():
+    version = get_code_version()
+    gzipped = gzip.compress(render_schema(), compresslevel=9, mtime=0)
+    write_artifact(version, gzipped)
+    return SchemaArtifact(version, gzipped)
+
+
+def get_artifact():
+    """
+    The schema for the running code: from memory, else from the artifact
+    written by ``generate_schema`` or an earlier process, else generated now.
+    """
+    global _artifact
+    version = get_code_version()
+    artifact = _artifact
+    if artifact is not None and artifact.version == version:
+        return artifact
+    with _lock:
+        if _artifact is None or _artifact.version != version:
+            try:
+                _artifact = SchemaArtifact(version, artifact_path(version).read_bytes())
+            except FileNotFoundError:
+                _artifact = build_artifact()
+        return _artifact
+
+
+@lru_cache(maxsize=None)
+def get_ui_view(renderer):
+    from drf_yasg.views import get_schema_view
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    schema_view = get_schema_view(
+        API_INFO,
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+        authentication_classes=(JWTAuthentication,),
+    )
+    return schema_view.with_ui(renderer, cache_timeout=3600)
+
+
+def ui_view(renderer):
+    """The Swagger UI or ReDoc page, with its schema view built on the first request."""
+    def view(request, *args, **kwargs):
+        return get_ui_view(renderer)(request, *args, **kwargs)
+    return view
@@ -0,0 +1,91 @@
+import re
+
+from django.db import connection, connections, router
+
+from .models import Book
+
+FTS_TABLE = 'api_book_fts'
+
+# Title matches count for more than author matches when ranking.
+TITLE_WEIGHT = 10.0
+AUTHOR_WEIGHT = 1.0
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Keep the external-content index in step with api_book. SQLite drops these
+# whenever a migration rebuilds api_book, so such migrations must recreate
+# them (see 0007 and 0012).
+TRIGGER_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON api_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON api_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END
+    """,
+    # Stock changes are the hottest writes on api_book; only reindex when
+    # the searchable columns change.
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, author ON api_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+]
+REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')"
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """
+    Turn free text into an FTS5 query that ANDs every word as a prefix term.
+    Each token is quoted, so user input can never inject FTS5 operators.
+    """
+    tokens = TOKEN_RE.findall(text)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_book_ids(text, limit, after=None):
+    """
+    Return ``[(book_id, score), ...]`` best match first. ``after`` is the
+    ``(score, book_id)`` of the last row of the previous page.
+    """
+    match = build_match_query(text)
+    if not match:
+        return []
+
+    sql = (
+        f'SELECT rowid, bm25({FTS_TABLE}, %s, %s) AS score FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s'
+    )
+    params = [TITLE_WEIGHT, AUTHOR_WEIGHT, match]
+    if after is not None:
+        sql += ' AND (score > %s OR (score = %s AND rowid > %s))'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY score, rowid LIMIT %s'
+    params.append(limit)
+
+    with connections[router.db_for_read(Book)].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search_books(text, limit, after=None):
+    """Like :func:`search_book_ids` but returns ``[(book, score), ...]``."""
+    rows = search_book_ids(text, limit, after)
+    books = Book.objects.in_bulk([book_id for book_id, _ in rows])
+    return [(books[book_id], score) for book_id, score in rows if book_id in books]
+
+
+def rebuild_index():
+    """Recreate any missing sync triggers and rebuild the index from api_book."""
+    with connection.cursor() as cursor:
+        for statement in [*TRIGGER_SQL, REBUILD_SQL]:
+            cursor.execute(statement)
+
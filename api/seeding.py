@@ -0,0 +1,248 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import connection, transaction
+
+from . import hashing, penalties, rollups, stats
+from .models import Book, DailyBookStats, Order, OrderStatus, TaskCheckpoint, User, UserRole, WaitlistEntry
+from .tasks import get_reservation_ttl
+
+SEED_BATCH_SIZE = 100000
+
+WORDS = (
+    'river', 'shadow', 'garden', 'empire', 'winter', 'silver', 'ocean', 'forest', 'machine', 'letter',
+    'night', 'city', 'stone', 'island', 'mirror', 'harvest', 'storm', 'glass', 'signal', 'journey',
+    'crown', 'desert', 'lantern', 'orchard', 'bridge', 'violin', 'harbor', 'falcon', 'meadow', 'atlas',
+)
+FIRST_NAMES = ('Aziz', 'Maria', 'Kenji', 'Olga', 'Chinua', 'Lucia', 'Erik', 'Dilnoza', 'Wei', 'Claire')
+SURNAMES = ('Karimova', 'Smith', 'Ito', 'Novak', 'Okafor', 'Garcia', 'Larsen', 'Rahimov', 'Chen', 'Dubois')
+
+# Share of the order history in each status and of returned loans that get rated.
+STATUS_MIX = (
+    (OrderStatus.RETURNED, 0.80),
+    (OrderStatus.CANCELLED, 0.08),
+    (OrderStatus.TAKEN, 0.08),
+    (OrderStatus.BOOKED, 0.04),
+)
+RATED_SHARE = 0.6
+RATING_MIX = (0.02, 0.03, 0.05, 0.15, 0.35, 0.40)
+# Loan counts per book fall off as rank ** -POPULARITY_SKEW.
+POPULARITY_SKEW = 0.8
+
+HOUR_US = timedelta(hours=1) // penalties.ONE_MICROSECOND
+ORDER_FIELDS = ['user_id', 'book_id', 'order_date', 'status', 'taken_at', 'returned_at', 'penalty', 'rating']
+
+
+class SeedReport:
+    def __init__(self):
+        self.users = 0
+        self.books = 0
+        self.orders = 0
+
+
+def cumulative(weights):
+    cdf = np.cumsum(np.asarray(weights, dtype=np.float64))
+    return cdf / cdf[-1]
+
+
+def pick(rng, cdf, size):
+    return np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), len(cdf) - 1)
+
+
+def to_timestamps(micros, present):
+    """UTC microseconds to the naive ``YYYY-MM-DD HH:MM:SS.ffffff`` text Django stores, None where absent."""
+    text = np.char.replace(np.datetime_as_string(micros.astype('datetime64[us]'), unit='us'), 'T', ' ')
+    return np.where(present, text.astype(object), None)
+
+
+def insert_users(count, operators, password, seed, batch_size):
+    """Bulk-create ``operators`` operator accounts and ``count`` readers sharing one password hash."""
+    hashed = hashing.make_password(password)
+    users = [
+        User(username=f'operator{seed}-{i}', role=UserRole.OPERATOR, password=hashed, is_staff=True)
+        for i in range(operators)
+    ]
+    users += [
+        User(
+            username=f'reader{seed}-{i}', role=UserRole.USER, password=hashed,
+            first_name=FIRST_NAMES[i % len(FIRST_NAMES)], last_name=SURNAMES[i // len(FIRST_NAMES) % len(SURNAMES)],
+        )
+        for i in range(count)
+    ]
+    User.objects.bulk_create(users, batch_size=batch_size)
+    return len(users)
+
+
+def insert_books(count, rng, batch_size):
+    titles = rng.integers(0, len(WORDS), (count, 2))
+    authors = rng.integers(0, len(SURNAMES) * len(FIRST_NAMES), count)
+    quantities = rng.integers(1, 11, count)
+    prices = rng.choice(np.array([0, 50, 100, 200]), count)
+    for start in range(0, count, batch_size):
+        stop = min(start + batch_size, count)
+        Book.objects.bulk_create([
+            Book(
+                title=f'{WORDS[titles[i, 0]].title()} {WORDS[titles[i, 1]]} {i}',
+                author=f'{FIRST_NAMES[authors[i] % len(FIRST_NAMES)]} {SURNAMES[authors[i] // len(FIRST_NAMES)]}',
+                quantity=int(quantities[i]),
+                daily_price=Decimal(int(prices[i])).scaleb(-2),
+            )
+            for i in range(start, stop)
+        ])
+    return count
+
+
+def generate_orders(rng, size, user_ids, book_ids, book_cdf, price_cents, end_us, history_us):
+    """One batch of synthetic orders as parameter tuples for :data:`ORDER_FIELDS`."""
+    statuses = np.array([status.value for status, _ in STATUS_MIX], dtype=object)[pick(rng, cumulative([w for _, w in STATUS_MIX]), size)]
+    booked = statuses == OrderStatus.BOOKED
+    taken = statuses == OrderStatus.TAKEN
+    returned = statuses == OrderStatus.RETURNED
+    picked_up = taken | returned
+
+    loan_us = penalties.get_loan_period() // penalties.ONE_MICROSECOND
+    ttl_us = get_reservation_ttl() // penalties.ONE_MICROSECOND
+    # Open reservations are younger than the expiry window and open loans
+    # span up to two loan periods, so some of them are overdue.
+    age = rng.random(size) * history_us
+    age[booked] = rng.random(booked.sum()) * ttl_us
+    age[taken] = 21 * HOUR_US + rng.random(taken.sum()) * 2 * loan_us
+    ordered = end_us - age.astype(np.int64)
+    pickup = ordered + (HOUR_US // 2 + rng.random(size) * 20 * HOUR_US).astype(np.int64)
+    back = np.minimum(pickup + (penalties.DAY_US + rng.random(size) * 1.5 * loan_us).astype(np.int64), end_us)
+
+    book_index = pick(rng, book_cdf, size)
+    overdue_days = np.maximum((back - pickup - loan_us) // penalties.DAY_US, 0)
+    penalty = np.where(returned, overdue_days * price_cents[book_index], 0) / 100
+
+    rated = returned & (rng.random(size) < RATED_SHARE)
+    ratings = np.where(rated, pick(rng, cumulative(RATING_MIX), size).astype(object), None)
+
+    return list(zip(
+        user_ids[rng.integers(0, len(user_ids), size)].tolist(),
+        book_ids[book_index].tolist(),
+        to_timestamps(ordered, np.ones(size, dtype=bool)).tolist(),
+        statuses.tolist(),
+        to_timestamps(pickup, picked_up).tolist(),
+        to_timestamps(back, returned).tolist(),
+        penalty.tolist(),
+        ratings.tolist(),
+    ))
+
+
+def secondary_indexes(table):
+    """``[(name, create_sql)]`` for the indexes on ``table`` that are not backing a constraint."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL", [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s "
+                "AND indexname NOT IN (SELECT conname FROM pg_constraint)", [table],
+            )
+        else:
+            return []
+        return cursor.fetchall()
+
+
+@contextmanager
+def deferred_indexes(table):
+    """Drop the secondary indexes on ``table`` for the duration of a bulk load and rebuild them after."""
+    indexes = secondary_indexes(table)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {quote(name)}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for _, sql in indexes:
+                cursor.execute(sql)
+
+
+@contextmanager
+def bulk_load_settings():
+    """On SQLite, skip fsyncs while loading; a crash mid-seed only loses generated data."""
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA synchronous')
+        previous = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous = OFF')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA synchronous = {int(previous)}')
+
+
+def insert_orders(count, seed, end, history, batch_size, progress=None):
+    """
+    Generate ``count`` orders in batches of ``batch_size``, one prepared
+    INSERT per batch. Each batch draws from its own ``(seed, batch)`` stream,
+    so the same arguments always produce the same rows.
+    """
+    user_ids = np.fromiter(User.objects.filter(role=UserRole.USER).order_by('id').values_list('id', flat=True), dtype=np.int64)
+    books = list(Book.objects.order_by('id').values_list('id', 'daily_price'))
+    if not len(user_ids) or not books:
+        return 0
+    book_ids = np.array([book_id for book_id, _ in books], dtype=np.int64)
+    price_cents = np.array([penalties.to_cents(price) for _, price in books], dtype=np.int64)
+
+    # Popularity follows rank, and ranks are shuffled over the catalog.
+    rng = np.random.default_rng([seed, 1])
+    order = rng.permutation(len(book_ids))
+    book_ids, price_cents = book_ids[order], price_cents[order]
+    book_cdf = cumulative(np.arange(1, len(book_ids) + 1, dtype=np.float64) ** -POPULARITY_SKEW)
+
+    end_us = penalties.to_microseconds(end)
+    history_us = history // penalties.ONE_MICROSECOND
+    quote = connection.ops.quote_name
+    sql = (
+        f'INSERT INTO {quote(Order._meta.db_table)} ({", ".join(quote(field) for field in ORDER_FIELDS)}) '
+        f'VALUES ({", ".join(["%s"] * len(ORDER_FIELDS))})'
+    )
+    written = 0
+    for batch, start in enumerate(range(0, count, batch_size), start=2):
+        size = min(batch_size, count - start)
+        rows = generate_orders(np.random.default_rng([seed, batch]), size, user_ids, book_ids, book_cdf, price_cents, end_us, history_us)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        written += size
+        if progress:
+            progress(written)
+    return written
+
+
+def flush():
+    """Delete generated data: orders, waitlists, rollups, checkpoints, books and every non-superuser account."""
+    quote = connection.ops.quote_name
+    with bulk_load_settings(), transaction.atomic():
+        # Plain DELETEs: collecting millions of orders for cascades would not fit in memory.
+        with connection.cursor() as cursor:
+            for model in (DailyBookStats, TaskCheckpoint, WaitlistEntry, Order, Book):
+                cursor.execute(f'DELETE FROM {quote(model._meta.db_table)}')
+        User.objects.filter(is_superuser=False).delete()
+
+
+def seed_library(users, operators, books, orders, seed, end, history, password, batch_size=SEED_BATCH_SIZE, progress=None):
+    """
+    Build a deterministic synthetic library. Orders are loaded with the
+    order table's secondary indexes dropped; the indexes, book aggregates
+    and rollups are rebuilt once at the end.
+    """
+    report = SeedReport()
+    with bulk_load_settings():
+        report.users = insert_users(users, operators, password, seed, batch_size)
+        report.books = insert_books(books, np.random.default_rng([seed, 0]), batch_size)
+        with deferred_indexes(Order._meta.db_table):
+            report.orders = insert_orders(orders, seed, end, history, batch_size, progress)
+        stats.reconcile()
+        rollups.backfill()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return report
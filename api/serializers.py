@@ -1,10 +1,8 @@
 from datetime import timezone
 
 from rest_framework import serializers
-from .models import User, Book, Order, UserRole, OrderStatus
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .models import User, Book, Order, UserRole, OrderStatus, WaitlistEntry
+from . import hashing
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -27,17 +25,17 @@ class UserCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = User(
             username=validated_data['username'],
-            role=validated_data['role']
+            role=validated_data['role'],
+            password=hashing.make_password(validated_data['password']),
         )
-        user.set_password(validated_data['password'])  
         user.save()
-        print(f"User created: {user.username}, hashed password: {user.password}")  
         return user
 
 class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
-        fields = ['id', 'title', 'author', 'quantity']
+        fields = ['id', 'title', 'author', 'quantity', 'rating_count', 'avg_rating', 'total_loans', 'active_loans']
+        read_only_fields = ['rating_count', 'avg_rating', 'total_loans', 'active_loans']
 
 class OrderCreateSerializer(serializers.ModelSerializer):
     book_id = serializers.IntegerField(write_only=True)  
@@ -64,11 +62,53 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         return order
 
 class OrderSerializer(serializers.ModelSerializer):
+    """
+    ``fields`` keeps only the named fields, and relations listed in
+    ``expand`` are nested in full instead of as ids.
+    """
+    expandable = {'book': BookSerializer}
+
     class Meta:
         model = Order
         fields = ['id', 'book', 'user', 'order_date', 'status', 'taken_at', 'returned_at', 'penalty', 'rating']
 
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            self.fields[name] = self.expandable[name](read_only=True)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def shape_queryset(cls, orders, fields=None, expand=(), extra=()):
+        """
+        Select only the columns behind ``fields`` (plus ``extra``, such as the
+        pagination keys) and join the ``expand``ed relations into the same
+        query, so a page costs one query at any page size.
+        """
+        fields = cls.Meta.fields if fields is None else fields
+        columns = {'id', *fields, *extra}
+        for name in expand:
+            if name in fields:
+                orders = orders.select_related(name)
+                columns.update(f'{name}__{field}' for field in cls.expandable[name].Meta.fields)
+        return orders.only(*columns)
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    position = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ['book', 'created_at', 'position']
+
 
 class OrderAddRatingSerializer(serializers.Serializer):
     rating = serializers.IntegerField(min_value=0, max_value=5)
 
+
+class OrderBatchSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500
+    )
@@ -0,0 +1,19 @@
+from importlib import import_module
+
+from django.contrib.auth import hashers
+from django.urls import get_resolver
+
+
+def preload():
+    """
+    Import at boot what a lean process defers to first use: every view, the
+    OpenAPI schema generator, the Celery tasks, numpy for the penalty maths
+    and the default password hasher's library.
+    """
+    get_resolver().url_patterns
+    import_module('drf_yasg.generators')
+    import_module('api.tasks')
+    import_module('numpy')
+    hasher = hashers.get_hasher()
+    if hasher.library:
+        hasher._load_library()
@@ -0,0 +1,74 @@
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from .cache import catalog_changed
+from .models import Book, Order, OrderStatus
+
+
+def per_book(book_counts):
+    """CASE expression mapping each book id to its count, 0 for any other row."""
+    return Case(
+        *[When(id=book_id, then=Value(count)) for book_id, count in book_counts.items()],
+        default=Value(0),
+    )
+
+
+def record_loans_started(book_counts):
+    """Count ``{book_id: loans}`` newly taken out, in a single UPDATE."""
+    if not book_counts:
+        return
+    delta = per_book(book_counts)
+    Book.objects.filter(id__in=book_counts).update(
+        total_loans=F('total_loans') + delta,
+        active_loans=F('active_loans') + delta,
+    )
+    catalog_changed()
+
+
+def record_loans_ended(book_counts):
+    """Count ``{book_id: loans}`` brought back, in a single UPDATE."""
+    if not book_counts:
+        return
+    Book.objects.filter(id__in=book_counts).update(active_loans=F('active_loans') - per_book(book_counts))
+    catalog_changed()
+
+
+def record_rating(book_id, rating, previous=None):
+    """
+    Fold a new rating into the book's running totals. When ``previous`` is
+    given the order was already rated and only the sum changes.
+    """
+    added = 0 if previous is not None else 1
+    delta = rating - (previous or 0)
+    # Every right-hand side sees the pre-update row, so avg_rating is computed
+    # from the same totals the other two columns are moving away from.
+    Book.objects.filter(id=book_id).update(
+        rating_sum=F('rating_sum') + delta,
+        rating_count=F('rating_count') + added,
+        avg_rating=Cast(F('rating_sum') + delta, FloatField()) / (F('rating_count') + added),
+    )
+    catalog_changed()
+
+
+def reconcile():
+    """Recompute every book's aggregates from the order table in one UPDATE."""
+    def aggregate(expression, condition, default=0):
+        return Coalesce(
+            Subquery(
+                Order.objects.filter(condition, book=OuterRef('pk'))
+                .order_by()
+                .values('book')
+                .annotate(value=expression)
+                .values('value')
+            ),
+            Value(default),
+        )
+
+    rated = Q(rating__isnull=False)
+    return Book.objects.update(
+        rating_count=aggregate(Count('id'), rated),
+        rating_sum=aggregate(Sum('rating'), rated),
+        avg_rating=aggregate(Avg(Cast('rating', FloatField())), rated, default=0.0),
+        total_loans=aggregate(Count('id'), Q(status__in=[OrderStatus.TAKEN, OrderStatus.RETURNED])),
+        active_loans=aggregate(Count('id'), Q(status=OrderStatus.TAKEN)),
+    )
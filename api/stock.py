@@ -0,0 +1,29 @@
+from django.db.models import Case, F, Value, When
+
+from .cache import catalog_changed
+from .events import stock_changed
+from .models import Book
+
+
+def adjust_stock(book_counts, sign):
+    """Add ``sign * copies`` to each book in ``{book_id: copies}`` with a single UPDATE."""
+    if not book_counts:
+        return
+    Book.objects.filter(id__in=book_counts).update(
+        quantity=F('quantity') + sign * Case(
+            *[When(id=book_id, then=Value(count)) for book_id, count in book_counts.items()],
+            default=Value(0),
+        )
+    )
+    catalog_changed()
+    stock_changed(book_counts)
+
+
+def restock(book_counts):
+    """Give ``{book_id: copies}`` back to stock in a single UPDATE."""
+    adjust_stock(book_counts, 1)
+
+
+def unstock(book_counts):
+    """Take ``{book_id: copies}`` out of stock in a single UPDATE."""
+    adjust_stock(book_counts, -1)
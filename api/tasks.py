@@ -1,14 +1,111 @@
+import logging
+import time
+from collections import Counter
+
 from celery import shared_task
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.db import connection
 from django.utils import timezone
 from .models import Order, OrderStatus
+from .stock import restock
+from .db import write_transaction
+from . import penalties
+from . import rollups
+from . import metrics
+from . import waitlist
 from datetime import timedelta
 
+logger = logging.getLogger(__name__)
+
+task_started = {}
+
+EXPIRY_BATCH_SIZE = 1000
+
+
+def get_reservation_ttl():
+    return getattr(settings, 'ORDER_RESERVATION_TTL', timedelta(days=1))
+
+
+def cancel_booked(order_ids):
+    """
+    Cancel whichever of ``order_ids`` are still BOOKED with one UPDATE and
+    return the ``(id, book_id)`` rows it actually changed.
+    """
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(order_ids))
+    sql = (
+        f'UPDATE {quote(Order._meta.db_table)} SET {quote("status")} = %s '
+        f'WHERE {quote("id")} IN ({placeholders}) AND {quote("status")} = %s '
+        f'RETURNING {quote("id")}, {quote("book_id")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [OrderStatus.CANCELLED, *order_ids, OrderStatus.BOOKED])
+        return cursor.fetchall()
+
+
+def cancel_expired_batch(cutoff, after_id=0, batch_size=EXPIRY_BATCH_SIZE):
+    """
+    Cancel up to ``batch_size`` reservations made before ``cutoff`` with ids
+    above ``after_id`` and return their copies to stock or to the next user
+    on the book's waitlist, all in one short transaction. Returns
+    ``(cancelled, last_id)``; ``last_id`` is None when there is nothing left
+    to scan.
+    """
+    with write_transaction():
+        rows = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(status=OrderStatus.BOOKED, order_date__lt=cutoff, id__gt=after_id)
+            .order_by('id')
+            .values_list('id', 'book_id', 'order_date')[:batch_size]
+        )
+        if not rows:
+            return 0, None
+
+        # Count only the rows the UPDATE changed: one that was accepted since
+        # the SELECT must not put a copy back.
+        cancelled = cancel_booked([order_id for order_id, _, _ in rows])
+        book_counts = Counter(book_id for _, book_id in cancelled)
+        order_dates = {order_id: order_date for order_id, _, order_date in rows}
+        restock(book_counts)
+        rollups.record_cancellations(
+            [(book_id, order_dates[order_id]) for order_id, book_id in cancelled], get_reservation_ttl()
+        )
+        waitlist.allocate(book_counts)
+    return len(cancelled), rows[-1][0]
+
+
+@shared_task
+def cancel_expired_orders(batch_size=EXPIRY_BATCH_SIZE):
+    cutoff = timezone.now() - get_reservation_ttl()
+    total = 0
+    last_id = 0
+    while last_id is not None:
+        cancelled, last_id = cancel_expired_batch(cutoff, last_id, batch_size)
+        total += cancelled
+    logger.info("Cancelled %d expired orders.", total)
+    return total
+
+
 @shared_task
-def cancel_expired_orders():
-    orders = Order.objects.filter(status=OrderStatus.BOOKED.value)
-    now = timezone.now()
-    for order in orders:
-        if order.booked_at + timedelta(days=1) < now:
-            order.status = OrderStatus.CANCELLED.value
-            print(f"Order {order.id} cancelled due to timeout.")
-            order.save()
\ No newline at end of file
+def compute_order_penalties(batch_size=penalties.PENALTY_BATCH_SIZE):
+    scanned, updated = penalties.recompute_open_penalties(batch_size=batch_size)
+    logger.info("Recomputed penalties for %d open loans, %d changed.", scanned, updated)
+    return {'scanned': scanned, 'updated': updated}
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    if task is not None and task.name in metrics.TRACKED_TASKS:
+        task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_metrics(task_id=None, task=None, retval=None, state=None, **kwargs):
+    started = task_started.pop(task_id, None)
+    if started is None:
+        return
+    try:
+        metrics.record_task(task.name, state, time.perf_counter() - started, retval)
+    except Exception:
+        logger.exception("Could not record metrics for %s.", task.name)
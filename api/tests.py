@@ -1,3 +1,1143 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import random
+import sqlite3
+import tempfile
+import threading
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_login_failed
+from django.db import connection
+from django.db.models import F
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import events
+from . import hashing
+from . import importer
+from . import metrics
+from . import penalties
+from . import rollups
+from . import routers
+from . import schema
+from . import search
+from . import seeding
+from . import stats
+from . import tasks
+from .authentication import add_role_claims
+from .models import Book, DailyBookStats, Order, OrderStatus, User, UserRole, WaitlistEntry
+from .pagination import BookPagination
+from .serializers import BookSerializer
+from .tasks import cancel_expired_batch
+from .views import OrderExportView
+
+
+def bearer(user):
+    token = add_role_claims(RefreshToken.for_user(user), user).access_token
+    return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Assertions are written against SQLite EXPLAIN QUERY PLAN output')
+class QueryPlanTests(TestCase):
+    """Keep the hot queries on an index instead of a full table scan."""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan, plan)
+        self.assertNotRegex(plan, r'SCAN api_(order|book)\b(?! USING)', plan)
+
+    def test_order_list_by_status(self):
+        orders = Order.objects.filter(status=OrderStatus.BOOKED).order_by('-order_date', '-id')
+        self.assertUsesIndex(orders, 'order_status_date_idx')
+
+    def test_order_list_newest_first(self):
+        orders = Order.objects.order_by('-order_date', '-id')[:50]
+        self.assertUsesIndex(orders, 'order_date_id_idx')
+
+    def test_expiry_sweep(self):
+        orders = (
+            Order.objects.filter(status=OrderStatus.BOOKED, order_date__lt=timezone.now(), id__gt=0)
+            .order_by('id')
+            .values_list('id', 'book_id')[:1000]
+        )
+        self.assertUsesIndex(orders, 'order_status_date_idx')
+
+    def test_orders_by_user_and_status(self):
+        orders = Order.objects.filter(user_id=1, status=OrderStatus.TAKEN)
+        self.assertUsesIndex(orders, 'order_user_status_idx')
+
+    def test_my_orders_newest_first(self):
+        orders = Order.objects.filter(user_id=1).order_by('-order_date', '-id')[:50]
+        self.assertUsesIndex(orders, 'order_user_date_idx')
+
+    def test_orders_by_book_and_status(self):
+        orders = Order.objects.filter(book_id=1, status=OrderStatus.TAKEN)
+        self.assertUsesIndex(orders, 'order_book_status_idx')
+
+    def test_book_natural_key_lookup(self):
+        books = Book.objects.filter(title='Dune', author='Frank Herbert')
+        # SQLite names the index behind the book_title_author_uniq constraint.
+        self.assertUsesIndex(books, 'sqlite_autoindex_api_book_1')
+
+    def test_books_by_author(self):
+        books = Book.objects.filter(author='Frank Herbert')
+        self.assertUsesIndex(books, 'book_author_idx')
+
+    def test_books_by_rating(self):
+        books = Book.objects.order_by('-avg_rating', 'id')[:50]
+        self.assertUsesIndex(books, 'book_avg_rating_idx')
+
+    def test_books_by_popularity(self):
+        books = Book.objects.order_by('total_loans', '-id')[:50]
+        self.assertUsesIndex(books, 'book_total_loans_idx')
+
+
+@skipUnless(search.is_available(), 'Full-text search needs SQLite FTS5')
+class BookSearchTests(TestCase):
+
+    def setUp(self):
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+
+    def search(self, text):
+        response = self.client.get('/api/v1/books/search/', {'q': text}, **bearer(self.operator))
+        self.assertEqual(response.status_code, 200)
+        return [book['title'] for book in response.json()['results']]
+
+    def test_index_triggers_survive_migrations(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'api_book' ORDER BY name")
+            triggers = [name for name, in cursor.fetchall()]
+        self.assertEqual(triggers, [f'{search.FTS_TABLE}_ad', f'{search.FTS_TABLE}_ai', f'{search.FTS_TABLE}_au'])
+
+    def test_index_follows_create_update_and_delete(self):
+        book = {'title': 'Dune', 'author': 'Frank Herbert', 'quantity': 1}
+        book_id = self.client.post('/api/v1/books/', book, content_type='application/json', **bearer(self.operator)).json()['id']
+        self.assertEqual(self.search('dune'), ['Dune'])
+        self.assertEqual(self.search('herb'), ['Dune'])
+
+        book['title'] = 'Dune Messiah'
+        self.client.put(f'/api/v1/books/{book_id}/', book, content_type='application/json', **bearer(self.operator))
+        self.assertEqual(self.search('messiah'), ['Dune Messiah'])
+
+        self.client.delete(f'/api/v1/books/{book_id}/', **bearer(self.operator))
+        self.assertEqual(self.search('dune'), [])
+
+    def test_title_matches_rank_above_author_matches(self):
+        Book.objects.create(title='Conversations', author='Dune Scholar')
+        Book.objects.create(title='Dune', author='Frank Herbert')
+        self.assertEqual(self.search('dune'), ['Dune', 'Conversations'])
+
+    def test_operators_and_quotes_are_matched_as_words(self):
+        Book.objects.create(title='Dune', author='Frank Herbert')
+        self.assertEqual(search.build_match_query('du"ne OR title:x*'), '"du"* "ne"* "OR"* "title"* "x"*')
+        for text in ('dune OR messiah', 'dune NOT herbert', 'title:dune', 'NEAR(dune herbert)', 'du"ne'):
+            self.assertEqual(self.search(text), [], text)
+        self.assertEqual(self.search('"dune" *'), ['Dune'])
+        self.assertEqual(self.search('"'), [])
+
+
+class BookStatsTests(TestCase):
+
+    def setUp(self):
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+        self.readers = [User.objects.create(username=f'reader{i}', role=UserRole.USER) for i in range(2)]
+        self.books = Book.objects.bulk_create(Book(title=f'Book {i}', author='Author', quantity=2) for i in range(3))
+
+    def stats(self, book):
+        book.refresh_from_db()
+        return (book.total_loans, book.active_loans, book.rating_count, book.rating_sum, book.avg_rating)
+
+    def rate(self, user, order_id, rating):
+        response = self.client.post(
+            f'/api/v1/orders/{order_id}/rate/', {'rating': rating}, content_type='application/json', **bearer(user)
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def returned_order(self, user, book):
+        return Order.objects.create(
+            user=user, book=book, status=OrderStatus.RETURNED, taken_at=timezone.now(), returned_at=timezone.now()
+        )
+
+    def test_order_lifecycle_updates_aggregates(self):
+        book = self.books[0]
+        order_ids = [
+            self.client.post('/api/v1/orders/', {'book_id': book.id}, content_type='application/json', **bearer(reader)).json()['id']
+            for reader in self.readers
+        ]
+        self.client.post(f'/api/v1/orders/{order_ids[0]}/accept/', **bearer(self.operator))
+        self.client.post('/api/v1/orders/accept/', {'order_ids': order_ids[1:]}, content_type='application/json', **bearer(self.operator))
+        self.assertEqual(self.stats(book), (2, 2, 0, 0, 0.0))
+
+        self.client.post(f'/api/v1/orders/{order_ids[0]}/return/', **bearer(self.operator))
+        self.client.post('/api/v1/orders/return/', {'order_ids': order_ids[1:]}, content_type='application/json', **bearer(self.operator))
+        self.assertEqual(self.stats(book), (2, 0, 0, 0, 0.0))
+
+        self.rate(self.readers[0], order_ids[0], 4)
+        self.rate(self.readers[1], order_ids[1], 2)
+        self.assertEqual(self.stats(book), (2, 0, 2, 6, 3.0))
+        # Rating again replaces the earlier rating instead of adding one.
+        self.rate(self.readers[1], order_ids[1], 5)
+        self.assertEqual(self.stats(book), (2, 0, 2, 9, 4.5))
+
+    def test_books_are_listed_by_average_rating(self):
+        for book, rating in zip(self.books, (3, 5)):
+            self.rate(self.readers[0], self.returned_order(self.readers[0], book).id, rating)
+
+        response = self.client.get('/api/v1/books/', {'ordering': '-avg_rating'}, **bearer(self.readers[0]))
+        self.assertEqual(
+            [row['id'] for row in response.json()['results']],
+            [self.books[1].id, self.books[0].id, self.books[2].id],
+        )
+
+    def test_reconcile_repairs_drifted_aggregates(self):
+        for reader, rating in zip(self.readers, (1, 4)):
+            Order.objects.filter(id=self.returned_order(reader, self.books[0]).id).update(rating=rating)
+        Order.objects.create(user=self.readers[0], book=self.books[1], status=OrderStatus.TAKEN, taken_at=timezone.now())
+        Order.objects.create(user=self.readers[1], book=self.books[1])
+        Book.objects.update(total_loans=7, active_loans=-1, rating_count=3, rating_sum=2, avg_rating=0.5)
+
+        self.assertEqual(stats.reconcile(), 3)
+        self.assertEqual(self.stats(self.books[0]), (2, 0, 2, 5, 2.5))
+        self.assertEqual(self.stats(self.books[1]), (1, 1, 0, 0, 0.0))
+        self.assertEqual(self.stats(self.books[2]), (0, 0, 0, 0, 0.0))
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+        self.reader = User.objects.create(username='reader', role=UserRole.USER)
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert')
+
+    def walk(self, url, params, page_size):
+        ids = []
+        response = self.client.get(url, {**params, 'page_size': page_size}, **bearer(self.operator))
+        while True:
+            ids += [row['id'] for row in response.json()['results']]
+            if not response.json()['next']:
+                return ids
+            response = self.client.get(response.json()['next'], **bearer(self.operator))
+
+    def test_invalid_filter_values_are_rejected(self):
+        for params in ({'book': '\u00b2'}, {'user': 'abc'}, {'user': '-1'}, {'status': 'lost'}):
+            response = self.client.get('/api/v1/orders/list/', params, **bearer(self.operator))
+            self.assertEqual(response.status_code, 400, params)
+        response = self.client.get('/api/v1/orders/mine/', {'book': '\u00b2'}, **bearer(self.reader))
+        self.assertEqual(response.status_code, 400)
+
+    def test_order_pages_are_stable_under_inserts(self):
+        start = timezone.now()
+        orders = Order.objects.bulk_create(
+            Order(user=self.reader, book=self.book, order_date=start - timedelta(minutes=i)) for i in range(6)
+        )
+        first = self.client.get('/api/v1/orders/list/', {'page_size': 3}, **bearer(self.operator)).json()
+        self.assertEqual([row['id'] for row in first['results']], [order.id for order in orders[:3]])
+
+        # Newer orders land before the cursor and must not shift the next page.
+        Order.objects.bulk_create(
+            Order(user=self.reader, book=self.book, order_date=start + timedelta(minutes=i)) for i in range(1, 3)
+        )
+        second = self.client.get(first['next'], **bearer(self.operator)).json()
+        self.assertEqual([row['id'] for row in second['results']], [order.id for order in orders[3:]])
+        self.assertIsNone(second['next'])
+
+    async def test_tampered_cursor_is_not_found(self):
+        headers = await sync_to_async(bearer)(self.reader)
+        for url in ('/api/v1/books/', '/api/v1/orders/mine/'):
+            for cursor in ('not-base64!', 'e30', 'WyJ4Il0'):
+                response = await sync_to_async(self.client.get)(url, {'cursor': cursor}, **headers)
+                self.assertEqual(response.status_code, 404, (url, cursor))
+                response = await self.async_client.get(
+                    url.replace('/v1/', '/v1/async/'), {'cursor': cursor}, headers={'Authorization': headers['HTTP_AUTHORIZATION']},
+                )
+                self.assertEqual(response.status_code, 404, (url, cursor))
+
+    def test_equal_sort_keys_are_ordered_by_id(self):
+        now = timezone.now()
+        orders = Order.objects.bulk_create(Order(user=self.reader, book=self.book, order_date=now) for _ in range(5))
+        ids = self.walk('/api/v1/orders/list/', {}, page_size=2)
+        self.assertEqual(ids, sorted((order.id for order in orders), reverse=True))
+
+        books = Book.objects.bulk_create(Book(title=f'Book {i}', author='Author', avg_rating=4.0) for i in range(5))
+        ids = self.walk('/api/v1/books/', {'ordering': '-avg_rating'}, page_size=2)
+        self.assertEqual(ids, [book.id for book in books] + [self.book.id])
+
+
+@override_settings(PASSWORD_BCRYPT_ROUNDS=4)
+class HashingPoolTests(TestCase):
+
+    def setUp(self):
+        self.pool = hashing.HashingPool(workers=1, queue_size=1)
+        self.addCleanup(self.pool.executor.shutdown)
+        pool = mock.patch.object(hashing, '_pool', self.pool)
+        pool.start()
+        self.addCleanup(pool.stop)
+
+    def login(self, username, password):
+        return self.client.post('/api/v1/token/', {'username': username, 'password': password}, content_type='application/json')
+
+    def test_full_pool_fails_fast_with_503(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        running = self.pool.submit(release.wait)
+        queued = self.pool.submit(release.wait)
+        with self.assertRaises(hashing.PoolSaturated):
+            self.pool.submit(release.wait)
+
+        response = self.login('reader', 'secret-password')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+        release.set()
+        running.result()
+        queued.result()
+        self.assertEqual(self.login('reader', 'secret-password').status_code, 401)
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        user = User.objects.create(username='reader', password=make_password('secret-password', hasher='pbkdf2_sha256'))
+        self.assertEqual(self.login('reader', 'wrong-password').status_code, 401)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+        self.assertEqual(self.login('reader', 'secret-password').status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('bcrypt_sha256$'))
+        self.assertEqual(self.login('reader', 'secret-password').status_code, 200)
+
+    def login_both(self, username, password):
+        body = {'username': username, 'password': password}
+        return [
+            self.client.post(url, body, content_type='application/json').status_code
+            for url in ('/api/v1/token/', '/api/v1/async/token/')
+        ]
+
+    def test_inactive_user_is_refused_and_the_failure_signalled(self):
+        User.objects.create(username='reader', password=make_password('secret-password'), is_active=False)
+        failures = []
+
+        def receiver(sender, credentials, **kwargs):
+            failures.append(credentials)
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        self.assertEqual(self.login_both('reader', 'secret-password'), [401, 401])
+        self.assertEqual(failures, [{'username': 'reader', 'password': '********************'}] * 2)
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.AllowAllUsersModelBackend'])
+    def test_login_uses_the_configured_backends(self):
+        User.objects.create(username='reader', password=make_password('secret-password'), is_active=False)
+        self.assertEqual(self.login_both('reader', 'secret-password'), [200, 200])
+
+
+class RoleTokenTests(TestCase):
+
+    def test_role_token_skips_the_user_lookup(self):
+        user = User.objects.create(username='reader', role=UserRole.USER)
+        Book.objects.create(title='Dune', author='Frank Herbert')
+        self.client.get('/api/v1/books/', **bearer(user))
+
+        # The page is cached, so the only query left would be loading the user.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/v1/books/', **bearer(user)).status_code, 200)
+        legacy = RefreshToken.for_user(user).access_token
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/v1/books/', HTTP_AUTHORIZATION=f'Bearer {legacy}').status_code, 200)
+
+
+class TokenRefreshTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='staff', role=UserRole.OPERATOR)
+        self.refresh = str(add_role_claims(RefreshToken.for_user(self.user), self.user))
+
+    def refresh_access(self):
+        return self.client.post('/api/v1/token/refresh/', {'refresh': self.refresh}, content_type='application/json')
+
+    def test_refresh_carries_the_current_role(self):
+        User.objects.filter(id=self.user.id).update(role=UserRole.USER)
+        response = self.refresh_access()
+        self.assertEqual(response.status_code, 200)
+        access = response.json()['access']
+        self.assertEqual(AccessToken(access)['role'], UserRole.USER)
+
+        orders = self.client.get('/api/v1/orders/list/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(orders.status_code, 403)
+
+    def test_refresh_is_refused_for_inactive_users(self):
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertEqual(self.refresh_access().status_code, 401)
+        User.objects.filter(id=self.user.id).delete()
+        self.assertEqual(self.refresh_access().status_code, 401)
+
+
+class StockTests(TestCase):
+
+    def setUp(self):
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', quantity=1)
+        self.readers = [User.objects.create(username=f'reader{i}', role=UserRole.USER) for i in range(2)]
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+
+    def reserve(self, user):
+        return self.client.post('/api/v1/orders/', {'book_id': self.book.id}, content_type='application/json', **bearer(user))
+
+    def test_last_copy_is_reserved_once(self):
+        responses = [self.reserve(reader) for reader in self.readers]
+        self.assertEqual([response.status_code for response in responses], [201, 400])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity, 0)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_second_return_does_not_restock(self):
+        order_id = self.reserve(self.readers[0]).json()['id']
+        self.client.post(f'/api/v1/orders/{order_id}/accept/', **bearer(self.operator))
+
+        responses = [self.client.post(f'/api/v1/orders/{order_id}/return/', **bearer(self.operator)) for _ in range(2)]
+        self.assertEqual([response.status_code for response in responses], [200, 400])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity, 1)
+
+
+class ExpiryTests(TestCase):
+
+    def setUp(self):
+        reader = User.objects.create(username='reader', role=UserRole.USER)
+        self.books = Book.objects.bulk_create(Book(title=f'Book {i}', author='Author', quantity=0) for i in range(2))
+        expired = timezone.now() - timedelta(days=2)
+        self.orders = Order.objects.bulk_create(
+            Order(user=reader, book=self.books[i % 2], order_date=expired) for i in range(5)
+        )
+        Order.objects.create(user=reader, book=self.books[0])
+        self.cutoff = timezone.now() - timedelta(days=1)
+
+    def quantities(self):
+        return list(Book.objects.order_by('id').values_list('quantity', flat=True))
+
+    def test_batches_resume_after_the_last_id(self):
+        self.assertEqual(cancel_expired_batch(self.cutoff, batch_size=2), (2, self.orders[1].id))
+        self.assertEqual(self.quantities(), [1, 1])
+        self.assertEqual(cancel_expired_batch(self.cutoff, self.orders[1].id, batch_size=2), (2, self.orders[3].id))
+        self.assertEqual(cancel_expired_batch(self.cutoff, self.orders[3].id, batch_size=2), (1, self.orders[4].id))
+        self.assertEqual(cancel_expired_batch(self.cutoff, self.orders[4].id, batch_size=2), (0, None))
+
+        self.assertEqual(self.quantities(), [3, 2])
+        self.assertEqual(Order.objects.filter(status=OrderStatus.CANCELLED).count(), 5)
+        self.assertEqual(Order.objects.filter(status=OrderStatus.BOOKED).count(), 1)
+
+    def test_task_cancels_every_batch(self):
+        self.assertEqual(tasks.cancel_expired_orders(batch_size=2), 5)
+        self.assertEqual(self.quantities(), [3, 2])
+
+    def test_order_accepted_after_the_scan_is_not_restocked(self):
+        def accept_first(order_ids):
+            Order.objects.filter(id=order_ids[0]).update(status=OrderStatus.TAKEN)
+            return cancel_booked(order_ids)
+
+        cancel_booked = tasks.cancel_booked
+        with mock.patch.object(tasks, 'cancel_booked', accept_first):
+            self.assertEqual(cancel_expired_batch(self.cutoff, batch_size=2), (1, self.orders[1].id))
+        self.assertEqual(self.quantities(), [0, 1])
+        self.assertEqual(Order.objects.get(id=self.orders[0].id).status, OrderStatus.TAKEN)
+
+
+class CatalogCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', quantity=2)
+        self.reader = User.objects.create(username='reader', role=UserRole.USER)
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+
+    def get_catalog(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/v1/books/', **bearer(self.reader), **headers)
+
+    def assertChanged(self, etag, quantity):
+        response = self.get_catalog(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['quantity'], quantity)
+        return response['ETag']
+
+    def test_unchanged_catalog_answers_304(self):
+        etag = self.get_catalog()['ETag']
+        response = self.get_catalog(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get_catalog('"stale-json"').status_code, 200)
+
+    def test_stock_writes_change_the_etag(self):
+        etag = self.get_catalog()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            order_id = self.client.post(
+                '/api/v1/orders/', {'book_id': self.book.id}, content_type='application/json', **bearer(self.reader),
+            ).json()['id']
+        etag = self.assertChanged(etag, quantity=1)
+
+        self.client.post(f'/api/v1/orders/{order_id}/accept/', **bearer(self.operator))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/v1/orders/{order_id}/return/', **bearer(self.operator))
+        etag = self.assertChanged(etag, quantity=2)
+
+        upload = SimpleUploadedFile('books.csv', b'title,author,quantity\nDune,Frank Herbert,5\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/books/import/', {'file': upload}, **bearer(self.operator))
+        self.assertChanged(etag, quantity=5)
+
+
+class BookImportTests(TestCase):
+    csv_file = (
+        b'title,author,quantity,daily_price\n'
+        b'Dune,Frank Herbert,3,1.50\n'
+        b'Emma,Jane Austen,,\n'
+        b'Ubik,,1,0\n'
+        b'Solaris,Stanislaw Lem,-1,123456789.00\n'
+        b'Kindred,Octavia Butler,2,0.125\n'
+    )
+    jsonl_file = (
+        b'{"title": "Dune", "author": "Frank Herbert", "quantity": 3, "daily_price": "1.50"}\n'
+        b'{"title": "Emma", "author": "Jane Austen"}\n'
+        b'{"title": "Ubik", "author": ""}\n'
+        b'{"title": "Solaris", "author": "Stanislaw Lem", "quantity": -1, "daily_price": 123456789}\n'
+        b'{"title": "Kindred", "author": "Octavia Butler", "quantity": 2, "daily_price": 0.125}\n'
+    )
+
+    def setUp(self):
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+
+    def upload(self, name, content):
+        upload = SimpleUploadedFile(name, content)
+        response = self.client.post('/api/v1/books/import/', {'file': upload}, **bearer(self.operator))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertImported(self, name, content):
+        report = self.upload(name, content)
+        self.assertEqual((report['created'], report['updated'], report['failed']), (2, 0, 3))
+        errors = {error['line']: error['errors'] for error in report['errors']}
+        first = min(errors)
+        self.assertEqual(set(errors[first]), {'author'})
+        self.assertEqual(set(errors[first + 1]), {'quantity', 'daily_price'})
+        self.assertIn('digits', errors[first + 1]['daily_price'][0])
+        self.assertIn('2 decimal places', errors[first + 2]['daily_price'][0])
+
+        dune = Book.objects.get(title='Dune')
+        self.assertEqual((dune.quantity, str(dune.daily_price)), (3, '1.50'))
+        emma = Book.objects.get(title='Emma')
+        self.assertEqual((emma.quantity, str(emma.daily_price)), (1, '0.00'))
+
+        # Importing again updates in place; empty columns keep what is stored.
+        Book.objects.filter(title='Emma').update(quantity=7)
+        report = self.upload(name, content)
+        self.assertEqual((report['created'], report['updated'], report['failed']), (0, 2, 3))
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(Book.objects.get(title='Emma').quantity, 7)
+
+    def test_csv_import(self):
+        self.assertImported('books.csv', self.csv_file)
+
+    def test_jsonl_import(self):
+        self.assertImported('books.jsonl', self.jsonl_file)
+
+    def test_concurrent_insert_is_updated_not_duplicated(self):
+        Book.objects.create(title='Dune', author='Frank Herbert', quantity=1)
+        report = importer.ImportReport()
+        # As if another import inserted the book after this one looked.
+        with mock.patch.object(importer, 'existing_books', return_value={}):
+            importer.upsert_batch([{'title': 'Dune', 'author': 'Frank Herbert', 'quantity': 4}], report)
+        self.assertEqual(list(Book.objects.values_list('title', 'quantity')), [('Dune', 4)])
+
+    def test_duplicate_book_is_rejected(self):
+        book = {'title': 'Dune', 'author': 'Frank Herbert', 'quantity': 1}
+        responses = [
+            self.client.post('/api/v1/books/', book, content_type='application/json', **bearer(self.operator))
+            for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [201, 400])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Reproduces SQLite write-lock upgrades')
+class ConcurrentImportTests(TransactionTestCase):
+    """
+    Imports from several threads against a file copy of the test database:
+    the in-memory one has no file locks to contend on, and TestCase's open
+    transaction would block the copy.
+    """
+
+    def test_concurrent_imports_queue_for_the_write_lock(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/library.sqlite3'
+            connection.ensure_connection()
+            with sqlite3.connect(path) as scratch:
+                connection.connection.backup(scratch)
+            scratch.close()
+
+            errors = []
+            start = threading.Barrier(4)
+
+            def run(worker):
+                content = ''.join(
+                    f'{{"title": "Book {i}", "author": "Author", "quantity": {worker}}}\n' for i in range(50)
+                ).encode()
+                start.wait()
+                try:
+                    importer.import_books(io.BytesIO(content), 'jsonl', batch_size=10)
+                except Exception as exc:
+                    errors.append(exc)
+                finally:
+                    connection.close()
+
+            with mock.patch.dict(connection.settings_dict, {'NAME': path}):
+                threads = [threading.Thread(target=run, args=(worker,)) for worker in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            self.assertEqual(errors, [])
+            with sqlite3.connect(path) as scratch:
+                self.assertEqual(scratch.execute('SELECT COUNT(*) FROM api_book').fetchone(), (50,))
+            scratch.close()
+
+
+class OrderBatchTests(TestCase):
+
+    def setUp(self):
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+        self.reader = User.objects.create(username='reader', role=UserRole.USER)
+        self.books = Book.objects.bulk_create(Book(title=f'Book {i}', author='Author', quantity=0) for i in range(20))
+
+    def make(self, order_status, books):
+        taken_at = timezone.now() - timedelta(days=1) if order_status != OrderStatus.BOOKED else None
+        return [
+            order.id for order in Order.objects.bulk_create(
+                Order(user=self.reader, book=book, status=order_status, taken_at=taken_at) for book in books
+            )
+        ]
+
+    def batch(self, action, order_ids):
+        response = self.client.post(
+            f'/api/v1/orders/{action}/', {'order_ids': order_ids}, content_type='application/json', **bearer(self.operator),
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_mixed_batch_reports_every_order(self):
+        booked, taken, returned, cancelled = (
+            self.make(order_status, self.books[:1])[0]
+            for order_status in (OrderStatus.BOOKED, OrderStatus.TAKEN, OrderStatus.RETURNED, OrderStatus.CANCELLED)
+        )
+        data = self.batch('accept', [booked, taken, returned, cancelled, 999999, booked])
+        self.assertEqual(data['processed'], 1)
+        self.assertEqual(
+            [(result['id'], result['ok'], result.get('detail')) for result in data['results']],
+            [
+                (booked, True, None),
+                (taken, False, "Order already accepted"),
+                (returned, False, "Order already accepted"),
+                (cancelled, False, "Order was cancelled"),
+                (999999, False, "Order not found"),
+            ],
+        )
+        self.assertEqual(Order.objects.get(id=booked).status, OrderStatus.TAKEN)
+
+        data = self.batch('return', [booked, returned])
+        self.assertEqual([result['ok'] for result in data['results']], [True, False])
+        self.assertEqual(data['results'][1]['detail'], "Order already returned")
+
+    def test_batch_return_restocks_each_book(self):
+        first, second = self.books[:2]
+        taken = self.make(OrderStatus.TAKEN, [first, first, first, second, second])
+        booked = self.make(OrderStatus.BOOKED, [second])
+        data = self.batch('return', taken + booked)
+        self.assertEqual(data['processed'], 5)
+        quantities = Book.objects.filter(id__in=[first.id, second.id]).order_by('id').values_list('quantity', flat=True)
+        self.assertEqual(list(quantities), [3, 2])
+        self.assertEqual(Order.objects.filter(status=OrderStatus.RETURNED).count(), 5)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        # Both counts include the SAVEPOINT and RELEASE of the transaction.
+        for size in (2, 20):
+            booked = self.make(OrderStatus.BOOKED, self.books[:size])
+            with self.assertNumQueries(6):
+                self.batch('accept', booked)
+            with self.assertNumQueries(10):
+                self.batch('return', booked)
+
+
+class PenaltyTests(TestCase):
+
+    def test_vectorized_penalties_match_the_reference(self):
+        import numpy as np
+
+        rng = random.Random(14)
+        as_of = datetime(2026, 3, 1, 12, 30, tzinfo=dt_timezone.utc)
+        loan_period = timedelta(days=14)
+        due = as_of - loan_period
+        # Either side of every day boundary around the end of the grace period.
+        taken = [
+            due - timedelta(days=days) + timedelta(microseconds=offset)
+            for days in range(-2, 30) for offset in (-1, 0, 1)
+        ]
+        taken += [as_of - timedelta(seconds=rng.uniform(0, 90 * 86400)) for _ in range(1000)]
+        prices = [Decimal(rng.choice((0, 1, 99, 125, 999, rng.randint(0, 10 ** 6)))).scaleb(-2) for _ in taken]
+
+        cents = penalties.compute_penalty_cents(
+            np.fromiter(map(penalties.to_microseconds, taken), dtype=np.int64),
+            np.fromiter(map(penalties.to_cents, prices), dtype=np.int64),
+            as_of, loan_period,
+        )
+        expected = [penalties.compute_penalty(t, price, as_of, loan_period) for t, price in zip(taken, prices)]
+        self.assertEqual([Decimal(int(value)).scaleb(-2) for value in cents], expected)
+        # Exactly one day late is charged; a microsecond short of it is not.
+        one_day = taken.index(due - timedelta(days=1))
+        self.assertEqual(expected[one_day - 1:one_day + 2], [prices[one_day - 1], prices[one_day], Decimal('0.00')])
+
+    def test_nightly_run_keeps_the_penalty_set_by_a_return(self):
+        reader = User.objects.create(username='reader', role=UserRole.USER)
+        book = Book.objects.create(title='Dune', author='Frank Herbert', daily_price=Decimal('1.00'))
+        now = timezone.now()
+        returned, open_loan = Order.objects.bulk_create(
+            Order(user=reader, book=book, status=OrderStatus.TAKEN, taken_at=now - timedelta(days=20)) for _ in range(2)
+        )
+
+        def return_during_run(*args, **kwargs):
+            # The return commits after the chunk was read, before it is written.
+            Order.objects.filter(id=returned.id).update(status=OrderStatus.RETURNED, penalty=Decimal('5.00'))
+            return compute_penalty_cents(*args, **kwargs)
+
+        compute_penalty_cents = penalties.compute_penalty_cents
+        with mock.patch.object(penalties, 'compute_penalty_cents', return_during_run):
+            self.assertEqual(penalties.recompute_open_penalties(as_of=now, resume=False), (2, 2))
+        self.assertEqual(Order.objects.get(id=returned.id).penalty, Decimal('5.00'))
+        self.assertEqual(Order.objects.get(id=open_loan.id).penalty, Decimal('6.00'))
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', quantity=2)
+        self.readers = [User.objects.create(username=f'reader{i}', role=UserRole.USER) for i in range(3)]
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+
+    def reserve(self, user, **data):
+        return self.client.post('/api/v1/orders/', {'book_id': self.book.id, **data}, content_type='application/json', **bearer(user))
+
+    def test_counters_match_the_orders(self):
+        first, second, third = self.readers
+        loan = self.reserve(first).json()['id']
+        expiring = self.reserve(second).json()['id']
+        self.assertEqual(self.reserve(third, wait=True).status_code, 202)
+
+        self.client.post(f'/api/v1/orders/{loan}/accept/', **bearer(self.operator))
+        Order.objects.filter(id=loan).update(taken_at=F('taken_at') - timedelta(hours=3))
+        # The return hands the copy to the waiter, which counts as an order.
+        self.client.post(f'/api/v1/orders/{loan}/return/', **bearer(self.operator))
+        Order.objects.filter(id=expiring).update(order_date=timezone.now() - timedelta(days=2))
+        cancel_expired_batch(timezone.now() - timedelta(days=1))
+
+        orders = Order.objects.filter(book=self.book)
+        returned = orders.get(id=loan)
+        expected = {
+            'orders': orders.count(),
+            'pickups': orders.filter(taken_at__isnull=False).count(),
+            'returns': orders.filter(returned_at__isnull=False).count(),
+            'cancellations': orders.filter(status=OrderStatus.CANCELLED).count(),
+            'loan_seconds': int((returned.returned_at - returned.taken_at).total_seconds()),
+        }
+        self.assertEqual([expected[name] for name in rollups.COUNTERS[:4]], [3, 1, 1, 1])
+        self.assertGreaterEqual(expected['loan_seconds'], 3 * 3600)
+        totals = rollups.unprefix(rollups.summed(DailyBookStats.objects.filter(book=self.book), 'book_id').get())
+        self.assertEqual({name: totals[name] for name in rollups.COUNTERS}, expected)
+
+        report = self.client.get('/api/v1/reports/top-books/', {'metric': 'orders'}, **bearer(self.operator)).json()
+        self.assertEqual(report['books'][0]['orders'], 3)
+
+    def test_backfill_matches_the_live_rollups(self):
+        loan = self.reserve(self.readers[0]).json()['id']
+        expiring = self.reserve(self.readers[1]).json()['id']
+        self.client.post(f'/api/v1/orders/{loan}/accept/', **bearer(self.operator))
+        booked_at = Order.objects.get(id=expiring).order_date
+        with mock.patch('django.utils.timezone.now', return_value=booked_at + timedelta(days=1)):
+            self.client.post(f'/api/v1/orders/{loan}/return/', **bearer(self.operator))
+        # The expiry task runs a day after the reservation ran out.
+        with mock.patch('django.utils.timezone.now', return_value=booked_at + timedelta(days=2)):
+            tasks.cancel_expired_orders()
+        self.assertEqual(Order.objects.get(id=expiring).status, OrderStatus.CANCELLED)
+
+        def rows():
+            return list(DailyBookStats.objects.order_by('day', 'book_id').values('day', 'book_id', *rollups.COUNTERS))
+
+        live = rows()
+        day = timezone.localdate(booked_at)
+        self.assertEqual([(row['day'], row['cancellations']) for row in live], [(day, 0), (day + timedelta(days=1), 1)])
+        self.assertEqual(rollups.backfill(chunk_size=1), 2)
+        self.assertEqual(rows(), live)
+
+    def test_concurrent_writes_add_up(self):
+        day = timezone.localdate()
+        rollups.record({(day, self.book.id): {'orders': 2, 'pickups': 1}})
+        rollups.record({(day, self.book.id): {'orders': 3, 'loan_seconds': 60}})
+        rollups.record_counts('orders', {self.book.id: 1})
+        row = DailyBookStats.objects.get(day=day, book=self.book)
+        self.assertEqual((row.orders, row.pickups, row.loan_seconds), (6, 1, 60))
+
+
+class OrderExportTests(TestCase):
+
+    def setUp(self):
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+        reader = User.objects.create(username='reader', role=UserRole.USER)
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        self.orders = Order.objects.bulk_create(Order(user=reader, book=book) for _ in range(5))
+
+    def export(self, output):
+        # A chunk size below the row count makes the rows span several fetches.
+        with mock.patch.object(OrderExportView, 'chunk_size', 2):
+            response = self.client.get('/api/v1/orders/export/', {'output': output}, **bearer(self.operator))
+            self.assertIsInstance(response, StreamingHttpResponse)
+            return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_ndjson_streams_every_row(self):
+        lines = self.export('ndjson')
+        self.assertEqual([json.loads(line)['id'] for line in lines], [order.id for order in self.orders])
+
+    def test_csv_streams_every_row(self):
+        header, *rows = self.export('csv')
+        self.assertEqual(header.split(','), OrderExportView.export_fields)
+        self.assertEqual([int(row.split(',')[0]) for row in rows], [order.id for order in self.orders])
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def scrape(self):
+        return self.client.get('/metrics').content.decode().splitlines()
+
+    def test_requests_are_recorded_per_route(self):
+        reader = User.objects.create(username='reader', role=UserRole.USER)
+        Book.objects.create(title='Dune', author='Frank Herbert')
+        self.client.get('/api/v1/books/')
+        self.client.get('/api/v1/books/', **bearer(reader))
+
+        route = 'route="book_list_create",method="GET"'
+        body = self.scrape()
+        self.assertIn(f'library_http_requests_total{{{route},status="401"}} 1', body)
+        self.assertIn(f'library_http_requests_total{{{route},status="200"}} 1', body)
+        self.assertIn(f'library_http_request_duration_seconds_count{{{route}}} 2', body)
+        # The authorized request reads one page from the database; the other none.
+        self.assertIn(f'library_http_db_queries_count{{{route}}} 2', body)
+        self.assertIn(f'library_http_db_queries_sum{{{route}}} 1.0', body)
+        self.assertIn(f'library_http_db_queries_bucket{{{route},le="0"}} 1', body)
+
+    async def test_async_requests_count_their_queries(self):
+        reader = await User.objects.acreate(username='reader', role=UserRole.USER)
+        await Book.objects.acreate(title='Dune', author='Frank Herbert')
+        response = await self.async_client.get(
+            '/api/v1/async/books/', headers={'Authorization': bearer(reader)['HTTP_AUTHORIZATION']}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        route = 'route="book_list_async",method="GET"'
+        body = await sync_to_async(self.scrape)()
+        self.assertIn(f'library_http_db_queries_count{{{route}}} 1', body)
+        queries = next(line for line in body if line.startswith(f'library_http_db_queries_sum{{{route}}}'))
+        self.assertGreater(float(queries.split()[-1]), 0)
+
+    def test_task_runs_are_counted_by_the_signals(self):
+        task = 'task="api.tasks.cancel_expired_orders"'
+        reader = User.objects.create(username='reader', role=UserRole.USER)
+        book = Book.objects.create(title='Dune', author='Frank Herbert', quantity=0)
+        Order.objects.create(user=reader, book=book, order_date=timezone.now() - timedelta(days=2))
+        self.assertIn(f'library_task_runs_total{{{task},state="SUCCESS"}} 0', self.scrape())
+
+        tasks.cancel_expired_orders.apply()
+        body = self.scrape()
+        self.assertIn(f'library_task_runs_total{{{task},state="SUCCESS"}} 1', body)
+        self.assertIn(f'library_task_rows_processed_total{{{task}}} 1', body)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        # Writes in other tests pin their users.
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def route(self, read_only, user_id=None):
+        token = routers.begin_request(read_only)
+        try:
+            if user_id is not None:
+                routers.set_user(user_id)
+            return self.router.db_for_read(Book)
+        finally:
+            routers.end_request(token)
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+    def test_read_only_requests_use_replica(self):
+        self.assertEqual(self.route(read_only=True, user_id=1), 'replica')
+
+    def test_unsafe_requests_use_primary(self):
+        self.assertEqual(self.route(read_only=False, user_id=1), 'default')
+
+    def test_writer_sticks_to_primary(self):
+        token = routers.begin_request(False)
+        routers.set_user(1)
+        routers.pin_current_user()
+        routers.end_request(token)
+
+        self.assertEqual(self.route(read_only=True, user_id=1), 'default')
+        self.assertEqual(self.route(read_only=True, user_id=2), 'replica')
+
+    def test_writes_use_primary(self):
+        self.assertEqual(self.router.db_for_write(Book), 'default')
+
+
+class SchemaTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema._artifact = None
+        self.addCleanup(setattr, schema, '_artifact', None)
+
+    def test_schema_is_built_once_and_revalidated_by_etag(self):
+        with mock.patch.object(schema, 'render_schema', wraps=schema.render_schema) as render:
+            first = self.client.get('/api/v1/openapi.json', HTTP_ACCEPT_ENCODING='gzip')
+            plain = self.client.get('/api/v1/swagger/?format=openapi')
+            cached = self.client.get('/api/v1/openapi.json', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(first.content), plain.content)
+        self.assertIn('/books/', json.loads(plain.content)['paths'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_view_docs_reach_the_schema(self):
+        paths = json.loads(self.client.get('/api/v1/openapi.json').content)['paths']
+        parameters = {parameter['name']: parameter for parameter in paths['/books/']['get']['parameters']}
+        self.assertEqual(parameters['ordering']['enum'], list(BookPagination.orderings))
+        self.assertEqual(paths['/token/']['post']['parameters'][0]['schema']['properties']['username']['type'], 'string')
+
+
+class MyOrdersTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='reader', role=UserRole.USER)
+        other = User.objects.create(username='other', role=UserRole.USER)
+        self.client.defaults.update(bearer(self.user))
+        books = Book.objects.bulk_create(Book(title=f'Book {i}', author='Author') for i in range(30))
+        statuses = [OrderStatus.BOOKED, OrderStatus.TAKEN, OrderStatus.RETURNED]
+        Order.objects.bulk_create(
+            Order(user=self.user, book=book, status=statuses[i % 3]) for i, book in enumerate(books)
+        )
+        Order.objects.create(user=other, book=books[0])
+
+    def test_expanded_page_costs_one_query_at_any_size(self):
+        for page_size in (2, 30):
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/v1/orders/mine/', {'expand': 'book', 'page_size': page_size})
+            results = response.json()['results']
+            self.assertEqual(len(results), page_size)
+            self.assertEqual(set(results[0]['book']), set(BookSerializer.Meta.fields))
+
+    def test_sparse_fields_shrink_the_query_and_payload(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/orders/mine/', {'fields': 'id,status', 'status': 'booked,taken', 'page_size': 5})
+        self.assertNotIn('"penalty"', queries[0]['sql'])
+        results = response.json()['results']
+        self.assertEqual([set(result) for result in results], [{'id', 'status'}] * 5)
+        self.assertTrue(all(result['status'] in ('booked', 'taken') for result in results))
+
+        next_page = self.client.get(response.json()['next'])
+        self.assertEqual(len(next_page.json()['results']), 5)
+        self.assertFalse({result['id'] for result in results} & {result['id'] for result in next_page.json()['results']})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/v1/orders/mine/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+
+class WaitlistTests(TestCase):
+
+    def setUp(self):
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', quantity=1)
+        self.readers = [User.objects.create(username=f'reader{i}', role=UserRole.USER) for i in range(3)]
+        self.operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+
+    def reserve(self, user, **data):
+        return self.client.post('/api/v1/orders/', {'book_id': self.book.id, **data}, content_type='application/json', **bearer(user))
+
+    def test_returned_copy_goes_to_the_first_waiter(self):
+        first, second, third = self.readers
+        loan = Order.objects.get(id=self.reserve(first).json()['id'])
+        Order.objects.filter(id=loan.id).update(status=OrderStatus.TAKEN, taken_at=timezone.now())
+
+        self.assertEqual(self.reserve(second).status_code, 400)
+        self.assertEqual(self.reserve(second, wait=True).json()['position'], 1)
+        self.assertEqual(self.reserve(third, wait=True).json()['position'], 2)
+
+        response = self.client.post(f'/api/v1/orders/{loan.id}/return/', **bearer(self.operator))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.get(user=second, status=OrderStatus.BOOKED).book_id, self.book.id)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity, 0)
+        waiting = self.client.get('/api/v1/waitlist/', **bearer(third)).json()
+        self.assertEqual([(entry['book'], entry['position']) for entry in waiting], [(self.book.id, 1)])
+
+    def test_expired_reservation_goes_to_the_first_waiter(self):
+        first, second, _ = self.readers
+        expired = self.reserve(first).json()['id']
+        self.assertEqual(self.reserve(second, wait=True).status_code, 202)
+
+        cancelled, _ = cancel_expired_batch(timezone.now() + timedelta(seconds=1))
+        self.assertEqual(cancelled, 1)
+        self.assertEqual(Order.objects.get(id=expired).status, OrderStatus.CANCELLED)
+        self.assertTrue(Order.objects.filter(user=second, book=self.book, status=OrderStatus.BOOKED).exists())
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity, 0)
+
+    def test_waiter_holding_a_copy_is_skipped(self):
+        first, second, third = self.readers
+        Book.objects.filter(id=self.book.id).update(quantity=2)
+        self.assertEqual(self.reserve(first).status_code, 201)
+        loan = Order.objects.get(id=self.reserve(second).json()['id'])
+        Order.objects.filter(id=loan.id).update(status=OrderStatus.TAKEN, taken_at=timezone.now())
+        self.assertEqual(self.reserve(first, wait=True).status_code, 202)
+        self.assertEqual(self.reserve(third, wait=True).status_code, 202)
+
+        self.client.post(f'/api/v1/orders/{loan.id}/return/', **bearer(self.operator))
+        self.assertEqual(Order.objects.filter(user=first, book=self.book).count(), 1)
+        self.assertTrue(Order.objects.filter(user=third, book=self.book, status=OrderStatus.BOOKED).exists())
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+    def queue_behind_a_loan(self):
+        first, second, third = self.readers
+        self.assertEqual(self.reserve(first).status_code, 201)
+        self.assertEqual(self.reserve(second, wait=True).status_code, 202)
+        self.assertEqual(self.reserve(third, wait=True).status_code, 202)
+
+    def test_restock_by_update_goes_to_the_first_waiter(self):
+        self.queue_behind_a_loan()
+        response = self.client.put(
+            f'/api/v1/books/{self.book.id}/', {'title': 'Dune', 'author': 'Frank Herbert', 'quantity': 1},
+            content_type='application/json', **bearer(self.operator),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quantity'], 0)
+        self.assertTrue(Order.objects.filter(user=self.readers[1], book=self.book, status=OrderStatus.BOOKED).exists())
+        self.assertEqual(list(WaitlistEntry.objects.values_list('user_id', flat=True)), [self.readers[2].id])
+
+    def test_restock_by_import_goes_to_the_waiters(self):
+        self.queue_behind_a_loan()
+        upload = SimpleUploadedFile('books.jsonl', b'{"title": "Dune", "author": "Frank Herbert", "quantity": 3}\n')
+        self.client.post('/api/v1/books/import/', {'file': upload}, **bearer(self.operator))
+        self.assertEqual(Order.objects.filter(book=self.book, status=OrderStatus.BOOKED).count(), 3)
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity, 1)
+
+    def test_flush_clears_waitlists(self):
+        # Superusers survive a flush, so their entries are not cascaded away.
+        admin = User.objects.create(username='admin', is_superuser=True)
+        WaitlistEntry.objects.create(user=admin, book=self.book)
+        # The pragma it sets cannot change inside the test's transaction.
+        with mock.patch.object(seeding, 'bulk_load_settings', nullcontext):
+            seeding.flush()
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.assertFalse(Book.objects.exists())
+
+
+class BookEventsTests(TestCase):
+
+    def setUp(self):
+        hub = mock.patch.object(events, 'hub', events.Hub())
+        hub.start()
+        self.addCleanup(hub.stop)
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', quantity=1)
+        self.user = User.objects.create(username='reader', role=UserRole.USER)
+        self.headers = {'Authorization': bearer(self.user)['HTTP_AUTHORIZATION']}
+
+    def test_reserve_publishes_the_new_quantity_on_commit(self):
+        with mock.patch.object(events.InMemoryBroker, 'has_listeners', return_value=True), \
+                mock.patch.object(events.InMemoryBroker, 'publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/orders/', {'book_id': self.book.id}, content_type='application/json', headers=self.headers)
+        publish.assert_called_once_with([{'book': self.book.id, 'quantity': 0}])
+
+    def test_delete_publishes_the_removal(self):
+        operator = User.objects.create(username='operator', role=UserRole.OPERATOR)
+        with mock.patch.object(events.InMemoryBroker, 'has_listeners', return_value=True), \
+                mock.patch.object(events.InMemoryBroker, 'publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/v1/books/{self.book.id}/', **bearer(operator))
+        self.assertEqual(response.status_code, 204)
+        publish.assert_called_once_with([{'book': self.book.id, 'quantity': 0, 'removed': True}])
+
+        # A removal is delivered even when the book had no copies left.
+        events.hub.dispatch([{'book': self.book.id, 'quantity': 0}])
+        sequence = events.hub.sequence
+        events.hub.dispatch(publish.call_args.args[0])
+        self.assertEqual(events.hub.sequence, sequence + 1)
+
+    async def test_long_poll_rejects_a_non_finite_timeout(self):
+        for timeout in ('nan', 'inf', 'abc'):
+            response = await self.async_client.get(
+                '/api/v1/async/books/changes/', {'timeout': timeout}, headers=self.headers,
+            )
+            self.assertEqual(response.status_code, 400, timeout)
+
+    async def test_long_poll_wakes_on_a_watched_book(self):
+        url = '/api/v1/async/books/changes/'
+        poll = asyncio.create_task(self.async_client.get(url, {'books': self.book.id, 'timeout': 5}, headers=self.headers))
+        while not events.hub.by_book:
+            await asyncio.sleep(0)
+        events.get_broker().publish([{'book': self.book.id + 1, 'quantity': 3}, {'book': self.book.id, 'quantity': 0}])
+        data = json.loads((await poll).content)
+        self.assertEqual(data['events'], [{'book': self.book.id, 'quantity': 0}])
+
+        caught_up = await self.async_client.get(url, {'since': data['last_event_id'], 'timeout': 0}, headers=self.headers)
+        self.assertEqual(json.loads(caught_up.content)['events'], [])
+        stale = await self.async_client.get(url, {'since': 'other-1', 'timeout': 0}, headers=self.headers)
+        self.assertTrue(json.loads(stale.content)['resync'])
+        self.assertFalse(events.hub.by_book)
+
+    async def test_stream_replays_from_last_event_id(self):
+        events.hub.dispatch([{'book': self.book.id, 'quantity': 0}])
+        seen = events.hub.last_event_id
+        events.hub.dispatch([{'book': self.book.id, 'quantity': 1}])
+
+        response = await self.async_client.get(
+            '/api/v1/async/books/stream/', headers={**self.headers, 'Last-Event-ID': seen},
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 1000\n\n')
+        replayed = (await anext(chunks)).decode()
+        self.assertIn('event: stock', replayed)
+        self.assertIn('"quantity": 1', replayed)
+        await chunks.aclose()
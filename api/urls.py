@@ -1,39 +1,47 @@
-import rest_framework_simplejwt
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
-    RegisterView, LoginView, BookListCreateView, BookUpdateDeleteView,
-    OrderCreateView, OrderListView, OrderAcceptView, OrderReturnView, OrderRateView
+    RegisterView, LoginView, BookListCreateView, BookImportView, BookSearchView, BookUpdateDeleteView,
+    OrderCreateView, OrderListView, MyOrderListView, OrderExportView, OrderAcceptView, OrderReturnView, OrderRateView,
+    OrderBatchAcceptView, OrderBatchReturnView, CirculationReportView, TopBooksReportView,
+    WaitlistView, WaitlistLeaveView, schema_json_view, serve_prebuilt_spec,
 )
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Library API",
-        default_version='v1',
-        description="API for Library Management",
-        terms_of_service="https://www.example.com/terms/",
-        contact=openapi.Contact(email="contact@example.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-    authentication_classes=(rest_framework_simplejwt.authentication.JWTAuthentication,),
+from .async_views import (
+    AsyncLoginView, AsyncRegisterView, AsyncBookListView, AsyncBookSearchView, AsyncOrderListView, AsyncMyOrdersView,
+    AsyncBookStreamView, AsyncBookChangesView,
 )
+from .schema import ui_view
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('token/', LoginView.as_view(), name='token_obtain_pair'),
+    path('async/register/', AsyncRegisterView.as_view(), name='register_async'),
+    path('async/token/', AsyncLoginView.as_view(), name='token_obtain_pair_async'),
+    path('async/books/', AsyncBookListView.as_view(), name='book_list_async'),
+    path('async/books/search/', AsyncBookSearchView.as_view(), name='book_search_async'),
+    path('async/books/stream/', AsyncBookStreamView.as_view(), name='book_stream_async'),
+    path('async/books/changes/', AsyncBookChangesView.as_view(), name='book_changes_async'),
+    path('async/orders/list/', AsyncOrderListView.as_view(), name='order_list_async'),
+    path('async/orders/mine/', AsyncMyOrdersView.as_view(), name='my_orders_async'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('books/', BookListCreateView.as_view(), name='book_list_create'),
+    path('books/import/', BookImportView.as_view(), name='book_import'),
+    path('books/search/', BookSearchView.as_view(), name='book_search'),
     path('books/<int:book_id>/', BookUpdateDeleteView.as_view(), name='book_update_delete'),
     path('orders/', OrderCreateView.as_view(), name='order_create'),
     path('orders/list/', OrderListView.as_view(), name='order_list'),
+    path('orders/mine/', MyOrderListView.as_view(), name='my_orders'),
+    path('orders/export/', OrderExportView.as_view(), name='order_export'),
+    path('orders/accept/', OrderBatchAcceptView.as_view(), name='order_batch_accept'),
+    path('orders/return/', OrderBatchReturnView.as_view(), name='order_batch_return'),
     path('orders/<int:order_id>/accept/', OrderAcceptView.as_view(), name='order_accept'),
     path('orders/<int:order_id>/return/', OrderReturnView.as_view(), name='order_return'),
     path('orders/<int:order_id>/rate/', OrderRateView.as_view(), name='order_rate'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('waitlist/', WaitlistView.as_view(), name='waitlist'),
+    path('waitlist/<int:book_id>/', WaitlistLeaveView.as_view(), name='waitlist_leave'),
+    path('reports/circulation/', CirculationReportView.as_view(), name='report_circulation'),
+    path('reports/top-books/', TopBooksReportView.as_view(), name='report_top_books'),
+    path('openapi.json', schema_json_view, name='schema-json'),
+    path('swagger/', serve_prebuilt_spec(ui_view('swagger')), name='schema-swagger-ui'),
+    path('redoc/', serve_prebuilt_spec(ui_view('redoc')), name='schema-redoc'),
 ]
\ No newline at end of file
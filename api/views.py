@@ -1,15 +1,45 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
+from rest_framework.parsers import MultiPartParser
 from rest_framework_simplejwt.tokens import RefreshToken
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
-from django.contrib.auth import authenticate
-from .serializers import UserCreateSerializer, UserSerializer, BookSerializer, OrderSerializer
+from django.db import router
+from django.db.models import F
+from .serializers import (
+    UserCreateSerializer, UserSerializer, BookSerializer, OrderSerializer, OrderBatchSerializer, WaitlistEntrySerializer,
+)
 from .permissions import RoleBasedPermission
-from .models import UserRole, Book, Order, User
-from datetime import timedelta
+from .authentication import add_role_claims
+from .pagination import BookPagination, OrderPagination, BookSearchPagination
+from . import search
+from . import hashing
+from . import stats
+from . import penalties
+from . import rollups
+from . import events
+from . import metrics
+from . import schema
+from . import waitlist
+from . import cache as catalog_cache
+from .importer import IMPORT_FORMATS, detect_format, import_books
+from .stock import restock
+from .filters import InvalidFilter, filter_orders, parse_field_list
+from .db import write_transaction
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from .models import UserRole, Book, Order, User, OrderStatus, WaitlistEntry
+from datetime import timedelta, datetime, time
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.utils.crypto import constant_time_compare
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.core.serializers.json import DjangoJSONEncoder
+import csv
+import json
+from collections import Counter
 
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -39,11 +69,14 @@ class LoginView(APIView):
     def post(self, request):
         username = request.data.get('username')
         password = request.data.get('password')
-        user = authenticate(request, username=username, password=password)
+        try:
+            user = hashing.authenticate(request, username, password or '')
+        except hashing.PoolSaturated:
+            return Response({"detail": "Server busy, please retry"}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
         if user is None:
             return Response({"detail": "Incorrect username or password"}, status=status.HTTP_401_UNAUTHORIZED)
 
-        refresh = RefreshToken.for_user(user)
+        refresh = add_role_claims(RefreshToken.for_user(user), user)
         return Response({
             "refresh": str(refresh),
             "access": str(refresh.access_token),
@@ -74,7 +107,10 @@ class RegisterView(APIView):
         if serializer.is_valid():
             if User.objects.filter(username=serializer.validated_data['username']).exists():
                 return Response({"detail": "Username already registered"}, status=status.HTTP_400_BAD_REQUEST)
-            user = serializer.create(serializer.validated_data)
+            try:
+                user = serializer.create(serializer.validated_data)
+            except hashing.PoolSaturated:
+                return Response({"detail": "Server busy, please retry"}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
             return Response(UserSerializer(user).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -85,14 +121,33 @@ class BookListCreateView(APIView):
         return [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]  
 
     @swagger_auto_schema(
-        operation_description="Get list of books (accessible to all authenticated users)",
+        operation_description="Get a page of books ordered by id, rating or popularity (accessible to all authenticated users)",
+        manual_parameters=[
+            openapi.Parameter('ordering', openapi.IN_QUERY, description='Sort order', type=openapi.TYPE_STRING, enum=list(BookPagination.orderings), default='id'),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Opaque cursor from the previous page', type=openapi.TYPE_STRING),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description='Page size (max 200)', type=openapi.TYPE_INTEGER),
+        ],
         responses={200: BookSerializer(many=True)},
         security=[{'Bearer': []}],
     )
     def get(self, request):
-        books = Book.objects.all()
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
+        version = catalog_cache.get_catalog_version()
+        etag = catalog_cache.make_etag(version, request)
+        if catalog_cache.etag_matches(etag, request):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = catalog_cache.get_page(version, request)
+        if data is None:
+            paginator = BookPagination()
+            # Pages are cached under the catalog version, so fill them from the
+            # primary: a lagging replica would pin a stale page to a new version.
+            books = paginator.paginate_queryset(Book.objects.using(router.db_for_write(Book)), request, view=self)
+            data = paginator.get_paginated_response(BookSerializer(books, many=True).data).data
+            catalog_cache.set_page(version, request, data)
+
+        response = Response(data, headers={'ETag': etag})
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     @swagger_auto_schema(
         operation_description="Create a new book (Admin and Operator only)",
@@ -112,9 +167,64 @@ class BookListCreateView(APIView):
         serializer = BookSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
+            catalog_cache.catalog_changed()
+            events.stock_changed([serializer.instance.id])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class BookImportView(APIView):
+    permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]
+    parser_classes = [MultiPartParser]
+
+    @swagger_auto_schema(
+        operation_description="Bulk import books from a CSV or JSON-lines file, upserting by title and author (Admin and Operator only)",
+        manual_parameters=[
+            openapi.Parameter('file', openapi.IN_FORM, description='CSV with a header row, or one JSON object per line', type=openapi.TYPE_FILE, required=True),
+            openapi.Parameter('input', openapi.IN_QUERY, description='Input format (default: from file name)', type=openapi.TYPE_STRING, enum=list(IMPORT_FORMATS)),
+        ],
+        responses={200: 'Import report', 400: 'Bad Request'},
+        security=[{'Bearer': []}],
+    )
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "File is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        input_format = request.query_params.get('input') or detect_format(upload.name)
+        if input_format not in IMPORT_FORMATS:
+            return Response({"detail": "Input must be 'csv' or 'jsonl'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            report = import_books(upload, input_format)
+        except UnicodeDecodeError:
+            return Response({"detail": "File must be UTF-8 encoded"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report.as_dict())
+
+class BookSearchView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Full-text search over book titles and authors, best match first (accessible to all authenticated users)",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description='Search text; every word is matched as a prefix', type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Opaque cursor from the previous page', type=openapi.TYPE_STRING),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description='Page size (max 100)', type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: BookSerializer(many=True)},
+        security=[{'Bearer': []}],
+    )
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "Query parameter 'q' is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if not search.is_available():
+            return Response({"detail": "Search is not available"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        paginator = BookSearchPagination()
+        books = paginator.paginate_search(query, request)
+        serializer = BookSerializer(books, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
 class BookUpdateDeleteView(APIView):
     permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]  
 
@@ -133,16 +243,23 @@ class BookUpdateDeleteView(APIView):
         security=[{'Bearer': []}],
     )
     def put(self, request, book_id):
-        try:
-            book = Book.objects.get(id=book_id)
-        except Book.DoesNotExist:
-            return Response({"detail": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        serializer = BookSerializer(book, data=request.data)
-        if serializer.is_valid():
+        with write_transaction():
+            try:
+                book = Book.objects.get(id=book_id)
+            except Book.DoesNotExist:
+                return Response({"detail": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            serializer = BookSerializer(book, data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            added = serializer.validated_data.get('quantity', book.quantity) - book.quantity
             serializer.save()
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            # Copies added to the shelf go to the waitlist first.
+            if added > 0 and waitlist.allocate({book.id: added}):
+                book.refresh_from_db(fields=['quantity'])
+            catalog_cache.catalog_changed()
+            events.stock_changed([book.id])
+        return Response(serializer.data)
 
     @swagger_auto_schema(
         operation_description="Delete a book (Admin and Operator only)",
@@ -156,50 +273,212 @@ class BookUpdateDeleteView(APIView):
             return Response({"detail": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
 
         book.delete()
+        catalog_cache.catalog_changed()
+        # Published as removed, since the book is gone when the event is built.
+        events.stock_changed([book_id])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class OrderCreateView(APIView):
     permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.USER])]  
 
     @swagger_auto_schema(
-        operation_description="Reserve a book (User only, auto-cancels after 1 day if not picked up)",
+        operation_description=(
+            "Reserve a book (User only, auto-cancels after 1 day if not picked up). With wait=true an "
+            "unavailable book puts you on its waitlist instead, and the next returned copy is reserved for you."
+        ),
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
                 'book_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Book ID to reserve'),
+                'wait': openapi.Schema(type=openapi.TYPE_BOOLEAN, description='Join the waitlist if no copy is available', default=False),
             },
             required=['book_id']
         ),
-        responses={201: OrderSerializer},
+        responses={201: OrderSerializer, 202: WaitlistEntrySerializer},
         security=[{'Bearer': []}],
     )
     def post(self, request):
-        book_id = request.data.get('book_id')
         try:
-            book = Book.objects.get(id=book_id)
-        except Book.DoesNotExist:
+            book_id = int(request.data.get('book_id'))
+        except (TypeError, ValueError):
             return Response({"detail": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        if book.quantity <= 0:
-            return Response({"detail": "Book is not available"}, status=status.HTTP_400_BAD_REQUEST)
-
-        order = Order.objects.create(user=request.user, book=book)
-        book.quantity -= 1
-        book.save()
+        wait = request.data.get('wait') in (True, 'true', '1')
+
+        with write_transaction():
+            if wait:
+                # Lock the book before looking at its stock, so a concurrent
+                # return either restocks first or finds our waitlist entry.
+                book_exists = Book.objects.select_for_update().filter(id=book_id).exists()
+            # Conditional decrement: the row lock taken by the UPDATE serializes
+            # concurrent reservations, and quantity can never go below zero.
+            reserved = Book.objects.filter(id=book_id, quantity__gt=0).update(quantity=F('quantity') - 1)
+            if not reserved:
+                if not (book_exists if wait else Book.objects.filter(id=book_id).exists()):
+                    return Response({"detail": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+                if not wait:
+                    return Response({"detail": "Book is not available"}, status=status.HTTP_400_BAD_REQUEST)
+                entry = waitlist.join(request.user.id, book_id)
+                entry = waitlist.with_positions(WaitlistEntry.objects.filter(id=entry.id)).get()
+                return Response(WaitlistEntrySerializer(entry).data, status=status.HTTP_202_ACCEPTED)
+            order = Order.objects.create(user_id=request.user.id, book_id=book_id)
+            rollups.record_counts('orders', {book_id: 1}, order.order_date)
+            catalog_cache.catalog_changed()
+            events.stock_changed([book_id])
         return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
 
 class OrderListView(APIView):
     permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]  
 
     @swagger_auto_schema(
-        operation_description="View all orders with details (Admin and Operator only)",
+        operation_description="View orders newest first, one page at a time (Admin and Operator only)",
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Opaque cursor from the previous page', type=openapi.TYPE_STRING),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description='Page size (max 200)', type=openapi.TYPE_INTEGER),
+            openapi.Parameter('status', openapi.IN_QUERY, description='Filter by order status', type=openapi.TYPE_STRING, enum=OrderStatus.values),
+            openapi.Parameter('user', openapi.IN_QUERY, description='Filter by user ID', type=openapi.TYPE_INTEGER),
+            openapi.Parameter('book', openapi.IN_QUERY, description='Filter by book ID', type=openapi.TYPE_INTEGER),
+        ],
         responses={200: OrderSerializer(many=True)},
         security=[{'Bearer': []}],
     )
     def get(self, request):
-        orders = Order.objects.all()
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        try:
+            orders = filter_orders(Order.objects.all(), request.query_params)
+        except InvalidFilter as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = OrderPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class MyOrderListView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="View your own orders newest first, one page at a time",
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description='Opaque cursor from the previous page', type=openapi.TYPE_STRING),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description='Page size (max 200)', type=openapi.TYPE_INTEGER),
+            openapi.Parameter('status', openapi.IN_QUERY, description='Filter by order status; comma-separated for several', type=openapi.TYPE_STRING),
+            openapi.Parameter('book', openapi.IN_QUERY, description='Filter by book ID', type=openapi.TYPE_INTEGER),
+            openapi.Parameter('expand', openapi.IN_QUERY, description='Nest related objects instead of ids: book', type=openapi.TYPE_STRING),
+            openapi.Parameter('fields', openapi.IN_QUERY, description='Comma-separated fields to return (default: all)', type=openapi.TYPE_STRING),
+        ],
+        responses={200: OrderSerializer(many=True)},
+        security=[{'Bearer': []}],
+    )
+    def get(self, request):
+        try:
+            orders = filter_orders(Order.objects.filter(user_id=request.user.id), request.query_params, fields=('status', 'book'))
+            fields = parse_field_list(request.query_params, 'fields', OrderSerializer.Meta.fields)
+            expand = parse_field_list(request.query_params, 'expand', OrderSerializer.expandable) or ()
+        except InvalidFilter as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = OrderPagination()
+        keys = [field.lstrip('-') for field in paginator.ordering]
+        orders = OrderSerializer.shape_queryset(orders, fields, expand, extra=keys)
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True, fields=fields, expand=expand)
+        return paginator.get_paginated_response(serializer.data)
+
+class WaitlistView(APIView):
+    permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.USER])]
+
+    @swagger_auto_schema(
+        operation_description="Books you are waiting for, with your place in each queue (User only)",
+        responses={200: WaitlistEntrySerializer(many=True)},
+        security=[{'Bearer': []}],
+    )
+    def get(self, request):
+        entries = waitlist.with_positions(WaitlistEntry.objects.filter(user_id=request.user.id).order_by('id'))
+        return Response(WaitlistEntrySerializer(entries, many=True).data)
+
+
+class WaitlistLeaveView(APIView):
+    permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.USER])]
+
+    @swagger_auto_schema(
+        operation_description="Leave the waitlist of a book (User only)",
+        responses={204: 'No Content', 404: 'Not Found'},
+        security=[{'Bearer': []}],
+    )
+    def delete(self, request, book_id):
+        deleted, _ = WaitlistEntry.objects.filter(user_id=request.user.id, book_id=book_id).delete()
+        if not deleted:
+            return Response({"detail": "Not on the waitlist"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+    def write(self, value):
+        return value
+
+
+def parse_date_bound(value, end=False):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        parsed = datetime.combine(day, time.max if end else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class OrderExportView(APIView):
+    permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]
+    export_fields = ['id', 'book_id', 'user_id', 'order_date', 'status', 'taken_at', 'returned_at', 'penalty', 'rating']
+    chunk_size = 2000
+
+    @swagger_auto_schema(
+        operation_description="Stream the order history as NDJSON or CSV (Admin and Operator only)",
+        manual_parameters=[
+            openapi.Parameter('output', openapi.IN_QUERY, description='Output format', type=openapi.TYPE_STRING, enum=['ndjson', 'csv'], default='ndjson'),
+            openapi.Parameter('status', openapi.IN_QUERY, description='Filter by order status', type=openapi.TYPE_STRING, enum=OrderStatus.values),
+            openapi.Parameter('from', openapi.IN_QUERY, description='Order date lower bound (ISO date or datetime)', type=openapi.TYPE_STRING),
+            openapi.Parameter('to', openapi.IN_QUERY, description='Order date upper bound (ISO date or datetime)', type=openapi.TYPE_STRING),
+        ],
+        responses={200: 'Streamed order rows', 400: 'Bad Request'},
+        security=[{'Bearer': []}],
+    )
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'csv'):
+            return Response({"detail": "Output must be 'ndjson' or 'csv'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # Rows stream after the request has been routed, so pick the database now.
+            orders = filter_orders(Order.objects.using(router.db_for_read(Order)), request.query_params, fields=('status',))
+            if request.query_params.get('from'):
+                orders = orders.filter(order_date__gte=parse_date_bound(request.query_params['from']))
+            if request.query_params.get('to'):
+                orders = orders.filter(order_date__lte=parse_date_bound(request.query_params['to'], end=True))
+        except InvalidFilter as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"detail": "Invalid date"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = orders.order_by('id').values_list(*self.export_fields).iterator(chunk_size=self.chunk_size)
+        if output == 'csv':
+            response = StreamingHttpResponse(self.stream_csv(rows), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="orders.csv"'
+        else:
+            response = StreamingHttpResponse(self.stream_ndjson(rows), content_type='application/x-ndjson')
+        return response
+
+    def stream_csv(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.export_fields)
+        for row in rows:
+            yield writer.writerow(row)
+
+    def stream_ndjson(self, rows):
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode(dict(zip(self.export_fields, row))) + '\n'
 
 class OrderAcceptView(APIView):
     permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]  
@@ -215,11 +494,18 @@ class OrderAcceptView(APIView):
         except Order.DoesNotExist:
             return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        if order.picked_up_at:
-            return Response({"detail": "Order already accepted"}, status=status.HTTP_400_BAD_REQUEST)
-
-        order.picked_up_at = timezone.now()
-        order.save()
+        taken_at = timezone.now()
+        with write_transaction():
+            accepted = Order.objects.filter(id=order.id, status=OrderStatus.BOOKED).update(
+                status=OrderStatus.TAKEN, taken_at=taken_at
+            )
+            if not accepted:
+                return Response({"detail": "Order already accepted"}, status=status.HTTP_400_BAD_REQUEST)
+            stats.record_loans_started({order.book_id: 1})
+            rollups.record_counts('pickups', {order.book_id: 1}, taken_at)
+
+        order.status = OrderStatus.TAKEN
+        order.taken_at = taken_at
         return Response(OrderSerializer(order).data)
 
 class OrderReturnView(APIView):
@@ -236,18 +522,193 @@ class OrderReturnView(APIView):
         except Order.DoesNotExist:
             return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        if not order.picked_up_at:
+        if order.status == OrderStatus.BOOKED:
             return Response({"detail": "Order not yet accepted"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if order.returned_at:
-            return Response({"detail": "Order already returned"}, status=status.HTTP_400_BAD_REQUEST)
-
-        order.returned_at = timezone.now()
-        order.book.quantity += 1
-        order.book.save()
-        order.save()
+        returned_at = timezone.now()
+        with write_transaction():
+            returned = Order.objects.filter(id=order.id, status=OrderStatus.TAKEN).update(
+                status=OrderStatus.RETURNED, returned_at=returned_at
+            )
+            if not returned:
+                return Response({"detail": "Order already returned"}, status=status.HTTP_400_BAD_REQUEST)
+            Book.objects.filter(id=order.book_id).update(quantity=F('quantity') + 1)
+            events.stock_changed([order.book_id])
+            waitlist.allocate({order.book_id: 1}, returned_at)
+            stats.record_loans_ended({order.book_id: 1})
+            rollups.record_returns([(order.book_id, order.taken_at)], returned_at)
+            charged = penalties.apply_return_penalties([order.id], returned_at)
+
+        order.status = OrderStatus.RETURNED
+        order.returned_at = returned_at
+        order.penalty = charged.get(order.id, order.penalty)
         return Response(OrderSerializer(order).data)
 
+class OrderBatchTransitionView(APIView):
+    """
+    Move many orders from ``from_status`` to ``to_status`` in one transaction.
+    Query count is constant in the number of orders: one locking read, one
+    UPDATE for the orders and a fixed number of grouped UPDATEs for the books.
+    """
+    permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]
+    from_status = None
+    to_status = None
+    timestamp_field = None
+    errors = {}
+
+    def after_transition(self, order_ids, book_counts, now):
+        """
+        Apply the side effects of the moved orders; ``book_counts`` is
+        ``{book_id: orders}`` and ``self.orders`` maps each id to its
+        ``(status, book_id, taken_at)`` before the move. May fill
+        ``self.extra`` with per-order result fields.
+        """
+
+    def post(self, request):
+        serializer = OrderBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        order_ids = list(dict.fromkeys(serializer.validated_data['order_ids']))
+
+        now = timezone.now()
+        self.extra = {}
+        with write_transaction():
+            orders = {
+                order_id: (order_status, book_id, taken_at)
+                for order_id, order_status, book_id, taken_at in Order.objects.select_for_update()
+                .filter(id__in=order_ids)
+                .values_list('id', 'status', 'book_id', 'taken_at')
+            }
+            self.orders = orders
+            ready = [order_id for order_id in order_ids if orders.get(order_id, (None,))[0] == self.from_status]
+            if ready:
+                Order.objects.filter(id__in=ready, status=self.from_status).update(
+                    status=self.to_status, **{self.timestamp_field: now}
+                )
+                self.after_transition(ready, Counter(orders[order_id][1] for order_id in ready), now)
+
+        results = []
+        for order_id in order_ids:
+            if order_id not in orders:
+                results.append({"id": order_id, "ok": False, "detail": "Order not found"})
+            elif orders[order_id][0] != self.from_status:
+                results.append({"id": order_id, "ok": False, "detail": self.errors.get(orders[order_id][0], "Invalid order status")})
+            else:
+                results.append({
+                    "id": order_id, "ok": True, "status": self.to_status, self.timestamp_field: now,
+                    **self.extra.get(order_id, {}),
+                })
+        return Response({"processed": len(ready), "results": results})
+
+class OrderBatchAcceptView(OrderBatchTransitionView):
+    from_status = OrderStatus.BOOKED
+    to_status = OrderStatus.TAKEN
+    timestamp_field = 'taken_at'
+    errors = {
+        OrderStatus.TAKEN: "Order already accepted",
+        OrderStatus.RETURNED: "Order already accepted",
+        OrderStatus.CANCELLED: "Order was cancelled",
+    }
+
+    def after_transition(self, order_ids, book_counts, now):
+        stats.record_loans_started(book_counts)
+        rollups.record_counts('pickups', book_counts, now)
+
+    @swagger_auto_schema(
+        operation_description="Accept many orders at once (Admin and Operator only)",
+        request_body=OrderBatchSerializer,
+        responses={200: 'Per-order results', 400: 'Bad Request'},
+        security=[{'Bearer': []}],
+    )
+    def post(self, request):
+        return super().post(request)
+
+class OrderBatchReturnView(OrderBatchTransitionView):
+    from_status = OrderStatus.TAKEN
+    to_status = OrderStatus.RETURNED
+    timestamp_field = 'returned_at'
+    errors = {
+        OrderStatus.BOOKED: "Order not yet accepted",
+        OrderStatus.RETURNED: "Order already returned",
+        OrderStatus.CANCELLED: "Order was cancelled",
+    }
+
+    def after_transition(self, order_ids, book_counts, now):
+        restock(book_counts)
+        waitlist.allocate(book_counts, now)
+        stats.record_loans_ended(book_counts)
+        rollups.record_returns([self.orders[order_id][1:] for order_id in order_ids], now)
+        charged = penalties.apply_return_penalties(order_ids, now)
+        self.extra = {order_id: {'penalty': str(penalty)} for order_id, penalty in charged.items()}
+
+    @swagger_auto_schema(
+        operation_description="Return many orders at once (Admin and Operator only)",
+        request_body=OrderBatchSerializer,
+        responses={200: 'Per-order results', 400: 'Bad Request'},
+        security=[{'Bearer': []}],
+    )
+    def post(self, request):
+        return super().post(request)
+
+def parse_report_range(params, default_days=30):
+    """Read inclusive ``from``/``to`` local dates, defaulting to the last ``default_days`` days."""
+    end = parse_date(params['to']) if params.get('to') else timezone.localdate()
+    start = parse_date(params['from']) if params.get('from') else end - timedelta(days=default_days - 1)
+    if start is None or end is None or start > end:
+        raise ValueError
+    return start, end
+
+
+class CirculationReportView(APIView):
+    permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]
+
+    @swagger_auto_schema(
+        operation_description="Daily orders, pickups, returns and cancellations from the rollups (Admin and Operator only)",
+        manual_parameters=[
+            openapi.Parameter('from', openapi.IN_QUERY, description='First day (YYYY-MM-DD, default 30 days ago)', type=openapi.TYPE_STRING),
+            openapi.Parameter('to', openapi.IN_QUERY, description='Last day (YYYY-MM-DD, default today)', type=openapi.TYPE_STRING),
+        ],
+        responses={200: 'Daily totals', 400: 'Bad Request'},
+        security=[{'Bearer': []}],
+    )
+    def get(self, request):
+        try:
+            start, end = parse_report_range(request.query_params)
+        except ValueError:
+            return Response({"detail": "Invalid date range"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"from": start, "to": end, "days": rollups.daily_totals(start, end)})
+
+class TopBooksReportView(APIView):
+    permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.ADMIN, UserRole.OPERATOR])]
+    metrics = ['orders', 'pickups', 'returns', 'cancellations', 'loan_seconds']
+
+    @swagger_auto_schema(
+        operation_description="Books ranked by a circulation metric with utilization, from the rollups (Admin and Operator only)",
+        manual_parameters=[
+            openapi.Parameter('from', openapi.IN_QUERY, description='First day (YYYY-MM-DD, default 30 days ago)', type=openapi.TYPE_STRING),
+            openapi.Parameter('to', openapi.IN_QUERY, description='Last day (YYYY-MM-DD, default today)', type=openapi.TYPE_STRING),
+            openapi.Parameter('metric', openapi.IN_QUERY, description='Ranking metric', type=openapi.TYPE_STRING, enum=metrics, default='pickups'),
+            openapi.Parameter('limit', openapi.IN_QUERY, description='Number of books (max 100)', type=openapi.TYPE_INTEGER, default=10),
+        ],
+        responses={200: 'Ranked books', 400: 'Bad Request'},
+        security=[{'Bearer': []}],
+    )
+    def get(self, request):
+        try:
+            start, end = parse_report_range(request.query_params)
+        except ValueError:
+            return Response({"detail": "Invalid date range"}, status=status.HTTP_400_BAD_REQUEST)
+
+        metric = request.query_params.get('metric', 'pickups')
+        if metric not in self.metrics:
+            return Response({"detail": "Invalid metric"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            return Response({"detail": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"from": start, "to": end, "metric": metric, "books": rollups.top_books(start, end, metric, limit)})
+
 class OrderRateView(APIView):
     permission_classes = [RoleBasedPermission(allowed_roles=[UserRole.USER])]  
 
@@ -265,7 +726,7 @@ class OrderRateView(APIView):
     )
     def post(self, request, order_id):
         try:
-            order = Order.objects.get(id=order_id, user=request.user)
+            order = Order.objects.get(id=order_id, user_id=request.user.id)
         except Order.DoesNotExist:
             return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -276,6 +737,53 @@ class OrderRateView(APIView):
         if not isinstance(rating, int) or rating < 0 or rating > 5:
             return Response({"detail": "Rating must be between 0 and 5"}, status=status.HTTP_400_BAD_REQUEST)
 
-        order.rating = rating
-        order.save()
+        with write_transaction():
+            # Compare-and-set on the previous rating so a concurrent re-rate
+            # cannot be counted twice in the book's totals.
+            rated = Order.objects.filter(id=order.id, rating=order.rating).update(rating=rating)
+            if not rated:
+                return Response({"detail": "Order was rated concurrently, please retry"}, status=status.HTTP_409_CONFLICT)
+            stats.record_rating(order.book_id, rating, previous=order.rating)
         return Response({"detail": "Rating submitted"})
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. A plain Django view so a scrape skips DRF
+    authentication and content negotiation. Set METRICS_TOKEN to require
+    ``Authorization: Bearer <token>``.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+def schema_json_view(request):
+    """
+    Serve the prebuilt OpenAPI document gzipped, with an ETag of the code
+    version so pollers get 304s until a deploy changes the API.
+    """
+    artifact = schema.get_artifact()
+    if catalog_cache.etag_matches(artifact.etag, request):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = HttpResponse(artifact.gzipped, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(artifact.body, content_type='application/json')
+    response['ETag'] = artifact.etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def serve_prebuilt_spec(ui_view):
+    """Answer the docs pages' ``?format=openapi`` with the prebuilt schema instead of regenerating it."""
+    def view(request, *args, **kwargs):
+        if request.GET.get('format') == 'openapi':
+            return schema_json_view(request)
+        return ui_view(request, *args, **kwargs)
+    return view
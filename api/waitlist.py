@@ -0,0 +1,77 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from . import rollups
+from .models import Order, OrderStatus, WaitlistEntry
+from .stock import unstock
+
+
+def join(user_id, book_id):
+    """Queue ``user_id`` for ``book_id``; joining twice keeps the original place. Returns the entry."""
+    try:
+        with transaction.atomic():
+            return WaitlistEntry.objects.create(user_id=user_id, book_id=book_id)
+    except IntegrityError:
+        return WaitlistEntry.objects.get(user_id=user_id, book_id=book_id)
+
+
+def with_positions(entries):
+    """Annotate each entry with its 1-based place in its book's queue, in the same query."""
+    ahead = (
+        WaitlistEntry.objects.filter(book_id=OuterRef('book_id'), id__lte=OuterRef('id'))
+        .values('book_id')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return entries.annotate(position=Subquery(ahead))
+
+
+def allocate(book_counts, now=None):
+    """
+    Hand copies that were just put back in stock (``{book_id: copies}``) to
+    the longest-waiting users as BOOKED orders, and take them out of stock
+    again. Call it in the transaction that restocked the copies, after the
+    restock: on databases with row locks, that UPDATE is what makes a
+    concurrent :func:`join` either see the copy or be seen here.
+
+    Each book's queue is read with one seek on ``(book, id)``, and only books
+    that have waiters are read at all. Waiters who already hold a booked or
+    taken copy of the book are dropped from its queue first. Returns the
+    created orders.
+    """
+    if not book_counts:
+        return []
+    waited = list(
+        WaitlistEntry.objects.filter(book_id__in=book_counts).values_list('book_id', flat=True).distinct()
+    )
+    if not waited:
+        return []
+
+    holding = Order.objects.filter(
+        user_id=OuterRef('user_id'), book_id=OuterRef('book_id'), status__in=[OrderStatus.BOOKED, OrderStatus.TAKEN],
+    )
+    WaitlistEntry.objects.filter(Exists(holding), book_id__in=waited).delete()
+
+    entries = []
+    for book_id in waited:
+        entries += (
+            WaitlistEntry.objects.select_for_update()
+            .filter(book_id=book_id)
+            .order_by('id')
+            .values_list('id', 'user_id', 'book_id')[:book_counts[book_id]]
+        )
+    if not entries:
+        return []
+
+    now = now or timezone.now()
+    orders = Order.objects.bulk_create(
+        Order(user_id=user_id, book_id=book_id, order_date=now) for _, user_id, book_id in entries
+    )
+    WaitlistEntry.objects.filter(id__in=[entry_id for entry_id, _, _ in entries]).delete()
+    allocated = Counter(book_id for _, _, book_id in entries)
+    unstock(allocated)
+    rollups.record_counts('orders', allocated, now)
+    return orders
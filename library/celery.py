@@ -1,8 +1,15 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library.settings')
 
 app = Celery('library')
 app.config_from_object('django.conf:settings', namespace='CELERY')
+app.conf.beat_schedule = {
+    'compute-order-penalties': {
+        'task': 'api.tasks.compute_order_penalties',
+        'schedule': crontab(hour=2, minute=0),
+    },
+}
 app.autodiscover_tasks()
\ No newline at end of file
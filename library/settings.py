@@ -1,6 +1,8 @@
+import os
 from pathlib import Path
 from datetime import timedelta
 
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'your_super_secret_key_change_this'
@@ -22,7 +24,15 @@ INSTALLED_APPS = [
     'drf_yasg',
 ]
 
+# Processes start lean: the OpenAPI schema generator, Celery, numpy and the
+# password hashing libraries are imported on first use. STARTUP_PRELOAD=1
+# imports them at boot instead, for servers that fork workers from a
+# preloaded master (gunicorn --preload).
+STARTUP_PRELOAD = os.environ.get('STARTUP_PRELOAD') == '1'
+
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,12 +62,102 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'library.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'library.sqlite3',
+# The production profile applies WAL and the other pragmas in
+# api.backends.sqlite3 on every new connection and keeps connections open
+# between requests. SQLITE_PROFILE=stock selects Django's defaults, which
+# bench_sqlite uses as its baseline.
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'production')
+
+if SQLITE_PROFILE == 'stock':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'library.sqlite3',
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'api.backends.sqlite3',
+            'NAME': BASE_DIR / 'library.sqlite3',
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds the driver waits for a lock; matches busy_timeout.
+                'timeout': 5,
+            },
+        }
+    }
+
+# Read replicas: REPLICA_DATABASES is a comma-separated list of SQLite files
+# kept in sync with the primary (see sync_replicas). Read-only requests read
+# from a replica; a user who writes stays on the primary for
+# REPLICA_PIN_SECONDS so they see their own changes. Tests mirror replicas
+# onto the test database.
+DATABASE_REPLICAS = []
+for number, path in enumerate(filter(None, os.environ.get('REPLICA_DATABASES', '').split(',')), start=1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': path.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_CACHE_ALIAS = 'default'
+
+# Local memory by default (tests, development); set REDIS_CACHE_URL to share
+# the cache between workers in production.
+REDIS_CACHE_URL = os.environ.get('REDIS_CACHE_URL')
+
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 600
+
+# Celery task metrics live in a shared cache so /metrics sees every worker.
+# Set METRICS_TOKEN to require a bearer token on the scrape endpoint.
+METRICS_TASK_CACHE_ALIAS = 'default'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Book availability events for the async stream and long-poll endpoints. The
+# in-memory broker only reaches subscribers in the publishing process; set
+# BOOK_EVENTS_REDIS_URL to fan out across ASGI workers and Celery.
+BOOK_EVENTS_REDIS_URL = os.environ.get('BOOK_EVENTS_REDIS_URL')
+if BOOK_EVENTS_REDIS_URL:
+    BOOK_EVENTS = {'BACKEND': 'api.events.RedisBroker', 'LOCATION': BOOK_EVENTS_REDIS_URL}
+else:
+    BOOK_EVENTS = {'BACKEND': 'api.events.InMemoryBroker'}
+BOOK_EVENTS_HEARTBEAT = 15
+BOOK_EVENTS_MAX_AGE = 300
+
+# New passwords use the first hasher; the others are kept so older hashes
+# still verify and get upgraded on the next successful login.
+PASSWORD_HASHERS = [
+    'api.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_BCRYPT_ROUNDS = int(os.environ.get('PASSWORD_BCRYPT_ROUNDS', 12))
+
+# Logins and registrations beyond workers + queue size get a fast 503.
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASHING_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASHING_QUEUE_SIZE', 4 * PASSWORD_HASHING_WORKERS))
+
+# Same as ModelBackend, with password checks run on the hashing pool.
+AUTHENTICATION_BACKENDS = ['api.hashing.PooledModelBackend']
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -68,7 +168,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.RoleJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
 
     ),
@@ -82,6 +182,7 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_REFRESH_SERIALIZER': 'api.authentication.RoleTokenRefreshSerializer',
 }
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
@@ -89,6 +190,11 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_TIMEZONE = 'Asia/Tashkent'
 CELERY_ENABLE_UTC = True
 
+# The beat schedule is set in library/celery.py, so web processes never import Celery.
+
+ORDER_RESERVATION_TTL = timedelta(days=1)
+ORDER_LOAN_PERIOD = timedelta(days=14)
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'Asia/Tashkent'
 USE_I18N = True
@@ -109,4 +215,15 @@ SWAGGER_SETTINGS = {
         },
     },
     'USE_SESSION_AUTH': False,
+    'SPEC_URL': 'schema-json',
+}
+
+REDOC_SETTINGS = {
+    'SPEC_URL': 'schema-json',
 }
+
+# The OpenAPI document is built once per code version (generate_schema at
+# deploy, or on the first request) and served from this directory. Set
+# OPENAPI_CODE_VERSION to the release id to skip hashing the source.
+OPENAPI_SCHEMA_DIR = os.environ.get('OPENAPI_SCHEMA_DIR', BASE_DIR / 'var' / 'openapi')
+OPENAPI_CODE_VERSION = os.environ.get('OPENAPI_CODE_VERSION')
@@ -1,5 +1,8 @@
 from django.urls import path, include
 
+from api.views import metrics_view
+
 urlpatterns = [
     path('api/v1/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file